@@ -7,8 +7,11 @@ import asyncio
 import base64
 import json
 import os
+import time
+import uuid
+from collections import deque
 from pathlib import Path
-from typing import Optional, List, Union
+from typing import TYPE_CHECKING, Optional, List, Union
 from datetime import datetime
 
 from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, HTTPException
@@ -18,9 +21,26 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 # Import router workflow and hooks
-from router import run_workflow_async, WorkflowInput, RouterContext, RunHooks
-from agents.run import RunContextWrapper
-from agents import Agent
+from router import (
+    CancellationToken, RouterContext, RouterHooks, WorkflowCancelled, WorkflowInput, agent_registry,
+    get_lead_index, preprocess_stats, run_workflow_async, speculation_stats, tenant_registry,
+)
+from job_queue import Job, JobQueue, JobWorkerPool
+from config_store import UnknownTenant
+from latency import latency_tracker
+from log_pipeline import configure_logging, logger
+from reverse_match import REVERSE_MATCH_ENABLED, ShortlistStore, VacancyWatcher, run_reverse_match
+from mail_ingest import MAILBOX_TENANT, MAILBOX_URL, MailboxIngestor, open_source
+from run_store import RunStore, parse_time
+from scheduler import RateLimitExhausted, outbound_scheduler
+from shared_store import EventFanout, SharedStore, hash_payload
+
+# El SDK de agentes se carga en segundo plano tras el arranque (ver warm_up_agents)
+if TYPE_CHECKING:
+    from agents import Agent
+    from agents.run import RunContextWrapper
+
+configure_logging()
 
 app = FastAPI(title="Intelligent Enterprise Agentic Router")
 
@@ -46,11 +66,183 @@ if src_path.exists():
 # Data directory
 DATA_DIR = Path(__file__).parent / "data"
 
+# Job queue configuration
+JOB_DB_PATH = Path(os.getenv("ROUTER_JOB_DB", Path(__file__).parent / "var" / "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("ROUTER_JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("ROUTER_JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("ROUTER_JOB_LEASE_SECONDS", "300"))
+
+# Shared store (result cache + cross-worker events) for multi-process serving
+SHARED_DB_PATH = Path(os.getenv("ROUTER_SHARED_DB", Path(__file__).parent / "var" / "shared.sqlite3"))
+RESULT_CACHE_TTL = float(os.getenv("ROUTER_RESULT_CACHE_TTL", "86400"))
+
+# Run store: every run (route, intent, per-agent I/O, timings, tokens), batched writes
+RUN_DB_PATH = Path(os.getenv("ROUTER_RUN_DB", Path(__file__).parent / "var" / "runs.sqlite3"))
+RUN_STORE_CAPTURE_IO = os.getenv("ROUTER_RUN_STORE_IO", "1") != "0"
+
+# WebSocket outgoing queues: size per connection and overflow policy
+# (coalesce | drop_thinking | disconnect)
+WS_QUEUE_SIZE = int(os.getenv("ROUTER_WS_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("ROUTER_WS_OVERFLOW", "drop_thinking")
+WS_SEND_TIMEOUT = float(os.getenv("ROUTER_WS_SEND_TIMEOUT", "10"))
+
+# Maximum workflows running at once on a single WebSocket (extra runs wait)
+WS_MAX_CONCURRENT_RUNS = int(os.getenv("ROUTER_WS_MAX_RUNS", "4"))
+
+# Events that are never dropped on overflow (and always delivered, whatever the subscription)
+CRITICAL_EVENT_TYPES = {"result", "error", "job_update", "status", "cancelled"}
+
+# Character limit for prompts/outputs carried by agent_* events
+WS_EVENT_MAX_CHARS = int(os.getenv("ROUTER_WS_EVENT_MAX_CHARS", "2000"))
+
 
 class WorkflowRequest(BaseModel):
     """Request model for workflow execution"""
     text: Optional[str] = None
     file_path: Optional[str] = None
+    async_job: bool = False
+    tenant_id: Optional[str] = None  # Filial (config/tenants/<id>.json); None = tenant por defecto
+
+
+def build_workflow_input(text: Optional[str] = None, file_path: Optional[str] = None) -> WorkflowInput:
+    """
+    Build a WorkflowInput from raw text or a path relative to the project root.
+
+    Raises:
+        FileNotFoundError: if file_path does not exist
+        ValueError: if neither text nor file_path is provided
+    """
+    if text:
+        return WorkflowInput(input_as_text=text)
+
+    if file_path:
+        path = Path(__file__).parent / file_path
+        if not path.exists():
+            raise FileNotFoundError("File not found")
+
+        # Read file and determine type
+        if path.suffix.lower() in ['.pdf']:
+            # For PDF, encode as base64
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+                pdf_b64 = base64.b64encode(pdf_bytes).decode('utf-8')
+
+            return WorkflowInput(
+                input_messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "input_file",
+                                "file_data": f"data:application/pdf;base64,{pdf_b64}",
+                                "filename": path.name
+                            }
+                        ]
+                    },
+                    {
+                        "role": "user",
+                        "content": "Proceso este documento y analízalo"
+                    }
+                ]
+            )
+
+        # For text files
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        return WorkflowInput(input_as_text=content)
+
+    raise ValueError("Either text or file_path must be provided")
+
+
+class ClientConnection:
+    """
+    Outgoing side of one WebSocket: a bounded queue drained by its own writer task,
+    so a slow client only delays itself.
+    """
+    
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager",
+                 max_queue: int = WS_QUEUE_SIZE, overflow: str = WS_OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.manager = manager
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.queue: deque = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+        self.event_types: Optional[set] = None  # None = all events (no subscription sent)
+        self.writer = asyncio.create_task(self._writer())
+    
+    def _evict(self, message: dict) -> bool:
+        """Make room for message according to the overflow policy. False = drop it."""
+        message_type = message.get("type")
+        
+        if self.overflow == "coalesce" and message_type not in CRITICAL_EVENT_TYPES:
+            # Replace the last queued event of the same kind for the same agent and run
+            for i in range(len(self.queue) - 1, -1, -1):
+                queued = self.queue[i]
+                if (queued.get("type") == message_type and queued.get("agent") == message.get("agent")
+                        and queued.get("run_id") == message.get("run_id")):
+                    del self.queue[i]
+                    self.dropped += 1
+                    return True
+        
+        if self.overflow in ("coalesce", "drop_thinking"):
+            if message_type == "agent_thinking":
+                self.dropped += 1
+                return False
+            for wanted in ("agent_thinking", None):
+                for i, queued in enumerate(self.queue):
+                    queued_type = queued.get("type")
+                    if queued_type == wanted or (wanted is None and queued_type not in CRITICAL_EVENT_TYPES):
+                        del self.queue[i]
+                        self.dropped += 1
+                        return True
+            # Only critical events queued: drop a non-critical newcomer; a critical
+            # one can't fit without unbounded growth, so treat it as a slow consumer
+            if message_type not in CRITICAL_EVENT_TYPES:
+                self.dropped += 1
+                return False
+        
+        # "disconnect": slow consumer, close it
+        self.dropped += 1
+        asyncio.create_task(self._close_socket())
+        self.manager.disconnect(self.websocket)
+        return False
+    
+    def enqueue(self, message: dict) -> None:
+        if self.closed:
+            return
+        if len(self.queue) >= self.max_queue and not self._evict(message):
+            return
+        self.queue.append(message)
+        self.ready.set()
+    
+    async def _writer(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    message = self.queue.popleft()
+                    await asyncio.wait_for(self.websocket.send_json(message), timeout=WS_SEND_TIMEOUT)
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Error sending message: %s", e, extra={"event": "ws_send_error"})
+            self.manager.disconnect(self.websocket)
+    
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if not self.writer.done():
+            self.writer.cancel()
+    
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
 
 
 class ConnectionManager:
@@ -58,137 +250,249 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: list[WebSocket] = []
+        self.clients: dict[WebSocket, ClientConnection] = {}
+        self.job_subscribers: dict[str, list[WebSocket]] = {}
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        self.clients[websocket] = ClientConnection(websocket, self)
     
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            client.close()
+        for job_id in list(self.job_subscribers):
+            subscribers = self.job_subscribers[job_id]
+            if websocket in subscribers:
+                subscribers.remove(websocket)
+            if not subscribers:
+                del self.job_subscribers[job_id]
+    
+    def subscribe_events(self, websocket: WebSocket, event_types: Optional[list]):
+        """Restrict the optional agent events a socket receives (None = everything)"""
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.event_types = set(event_types) if event_types is not None else None
+    
+    def wants(self, websocket: WebSocket, event_type: str) -> bool:
+        """Whether anyone on this socket will read events of this type"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        return client.event_types is None or event_type in client.event_types or event_type in CRITICAL_EVENT_TYPES
+    
+    def subscribe_job(self, job_id: str, websocket: WebSocket):
+        subscribers = self.job_subscribers.setdefault(job_id, [])
+        if websocket not in subscribers:
+            subscribers.append(websocket)
+    
+    async def notify_job(self, job: dict):
+        """Push a job status change to the local sockets subscribed to it"""
+        message = {
+            "type": "job_update",
+            "job": job,
+            "timestamp": datetime.now().isoformat()
+        }
+        for websocket in list(self.job_subscribers.get(job["job_id"], [])):
+            await self.send_message(message, websocket)
+        if job["status"] in ("done", "failed", "cancelled"):
+            self.job_subscribers.pop(job["job_id"], None)
     
     async def send_message(self, message: dict, websocket: WebSocket):
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            print(f"Error sending message: {e}")
+        """Queue a message for one socket; never blocks on the network"""
+        client = self.clients.get(websocket)
+        if client is not None and self.wants(websocket, message.get("type")):
+            client.enqueue(message)
     
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+        """Fan out to every socket at once; each writer task sends independently"""
+        for client in list(self.clients.values()):
+            client.enqueue(message)
+    
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.clients),
+            "queued": sum(len(c.queue) for c in self.clients.values()),
+            "dropped": sum(c.dropped for c in self.clients.values()),
+            "overflow_policy": WS_OVERFLOW_POLICY,
+        }
 
 
-class WebSocketRunHooks(RunHooks[RouterContext]):
+class BoundedText:
+    """Accumulates text parts up to a character limit; the rest is only counted, never copied."""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.parts: list[str] = []
+        self.size = 0
+        self.omitted = 0
+    
+    @property
+    def full(self) -> bool:
+        return self.size >= self.limit
+    
+    def add(self, text: str) -> None:
+        if not text:
+            return
+        room = self.limit - self.size
+        if room <= 0:
+            self.omitted += len(text)
+            return
+        if len(text) > room:
+            self.parts.append(text[:room])
+            self.omitted += len(text) - room
+            self.size = self.limit
+        else:
+            self.parts.append(text)
+            self.size += len(text)
+    
+    def render(self) -> str:
+        text = "\n".join(self.parts).strip()
+        if self.omitted:
+            text += f"\n... [{self.omitted} chars omitted]"
+        return text
+
+
+class WebSocketRunHooks(RouterHooks):
     """Custom hooks to send real-time updates via WebSocket"""
     
-    def __init__(self, websocket: WebSocket, manager: ConnectionManager):
+    def __init__(self, websocket: WebSocket, manager: ConnectionManager, run_id: Optional[str] = None):
         self.websocket = websocket
         self.manager = manager
+        self.run_id = run_id  # Tags every event when several runs share the socket
         self.step = 0
-        self.max_chars = 2000  # Limit for input/output display
+        self.max_chars = WS_EVENT_MAX_CHARS  # Limit for input/output display
+    
+    async def _send(self, message: dict) -> None:
+        if self.run_id is not None:
+            message["run_id"] = self.run_id
+        await self.manager.send_message(message, self.websocket)
     
-    def _truncate(self, text: str) -> str:
-        """Truncate long text for display"""
-        if text is None:
-            return ""
-        if len(text) <= self.max_chars:
-            return text
-        return text[:self.max_chars] + f"\n... [{len(text) - self.max_chars} chars omitted]"
+    def _clip(self, value):
+        """Truncate long strings inside a serialized output (e.g. extracted CV text)"""
+        if isinstance(value, str):
+            if len(value) <= self.max_chars:
+                return value
+            return value[:self.max_chars] + f"\n... [{len(value) - self.max_chars} chars omitted]"
+        if isinstance(value, dict):
+            return {k: self._clip(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._clip(v) for v in value]
+        return value
     
     def _serialize_output(self, output) -> dict:
         """Serialize agent output to dict"""
         try:
             if hasattr(output, 'model_dump'):
-                return output.model_dump()
+                return self._clip(output.model_dump())
             elif isinstance(output, dict):
-                return output
+                return self._clip(output)
             elif hasattr(output, '__dict__'):
-                return output.__dict__
+                return self._clip(dict(output.__dict__))
             else:
-                return {"value": str(output)}
+                return {"value": self._clip(str(output))}
         except:
-            return {"value": str(output)}
+            return {"value": self._clip(str(output))}
     
-    async def on_agent_start(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext]) -> None:
+    async def on_agent_start(self, context: "RunContextWrapper[RouterContext]", agent: "Agent[RouterContext]") -> None:
         self.step += 1
-        await self.manager.send_message({
+        if not self.manager.wants(self.websocket, "agent_start"):
+            return
+        await self._send({
             "type": "agent_start",
             "agent": agent.name,
             "step": self.step,
             "timestamp": datetime.now().isoformat()
-        }, self.websocket)
+        })
     
     async def on_llm_start(
         self,
-        context: RunContextWrapper[RouterContext],
-        agent: Agent[RouterContext],
+        context: "RunContextWrapper[RouterContext]",
+        agent: "Agent[RouterContext]",
         system_prompt: Optional[str],
         input_items: list,
     ) -> None:
         """Capture LLM input before processing"""
-        # Extract user content from input items
-        input_text = ""
+        if not self.manager.wants(self.websocket, "agent_input"):
+            return
+        
+        # Extract user content from input items, truncating as we go
+        input_text = BoundedText(self.max_chars)
         for item in input_items:
+            if input_text.full:
+                break
             if isinstance(item, dict):
                 if item.get("role") == "user":
                     content = item.get("content", "")
                     if isinstance(content, str):
-                        input_text += content + "\n"
+                        input_text.add(content)
                     elif isinstance(content, list):
                         for c in content:
-                            if isinstance(c, dict) and c.get("type") == "text":
-                                input_text += c.get("text", "") + "\n"
-            elif hasattr(item, 'content'):
-                input_text += str(item.content) + "\n"
+                            if not isinstance(c, dict):
+                                continue
+                            part_type = c.get("type")
+                            if part_type in ("text", "input_text"):
+                                input_text.add(c.get("text", ""))
+                            elif part_type == "input_file":
+                                # Base64 data is never copied, only referenced by name
+                                input_text.add(f"[file: {c.get('filename', 'file')}]")
+                            elif part_type == "input_image":
+                                input_text.add("[image]")
+            elif isinstance(getattr(item, "content", None), str):
+                input_text.add(item.content)
         
-        await self.manager.send_message({
+        await self._send({
             "type": "agent_input",
             "agent": agent.name,
-            "input": self._truncate(input_text.strip()),
+            "input": input_text.render(),
             "timestamp": datetime.now().isoformat()
-        }, self.websocket)
+        })
     
     async def on_llm_end(
         self,
-        context: RunContextWrapper[RouterContext],
-        agent: Agent[RouterContext],
+        context: "RunContextWrapper[RouterContext]",
+        agent: "Agent[RouterContext]",
         response,
     ) -> None:
         """Capture reasoning and response from LLM"""
-        reasoning_text = ""
-        response_text = ""
+        if not self.manager.wants(self.websocket, "agent_thinking"):
+            return
         
-        # Extract reasoning if available
-        if hasattr(response, 'reasoning') and response.reasoning:
-            reasoning_text = str(response.reasoning)
+        reasoning_text = BoundedText(self.max_chars)
+        response_text = BoundedText(self.max_chars)
         
-        # Extract response content
-        if hasattr(response, 'content'):
-            response_text = str(response.content)
-        elif hasattr(response, 'text'):
-            response_text = str(response.text)
-        else:
-            response_text = str(response)
+        # Walk the response output items instead of str() on the whole response
+        for item in getattr(response, "output", None) or []:
+            item_type = getattr(item, "type", None)
+            if item_type == "reasoning":
+                for part in getattr(item, "summary", None) or []:
+                    reasoning_text.add(getattr(part, "text", ""))
+            elif item_type == "message":
+                for part in getattr(item, "content", None) or []:
+                    response_text.add(getattr(part, "text", None) or getattr(part, "refusal", None) or "")
         
-        await self.manager.send_message({
+        await self._send({
             "type": "agent_thinking",
             "agent": agent.name,
-            "reasoning": self._truncate(reasoning_text),
-            "response": self._truncate(response_text),
+            "reasoning": reasoning_text.render(),
+            "response": response_text.render(),
             "timestamp": datetime.now().isoformat()
-        }, self.websocket)
+        })
     
-    async def on_agent_end(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext], output) -> None:
+    async def on_agent_end(self, context: "RunContextWrapper[RouterContext]", agent: "Agent[RouterContext]", output) -> None:
+        if not self.manager.wants(self.websocket, "agent_end"):
+            return
+        
         # Get usage stats
         u = context.usage
         
         # Serialize output
         output_data = self._serialize_output(output)
         
-        await self.manager.send_message({
+        await self._send({
             "type": "agent_end",
             "agent": agent.name,
             "output": output_data,
@@ -199,19 +503,174 @@ class WebSocketRunHooks(RunHooks[RouterContext]):
                 "total_tokens": u.total_tokens
             },
             "timestamp": datetime.now().isoformat()
-        }, self.websocket)
+        })
     
-    async def on_handoff(self, context: RunContextWrapper[RouterContext], from_agent: Agent[RouterContext], to_agent: Agent[RouterContext]) -> None:
-        await self.manager.send_message({
+    async def on_handoff(self, context: "RunContextWrapper[RouterContext]", from_agent: "Agent[RouterContext]", to_agent: "Agent[RouterContext]") -> None:
+        if not self.manager.wants(self.websocket, "handoff"):
+            return
+        await self._send({
             "type": "handoff",
             "from_agent": from_agent.name,
             "to_agent": to_agent.name,
             "timestamp": datetime.now().isoformat()
-        }, self.websocket)
+        })
 
 
 manager = ConnectionManager()
 
+shared_store = SharedStore(SHARED_DB_PATH, cache_ttl=RESULT_CACHE_TTL)
+event_fanout = EventFanout(shared_store)
+event_fanout.subscribe("job", manager.notify_job)
+
+run_store = RunStore(RUN_DB_PATH, capture_io=RUN_STORE_CAPTURE_IO)
+
+# Matching inverso: candidatos ya procesados frente a las vacantes que se abren al recargar el CONFIG
+shortlist_store = ShortlistStore()
+vacancy_watcher = VacancyWatcher(tenant_registry, shortlist_store) if REVERSE_MATCH_ENABLED else None
+
+
+def workflow_cache_key(workflow_input: WorkflowInput, idempotency_key: str, tenant_id: str, config_fingerprint: str) -> str:
+    """Cache key: the request's idempotency key, its exact input and the tenant and configuration it was routed with"""
+    return hash_payload(
+        idempotency_key,
+        workflow_input.input_as_text or "",
+        workflow_input.input_messages or [],
+        tenant_id,
+        config_fingerprint,
+    )
+
+
+async def run_workflow_cached(
+    workflow_input: WorkflowInput,
+    run_id: Optional[str] = None,
+    tenant_id: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    **kwargs,
+) -> dict:
+    """
+    Run the workflow and record it. The shared result cache only serves idempotent
+    re-deliveries of the same request (same `idempotency_key`, e.g. a job retried on
+    another worker after its first attempt finished): the original run already did
+    the side effects (CV index, lead accounts, usage, WebSocket events). A new request
+    with identical content always runs, so none of those are skipped.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    tenant_id = tenant_id or tenant_registry.default_tenant
+    # Instantánea del CONFIG activo del tenant: la clave de caché y la ejecución usan la misma versión
+    snapshot = tenant_registry.current(tenant_id)
+    key = None
+    if idempotency_key is not None:
+        key = workflow_cache_key(workflow_input, idempotency_key, tenant_id, snapshot.fingerprint)
+        cached = await asyncio.to_thread(shared_store.cache_get, key)
+        if cached is not None:
+            run_store.record({
+                "run_id": run_id,
+                "created_at": time.time(),
+                "tenant_id": tenant_id,
+                "input_hash": hash_payload(workflow_input.input_as_text or "", workflow_input.input_messages or []),
+                "status": "cached",
+                "final_route": cached.get("final_route"),
+                "priority": kwargs.get("priority", "interactive"),
+                "config_fingerprint": snapshot.fingerprint,
+                "result": cached,
+            })
+            return cached
+    result = await run_workflow_async(
+        workflow_input, run_store=run_store, run_id=run_id, config=snapshot.data, tenant_id=tenant_id, **kwargs
+    )
+    if key is not None:
+        await asyncio.to_thread(shared_store.cache_set, key, result)
+    return result
+
+
+async def process_job(job: Job) -> dict:
+    """Job handler: run the workflow for a queued request"""
+    workflow_input = build_workflow_input(job.payload.get("text"), job.payload.get("file_path"))
+    cancel_token = CancellationToken(job.cancel_event, reason="job_cancelled")
+    return await run_workflow_cached(
+        workflow_input,
+        run_id=job.job_id,
+        tenant_id=job.payload.get("tenant_id"),
+        idempotency_key=job.job_id,
+        priority=job.payload.get("priority", "batch"),
+        cancel_token=cancel_token,
+    )
+
+
+async def publish_job_update(job: Job):
+    """Fan job updates out to every worker process (subscribers may live elsewhere)"""
+    await event_fanout.publish("job", job.to_dict())
+
+
+async def route_mail(workflow_input: WorkflowInput, run_id: str) -> dict:
+    """Mailbox ingestion: route one message like a batch job (run_id is stable per message, see mail_run_id)"""
+    # Si el proceso cae entre el enrutado y el registro, el reintento reutiliza el resultado
+    return await run_workflow_cached(
+        workflow_input, run_id=run_id, tenant_id=MAILBOX_TENANT, idempotency_key=f"mail:{run_id}", priority="batch"
+    )
+
+
+# Ingesta del buzón (ROUTER_MAILBOX); los workers que lo sondean a la vez se reparten los mensajes
+mail_ingestor = MailboxIngestor(open_source(MAILBOX_URL), route_mail) if MAILBOX_URL else None
+
+
+job_queue = JobQueue(JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS)
+# Los 429 ya se reintentan en el scheduler: un trabajo que los agota no se vuelve a encolar
+job_pool = JobWorkerPool(
+    job_queue, process_job, concurrency=JOB_WORKERS, listeners=[publish_job_update], no_retry=(RateLimitExhausted,)
+)
+
+
+async def enqueue_job(text: Optional[str] = None, file_path: Optional[str] = None, tenant_id: Optional[str] = None) -> str:
+    """Validate and persist a workflow request, returning its job ID"""
+    if not text and not file_path:
+        raise ValueError("Either text or file_path must be provided")
+    if file_path and not (Path(__file__).parent / file_path).exists():
+        raise FileNotFoundError("File not found")
+    tenant_registry.get(tenant_id)  # UnknownTenant antes de encolar
+    job_id = await asyncio.to_thread(job_queue.enqueue, {"text": text, "file_path": file_path, "tenant_id": tenant_id})
+    job_pool.notify()
+    return job_id
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    await event_fanout.start()
+    await job_pool.start()
+
+
+@app.on_event("startup")
+async def start_mail_ingestion():
+    if mail_ingestor is not None:
+        mail_ingestor.start()
+
+
+@app.on_event("startup")
+async def watch_config():
+    """Reload the base and tenant config files when they change (each worker watches on its own)"""
+    tenant_registry.watch()
+
+
+@app.on_event("startup")
+async def warm_up_agents():
+    """Import the agents SDK and build the agents in the background: the worker serves right away"""
+    async def warm_up():
+        try:
+            await asyncio.to_thread(agent_registry.warm_up)
+        except Exception as e:
+            logger.warning("Error warming up agents: %s", e, extra={"event": "warm_up_error"})
+    asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if mail_ingestor is not None:
+        await mail_ingestor.stop()
+    await job_pool.stop()
+    await event_fanout.stop()
+    await asyncio.to_thread(run_store.close)
+    await asyncio.to_thread(tenant_registry.stop)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
@@ -335,52 +794,20 @@ async def upload_file(file: UploadFile = File(...)):
 @app.post("/api/workflow")
 async def execute_workflow(request: WorkflowRequest):
     """Execute workflow without WebSocket (simple REST endpoint)"""
+    if request.async_job:
+        return await submit_job(request)
+    
     try:
-        workflow_input = None
-        
-        if request.text:
-            workflow_input = WorkflowInput(input_as_text=request.text)
-        elif request.file_path:
-            file_path = Path(__file__).parent / request.file_path
-            
-            if not file_path.exists():
-                raise HTTPException(status_code=404, detail="File not found")
-            
-            # Read file and determine type
-            if file_path.suffix.lower() in ['.pdf']:
-                # For PDF, encode as base64
-                with open(file_path, "rb") as f:
-                    pdf_bytes = f.read()
-                    pdf_b64 = base64.b64encode(pdf_bytes).decode('utf-8')
-                
-                workflow_input = WorkflowInput(
-                    input_messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "input_file",
-                                    "file_data": f"data:application/pdf;base64,{pdf_b64}",
-                                    "filename": file_path.name
-                                }
-                            ]
-                        },
-                        {
-                            "role": "user",
-                            "content": "Proceso este documento y analízalo"
-                        }
-                    ]
-                )
-            else:
-                # For text files
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                workflow_input = WorkflowInput(input_as_text=content)
-        else:
-            raise HTTPException(status_code=400, detail="Either text or file_path must be provided")
+        try:
+            workflow_input = build_workflow_input(request.text, request.file_path)
+            tenant_registry.get(request.tenant_id)
+        except (FileNotFoundError, UnknownTenant) as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Execute workflow
-        result = await run_workflow_async(workflow_input)
+        result = await run_workflow_cached(workflow_input, tenant_id=request.tenant_id)
         
         return {"success": True, "result": result}
         
@@ -388,105 +815,157 @@ async def execute_workflow(request: WorkflowRequest):
         return {"success": False, "error": str(e)}
 
 
+@app.post("/api/jobs")
+async def submit_job(request: WorkflowRequest):
+    """Queue a workflow request and return its job ID immediately"""
+    try:
+        job_id = await enqueue_job(request.text, request.file_path, request.tenant_id)
+    except (FileNotFoundError, UnknownTenant) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "job_id": job_id, "status": "pending"}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll the status (and result, once done) of a queued job"""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or abort its remaining agents if it is already running"""
+    status = await asyncio.to_thread(job_queue.request_cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status == "cancelled":
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        await publish_job_update(job)
+    return {"success": True, "job_id": job_id, "status": status}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time workflow execution"""
+    """
+    WebSocket endpoint for real-time workflow execution.
+    
+    Several workflows may run at once on the same socket. Each request carries
+    a client-assigned "run_id" (generated if missing) that tags all of its
+    events; {"action": "cancel", "run_id": ...} aborts a run mid-flight.
+    """
     await manager.connect(websocket)
     
+    runs: dict[str, asyncio.Task] = {}
+    run_tokens: dict[str, CancellationToken] = {}
+    run_slots = asyncio.Semaphore(WS_MAX_CONCURRENT_RUNS)
+    
+    async def send(message: dict, run_id: Optional[str] = None):
+        if run_id is not None:
+            message["run_id"] = run_id
+        message["timestamp"] = datetime.now().isoformat()
+        await manager.send_message(message, websocket)
+    
+    async def execute_run(run_id: str, workflow_input: WorkflowInput, cancel_token: CancellationToken, tenant_id: Optional[str]):
+        try:
+            async with run_slots:
+                await send({"type": "status", "message": "🚀 Iniciando workflow..."}, run_id)
+                
+                # Create WebSocket hooks for real-time updates
+                ws_hooks = WebSocketRunHooks(websocket, manager, run_id=run_id)
+                
+                # Execute workflow with WebSocket hooks
+                result = await run_workflow_cached(
+                    workflow_input, run_id=run_id, tenant_id=tenant_id, hooks=ws_hooks, cancel_token=cancel_token
+                )
+                
+                # Send final result
+                await send({"type": "result", "result": result}, run_id)
+        except WorkflowCancelled as e:
+            logger.info("Run %s cancelled (%s): partial usage %s tokens", run_id, e.reason, e.usage["total_tokens"],
+                        extra={"event": "run_cancelled", "run_id": run_id, "total_tokens": e.usage["total_tokens"]})
+            await send({"type": "cancelled", "reason": e.reason, "usage": e.usage}, run_id)
+        except Exception as e:
+            await send({"type": "error", "message": str(e)}, run_id)
+        finally:
+            runs.pop(run_id, None)
+            run_tokens.pop(run_id, None)
+    
     try:
         while True:
             # Receive workflow request
             data = await websocket.receive_json()
             
-            # Send acknowledgment
-            await manager.send_message({
-                "type": "status",
-                "message": "🚀 Iniciando workflow...",
-                "timestamp": datetime.now().isoformat()
-            }, websocket)
+            # Job API over the same socket: submit to the queue or follow a job
+            action = data.get("action")
+            if action in ("submit_job", "subscribe_job"):
+                try:
+                    job_id = data.get("job_id")
+                    if action == "submit_job":
+                        job_id = await enqueue_job(data.get("text"), data.get("file_path"), data.get("tenant_id"))
+                    job = await asyncio.to_thread(job_queue.get, job_id) if job_id else None
+                    if job is None:
+                        raise ValueError("Job not found")
+                    manager.subscribe_job(job_id, websocket)
+                    await send({"type": "job_update", "job": job.to_dict()})
+                except Exception as e:
+                    await send({"type": "error", "message": str(e)})
+                continue
+            
+            if action == "subscribe":
+                # {"action": "subscribe", "events": ["agent_start", "agent_end"]}; null = all events
+                manager.subscribe_events(websocket, data.get("events"))
+                continue
+            
+            run_id = str(data.get("run_id") or uuid.uuid4().hex)
+            
+            if action == "cancel":
+                token = run_tokens.get(run_id)
+                if token is None:
+                    await send({"type": "error", "message": "Run not found"}, run_id)
+                else:
+                    token.cancel("client_cancelled")
+                continue
             
+            if run_id in runs:
+                await send({"type": "error", "message": "run_id already in progress"}, run_id)
+                continue
+            
+            # Prepare workflow input
             try:
-                # Prepare workflow input
-                workflow_input = None
-                
-                if data.get("text"):
-                    workflow_input = WorkflowInput(input_as_text=data["text"])
-                elif data.get("file_path"):
-                    file_path = Path(__file__).parent / data["file_path"]
-                    
-                    if not file_path.exists():
-                        await manager.send_message({
-                            "type": "error",
-                            "message": "File not found",
-                            "timestamp": datetime.now().isoformat()
-                        }, websocket)
-                        continue
-                    
-                    # Read file based on type
-                    if file_path.suffix.lower() in ['.pdf']:
-                        with open(file_path, "rb") as f:
-                            pdf_bytes = f.read()
-                            pdf_b64 = base64.b64encode(pdf_bytes).decode('utf-8')
-                        
-                        workflow_input = WorkflowInput(
-                            input_messages=[
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {
-                                            "type": "input_file",
-                                            "file_data": f"data:application/pdf;base64,{pdf_b64}",
-                                            "filename": file_path.name
-                                        }
-                                    ]
-                                },
-                                {
-                                    "role": "user",
-                                    "content": "Proceso este documento y analízalo"
-                                }
-                            ]
-                        )
-                    else:
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            content = f.read()
-                        workflow_input = WorkflowInput(input_as_text=content)
-                
-                if not workflow_input:
-                    await manager.send_message({
-                        "type": "error",
-                        "message": "No input provided",
-                        "timestamp": datetime.now().isoformat()
-                    }, websocket)
-                    continue
-                
-                # Create WebSocket hooks for real-time updates
-                ws_hooks = WebSocketRunHooks(websocket, manager)
-                
-                try:
-                    # Execute workflow with WebSocket hooks
-                    result = await run_workflow_async(workflow_input, hooks=ws_hooks)
-                    
-                    # Send final result
-                    await manager.send_message({
-                        "type": "result",
-                        "result": result,
-                        "timestamp": datetime.now().isoformat()
-                    }, websocket)
-                    
-                except Exception as workflow_error:
-                    raise workflow_error
-                
-            except Exception as e:
-                await manager.send_message({
-                    "type": "error",
-                    "message": str(e),
-                    "timestamp": datetime.now().isoformat()
-                }, websocket)
+                workflow_input = build_workflow_input(data.get("text"), data.get("file_path"))
+                tenant_registry.get(data.get("tenant_id"))
+            except (FileNotFoundError, UnknownTenant) as e:
+                await send({"type": "error", "message": str(e)}, run_id)
+                continue
+            except ValueError:
+                await send({"type": "error", "message": "No input provided"}, run_id)
+                continue
+            
+            if len(runs) >= WS_MAX_CONCURRENT_RUNS:
+                await send({"type": "status", "message": "⏳ En cola: esperando a otros workflows de esta sesión"}, run_id)
+            
+            run_tokens[run_id] = CancellationToken()
+            runs[run_id] = asyncio.create_task(
+                execute_run(run_id, workflow_input, run_tokens[run_id], data.get("tenant_id")), name=f"ws-run-{run_id}"
+            )
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.warning("WebSocket error: %s", e, extra={"event": "ws_error"})
+    finally:
+        # Nobody will read the results: abort the remaining agents of this connection's runs
+        for token in list(run_tokens.values()):
+            token.cancel("client_disconnected")
+        # Also runs still waiting for a slot or a send: none may outlive the connection
+        tasks = list(runs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         manager.disconnect(websocket)
 
 
@@ -496,6 +975,121 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
 
+@app.get("/api/scheduler")
+async def scheduler_status():
+    """Outbound LLM scheduler state: concurrency window, lanes and 429 counters"""
+    return outbound_scheduler.snapshot()
+
+
+@app.get("/api/connections")
+async def connection_stats():
+    """WebSocket connections, queued events and events dropped on overflow"""
+    return manager.stats()
+
+
+@app.get("/api/agent-latency")
+async def agent_latency():
+    """Per-agent latency percentiles, timeouts and hedging counters"""
+    return latency_tracker.snapshot()
+
+
+@app.get("/api/runs/stats")
+async def run_stats(since: Optional[str] = None, until: Optional[str] = None, tenant: Optional[str] = None):
+    """Aggregated routing stats (ISO dates or epoch seconds; until is exclusive), optionally for one tenant"""
+    try:
+        window = parse_time(since), parse_time(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await asyncio.to_thread(run_store.stats, *window, tenant)
+
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str):
+    """One recorded run with its per-agent steps"""
+    run = await asyncio.to_thread(run_store.get, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@app.get("/api/config")
+async def config_status():
+    """Active CONFIG version of every tenant, reload counters and the last validation errors"""
+    return tenant_registry.snapshot()
+
+
+@app.post("/api/config/reload")
+async def reload_config():
+    """Reload every config file now; 422 if one does not validate (its active version is kept)"""
+    await asyncio.to_thread(tenant_registry.reload, True)
+    status = tenant_registry.snapshot()
+    errors = {tenant: s["last_error"] for tenant, s in status["tenants"].items() if s["last_error"]}
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    return status
+
+
+@app.get("/api/vacancies/{role_id}/shortlist")
+async def vacancy_shortlist(role_id: str, tenant: Optional[str] = None, refresh: bool = False):
+    """Previously processed candidates ranked for a vacancy (reverse match, no LLM); refresh=true recomputes it"""
+    tenant_id = tenant or tenant_registry.default_tenant
+    try:
+        version = tenant_registry.current(tenant_id)
+    except UnknownTenant as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if role_id not in version.vacancies:
+        raise HTTPException(status_code=404, detail="Vacancy not found")
+    config = version.data
+    entry = None if refresh else await asyncio.to_thread(shortlist_store.get, tenant_id, role_id)
+    if entry is None:
+        entries = await asyncio.to_thread(run_reverse_match, tenant_id, config, [role_id], store=shortlist_store)
+        entry = entries[role_id]
+    return entry
+
+
+@app.get("/api/accounts")
+async def search_accounts(q: str, tenant: Optional[str] = None, limit: int = 20):
+    """Sales accounts whose company name or email domain resembles q (leads merged per company)"""
+    tenant_id = tenant or tenant_registry.default_tenant
+    return await asyncio.to_thread(get_lead_index().search, tenant_id, q, limit)
+
+
+@app.get("/api/accounts/{account_id}")
+async def get_account(account_id: str):
+    """One sales account: domains, contacts, lead history and best score"""
+    account = await asyncio.to_thread(get_lead_index().account, account_id)
+    if account is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return account
+
+
+@app.get("/api/speculation")
+async def speculation_status():
+    """Speculative rejection drafts: started, used, wasted and tokens spent on wasted drafts"""
+    return speculation_stats.snapshot()
+
+
+@app.get("/api/mailbox")
+async def mailbox_status():
+    """Mailbox ingestion: checkpoint, messages per status (routed, retry, failed, duplicate, skipped)"""
+    if mail_ingestor is None:
+        raise HTTPException(status_code=404, detail="Mailbox ingestion disabled (ROUTER_MAILBOX)")
+    return await asyncio.to_thread(mail_ingestor.stats)
+
+
+@app.get("/api/preprocessing")
+async def preprocessing_status():
+    """Input preprocessing: tokens of the full safe_text vs tokens sent, per stage (classifier, cv, sales)"""
+    return preprocess_stats.snapshot()
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    
+    # Multi-worker mode: ROUTER_WORKERS=4 python app.py (or gunicorn -c gunicorn_conf.py app:app)
+    workers = int(os.getenv("ROUTER_WORKERS", "1"))
+    if workers > 1:
+        os.environ["ROUTER_PROCESS_COUNT"] = str(workers)
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, log_level="info", workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
@@ -0,0 +1,138 @@
+"""
+Benchmark: ruta CV en modo "split" (cv_extract_agent + cv_match_agent) frente a
+modo "fused" (cv_extract_match_agent, una sola llamada con CVExtractMatchSchema).
+
+Sobre un conjunto de CVs etiquetados (benchmarks/data/cv_labelled.jsonl) mide
+por modo la latencia y los tokens de la etapa extracción+matching, la precisión
+frente a las etiquetas (decisión forward/reject y puesto esperado) y el acuerdo
+entre ambos modos (decisión, mejor puesto y diferencia de match_score).
+
+Realiza llamadas reales al LLM: requiere OPENAI_API_KEY.
+
+Uso:
+    python benchmarks/bench_cv_pipeline.py [--runs 1] [--concurrency 4] [--dataset ruta.jsonl]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import router  # noqa: E402
+from log_pipeline import configure_logging  # noqa: E402
+
+MODES = ("split", "fused")
+
+
+async def run_cv_stage(mode: str, text: str):
+    """Extraction + matching only, as the cv route graph does it; returns (cv, match, seconds, tokens)."""
+    context = router.RouterContext(config=router.CONFIG, priority="batch")
+    run_config = router.RunConfig(workflow_name=f"bench_cv_{mode}")
+    hooks = router.RunHooks()
+    start = time.perf_counter()
+    if mode == "fused":
+        result = await router.run_agent_with_logs(
+            router.cv_extract_match_agent, text, context=context, run_config=run_config, hooks=hooks,
+        )
+        cv, match = result.final_output.cv_extract, result.final_output.cv_match
+    else:
+        cv_result = await router.run_agent_with_logs(
+            router.cv_extract_agent, text, context=context, run_config=run_config, hooks=hooks,
+        )
+        cv = cv_result.final_output
+        match_result = await router.run_agent_with_logs(
+            router.cv_match_agent,
+            f"Candidate data:\n{router.serialize_for_llm(cv)}",
+            context=context, run_config=run_config, hooks=hooks,
+        )
+        match = match_result.final_output
+    elapsed = time.perf_counter() - start
+    return cv, match, elapsed, context.usage_summary()["total_tokens"]
+
+
+def decision(match) -> str:
+    forward = match.vacancies_found and match.matched_roles and match.best_match is not None
+    return "forward" if forward else "reject"
+
+
+def best_role(match):
+    return match.best_match.role_id if match.best_match else None
+
+
+async def run_all(samples, runs: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {mode: {} for mode in MODES}
+
+    async def one(mode, sample, run):
+        async with semaphore:
+            try:
+                _, match, elapsed, tokens = await run_cv_stage(mode, sample["text"])
+            except Exception as e:
+                print(f"  [{mode}] {sample['id']} run {run}: error {e}")
+                return
+        results[mode].setdefault(sample["id"], []).append((match, elapsed, tokens))
+
+    await asyncio.gather(*(
+        one(mode, sample, run) for run in range(runs) for sample in samples for mode in MODES
+    ))
+    return results
+
+
+def report(samples, results):
+    labels = {s["id"]: s for s in samples}
+    print(f"{'mode':<7} {'n':>3} {'p50 s':>7} {'p95 s':>7} {'tokens':>8} {'decision acc':>13} {'role acc':>9}")
+    for mode in MODES:
+        rows = [(sid, r) for sid, runs in results[mode].items() for r in runs]
+        if not rows:
+            print(f"{mode:<7} sin resultados")
+            continue
+        latencies = sorted(r[1] for _, r in rows)
+        tokens = statistics.mean(r[2] for _, r in rows)
+        decision_ok = sum(decision(r[0]) == labels[sid]["expected_decision"] for sid, r in rows)
+        role_ok = sum(best_role(r[0]) == labels[sid]["expected_role"] for sid, r in rows)
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        print(
+            f"{mode:<7} {len(rows):>3} {statistics.median(latencies):>7.2f} {p95:>7.2f} {tokens:>8.0f} "
+            f"{decision_ok / len(rows):>13.0%} {role_ok / len(rows):>9.0%}"
+        )
+
+    # Acuerdo entre modos (primera ejecución de cada CV)
+    common = [sid for sid in results["split"] if sid in results["fused"]]
+    if not common:
+        return
+    same_decision = same_role = 0
+    score_diffs = []
+    for sid in common:
+        split_match, fused_match = results["split"][sid][0][0], results["fused"][sid][0][0]
+        same_decision += decision(split_match) == decision(fused_match)
+        same_role += best_role(split_match) == best_role(fused_match)
+        if split_match.best_match and fused_match.best_match and best_role(split_match) == best_role(fused_match):
+            score_diffs.append(abs(split_match.best_match.match_score - fused_match.best_match.match_score))
+    print(f"\nAcuerdo split/fused sobre {len(common)} CVs: decisión {same_decision / len(common):.0%}, "
+          f"mejor puesto {same_role / len(common):.0%}"
+          + (f", |Δ match_score| medio {statistics.mean(score_diffs):.1f}" if score_diffs else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1, help="Repeticiones por CV y modo")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dataset", default=str(ROOT / "benchmarks" / "data" / "cv_labelled.jsonl"))
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+    samples = [json.loads(line) for line in Path(args.dataset).read_text(encoding="utf-8").splitlines() if line.strip()]
+    print(f"CVs: {len(samples)} | runs: {args.runs} | concurrencia: {args.concurrency}\n")
+
+    results = asyncio.run(run_all(samples, args.runs, args.concurrency))
+    report(samples, results)
+
+
+if __name__ == "__main__":
+    main()
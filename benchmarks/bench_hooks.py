@@ -0,0 +1,163 @@
+"""
+Benchmark: coste de hooks y logging por ejecución del workflow.
+
+Compara la implementación anterior (print síncrono de prompts de hasta 8000
+caracteres y json.dumps(indent=2) de cada input/output) con el pipeline de
+logging con cola acotada y serialización perezosa (log_pipeline.py).
+
+No realiza llamadas al LLM: simula los eventos de hooks de una ejecución de la
+rama CV (7 agentes) con prompts reales y el texto de data/workflowexample.txt.
+
+Uso:
+    python benchmarks/bench_hooks.py [--runs 200] [--level INFO]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import router  # noqa: E402
+from log_pipeline import configure_logging, shutdown_logging  # noqa: E402
+
+
+CV_ROUTE = [
+    ("guardrails_agent", router.get_guardrails_instructions),
+    ("intent_agent", router.get_intent_instructions),
+    ("owner_map_agent", router.get_owner_map_instructions),
+    ("cv_extract_agent", router.get_cv_extract_instructions),
+    ("cv_match_agent", router.get_cv_match_instructions),
+    ("draft_hr_forward_agent", router.get_draft_hr_forward_instructions),
+    ("hr_forward_packager", None),
+]
+
+
+class LegacyTerminalRunHooks:
+    """Copia del comportamiento anterior de TerminalRunHooks (print en el hot path)."""
+
+    def __init__(self, max_chars: int = 8000):
+        self.step = 0
+        self.max_chars = max_chars
+
+    def _short(self, text):
+        if len(text) <= self.max_chars:
+            return text
+        return text[: self.max_chars] + f"\n...[{len(text)-self.max_chars} chars truncados]..."
+
+    async def on_agent_start(self, context, agent):
+        self.step += 1
+        print(f"\n{'=' * 20} [{self.step}] START Agent: {agent.name} {'=' * 20}")
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        print(f"[LLM] {agent.name} → preparando llamada")
+        if system_prompt:
+            print("• system_prompt:")
+            print(self._short(system_prompt))
+        if input_items:
+            print("• input_items:")
+            print(self._short("\n".join(str(it) for it in input_items)))
+
+    async def on_llm_end(self, context, agent, response):
+        print(f"[LLM] {agent.name} ← respuesta recibida")
+
+    async def on_agent_end(self, context, agent, output):
+        u = context.usage
+        print(f"[USAGE] {agent.name} → requests={u.requests} input_tokens={u.input_tokens} output_tokens={u.output_tokens} total_tokens={u.total_tokens}")
+        print(f"\n{'=' * 20} END Agent: {agent.name} {'=' * 20}")
+
+
+def legacy_log_input(agent, inp):
+    print(f"\n>>> INPUT → {agent.name}:\n{inp}")
+
+
+def legacy_log_output(agent, out):
+    print(f"\n<<< OUTPUT ← {agent.name}:\n{json.dumps(out.model_dump(by_alias=True), ensure_ascii=False, indent=2)}")
+
+
+def build_fixture():
+    text = (ROOT / "data" / "workflowexample.txt").read_text(encoding="utf-8")
+    ctx = SimpleNamespace(context=router.RouterContext(config=router.CONFIG))
+    ctx.usage = SimpleNamespace(requests=1, input_tokens=6000, output_tokens=400, total_tokens=6400)
+    steps = []
+    for attr, instructions in CV_ROUTE:
+        agent = getattr(router, attr)
+        prompt = instructions(ctx, agent) if instructions else agent.instructions
+        steps.append((agent, prompt, [{"role": "user", "content": text}], text))
+    output = router.CVExtractSchema(
+        full_name="Ana Pérez", email="ana@example.com", phone="", location="Vigo",
+        years_experience=9, skills=["navegacion"] * 20, certifications=["STCW"],
+        target_department="flota_pesquera", role_guess="Capitán", availability="inmediata",
+    )
+    return ctx, steps, output
+
+
+async def one_run(hooks, ctx, steps, output, log_input, log_output):
+    for agent, prompt, items, text in steps:
+        log_input(agent, text)
+        await hooks.on_agent_start(ctx, agent)
+        await hooks.on_llm_start(ctx, agent, prompt, items)
+        await hooks.on_llm_end(ctx, agent, None)
+        await hooks.on_agent_end(ctx, agent, output)
+        log_output(agent, output)
+
+
+def measure(runs, make_hooks, log_input, log_output, fixture):
+    """Median and p95 hook/logging overhead per run, in milliseconds."""
+    ctx, steps, output = fixture
+    timings = []
+    for _ in range(runs):
+        hooks = make_hooks()
+        start = time.perf_counter()
+        asyncio.run(one_run(hooks, ctx, steps, output, log_input, log_output))
+        timings.append((time.perf_counter() - start) * 1000)
+    # asyncio.run incluye la creación del event loop: restarla para aislar los hooks
+    baseline = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        asyncio.run(asyncio.sleep(0))
+        baseline.append((time.perf_counter() - start) * 1000)
+    overhead = statistics.median(timings) - statistics.median(baseline)
+    p95 = sorted(timings)[int(0.95 * (len(timings) - 1))] - statistics.median(baseline)
+    return overhead, p95
+
+
+def report(label, result):
+    median, p95 = result
+    print(f"{label:<42} median={median:8.3f} ms/run   p95={p95:8.3f} ms/run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--level", default="INFO", help="Nivel del pipeline nuevo (INFO, DEBUG)")
+    args = parser.parse_args()
+
+    fixture = build_fixture()
+    print(f"Runs: {args.runs} | agentes por run: {len(CV_ROUTE)}\n")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        before = measure(args.runs, LegacyTerminalRunHooks, legacy_log_input, legacy_log_output, fixture)
+    report("before: print síncrono", before)
+
+    configure_logging(level=args.level, stream=io.StringIO())
+    after = measure(args.runs, router.TerminalRunHooks, router.log_agent_input, router.log_agent_output, fixture)
+    shutdown_logging()
+    report(f"after: cola + lazy ({args.level})", after)
+
+    if after[0] > 0:
+        print(f"\nSpeed-up del hot path: x{before[0] / after[0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: tiempo de arranque en frío (proceso nuevo por medición).
+
+Compara importar router/app con el registro perezoso de agentes (el SDK de
+agentes y openai no se cargan) frente a importar y construir todos los agentes
+de inmediato (equivalente al comportamiento anterior, y a lo que hace el
+warm-up en segundo plano del servidor).
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = [
+    ("import router (lazy)", "import router"),
+    ("import router + warm_up (eager)", "import router; router.agent_registry.warm_up()"),
+    ("import app (lazy)", "import app"),
+    ("import app + warm_up (eager)", "import app; app.agent_registry.warm_up()"),
+]
+
+TIMER = "import time; _t = time.perf_counter(); {code}; print((time.perf_counter() - _t) * 1000)"
+
+
+def measure(code: str, runs: int, env: dict) -> list:
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", TIMER.format(code=code)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Bases de datos desechables para que importar app no toque var/
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+            "ROUTER_JOB_DB": str(Path(tmp) / "jobs.sqlite3"),
+            "ROUTER_SHARED_DB": str(Path(tmp) / "shared.sqlite3"),
+        }
+        print(f"Runs: {args.runs} (proceso nuevo por medición)\n")
+        for label, code in SCENARIOS:
+            timings = measure(code, args.runs, env)
+            print(f"{label:<34} median={statistics.median(timings):8.1f} ms   min={min(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
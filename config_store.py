@@ -0,0 +1,724 @@
+"""
+CONFIG del router cargado desde fichero (JSON, TOML o YAML), validado y recargable en caliente.
+
+- ConfigStore vigila el fichero (sondeo de mtime/tamaño en un hilo) y, si la
+  nueva versión valida, la sustituye de forma atómica; si no valida se mantiene
+  la anterior y se informa del error.
+- Cada ejecución toma `current()` una sola vez al empezar: las ejecuciones en
+  curso conservan su instantánea aunque el fichero cambie.
+- Los artefactos derivados (instrucciones renderizadas con vacantes, owners y
+  políticas, huellas de prompt, índice de vacantes por role_id, variantes de la
+  configuración...) se calculan una vez por versión con `ConfigVersion.derived`.
+  Cada dict cargado lleva su versión (ConfigData), así que `version_of()` no
+  depende de cuántas versiones sigan en uso.
+
+Varias filiales (tenants) comparten despliegue: TenantRegistry mantiene un
+ConfigStore por tenant (config/tenants/<id>.json mezclado sobre el CONFIG base)
+y resuelve el tenant de cada petición con una búsqueda en un dict.
+
+El CONFIG se sigue manejando como dict (lo que leen las instrucciones y las
+plantillas); los modelos Pydantic solo validan y normalizan el fichero.
+"""
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from log_pipeline import logger
+from shared_store import hash_payload
+
+ROOT = Path(__file__).parent
+
+CONFIG_PATH = Path(os.getenv("ROUTER_CONFIG_PATH", ROOT / "config" / "router_config.json"))
+CONFIG_POLL_INTERVAL = float(os.getenv("ROUTER_CONFIG_POLL_INTERVAL", "2.0"))
+
+# Filiales: config/tenants/<tenant_id>.(json|toml|yaml), cada una mezclada sobre CONFIG_PATH
+TENANTS_DIR = Path(os.getenv("ROUTER_TENANTS_DIR", ROOT / "config" / "tenants"))
+DEFAULT_TENANT = os.getenv("ROUTER_DEFAULT_TENANT", "default")
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+CONFIG_SUFFIXES = (".json", ".toml", ".yaml", ".yml")
+
+# Departamento responsable de cada categoría de intención (clave de OWNERS)
+CATEGORY_OWNERS = {"cv": "hr", "sales": "sales", "event": "events", "other": "other"}
+
+# Presupuestos por agente (clave: Agent.name) sobre los que se mezcla LATENCY_POLICY.agents.
+# El hedging duplica llamadas (y tokens): está desactivado salvo que el CONFIG del tenant lo active.
+DEFAULT_AGENT_LATENCY: Dict[str, dict] = {
+    "Guardrails": {"timeout_s": 45.0, "budget_share": 0.4},
+    "Intent classifier": {"timeout_s": 30.0, "budget_share": 0.3},
+    "Guardrails+Intent": {"timeout_s": 60.0, "budget_share": 0.5},
+    "CV extractor": {"timeout_s": 60.0, "budget_share": 0.5},
+    "CV matcher": {"timeout_s": 90.0, "budget_share": 0.6},
+    "CV extract+match": {"timeout_s": 120.0, "budget_share": 0.7},
+    "Sales extractor": {"timeout_s": 60.0, "budget_share": 0.5},
+}
+
+
+# ================================================================================
+# SCHEMA - Validación del fichero de configuración
+# ================================================================================
+
+class CompanyConfig(BaseModel):
+    name: str
+    type: str
+    sector: str
+    mission: str
+    year_founded: int
+    location: str
+    employees: int
+    annual_revenue_eur: str
+    site_url: str
+    careers_url: str
+    commercial_contact_url: str
+
+    class Config:
+        extra = 'forbid'
+
+
+class CommercialContract(BaseModel):
+    name: str
+    target: str
+    volumen_mensual_ton: str
+    condiciones: str
+
+    class Config:
+        extra = 'forbid'
+
+
+class Vacancy(BaseModel):
+    role_id: str
+    dept: str
+    title: str
+    skills_req: List[str]
+    min_exp: int = Field(ge=0)
+    certifications_req: List[str] = []
+
+    class Config:
+        extra = 'forbid'
+
+
+class Owner(BaseModel):
+    email: str
+    name: str
+
+    class Config:
+        extra = 'forbid'
+
+
+class Thresholds(BaseModel):
+    FIT_OK: int = Field(ge=0, le=100)
+    FIT_ALTA_CONF: int = Field(ge=0, le=100)
+    LEAD_A: int = Field(ge=0, le=100)
+    LEAD_B: int = Field(ge=0, le=100)
+
+    class Config:
+        extra = 'forbid'
+
+
+class PIIRules(BaseModel):
+    detect: List[str]
+    redact_method: str
+    keep_emails: bool
+
+    class Config:
+        extra = 'forbid'
+
+
+class GuardrailsPolicy(BaseModel):
+    blocking_categories: List[str]
+    pii_rules: PIIRules
+    jailbreak_patterns: List[str]
+
+    class Config:
+        extra = 'forbid'
+
+
+class CVDedupPolicy(BaseModel):
+    # Buscar cada CV en el índice de CVs ya procesados (cv_index.py)
+    enabled: bool = True
+    # Similitud coseno a partir de la cual el CV es un duplicado: se devuelve el resultado previo
+    # (solo si se obtuvo con la misma configuración)
+    duplicate_threshold: float = Field(default=0.99, ge=0, le=1)
+    # Similitud a partir de la cual se reutiliza el matching previo y solo se redacta el borrador
+    # (solo si el prompt de cv_match no ha cambiado)
+    reuse_match_threshold: float = Field(default=0.95, ge=0, le=1)
+    # Antigüedad máxima de los CVs previos tenidos en cuenta
+    max_age_days: int = Field(default=180, ge=1)
+
+    class Config:
+        extra = 'forbid'
+
+
+class CVPolicy(BaseModel):
+    matching_weights: Dict[str, int]
+    experience_bonus_rules: Dict[str, int]
+    certifications_boost: Dict[str, int]
+    dedup: CVDedupPolicy = CVDedupPolicy()
+
+    class Config:
+        extra = 'forbid'
+
+
+class SalesPolicy(BaseModel):
+    score_weights: Dict[str, int]
+    priority_rules: Dict[Literal["A", "B"], int]
+    decision_maker_titles: List[str]
+    high_value_sectors: List[str]
+
+    class Config:
+        extra = 'forbid'
+
+
+class EventsPolicy(BaseModel):
+    valid_topics: List[str]
+    valid_regions: List[str]
+    valid_formats: List[str]
+
+    class Config:
+        extra = 'forbid'
+
+
+class RoutingPolicy(BaseModel):
+    multi_intent: bool = True
+    max_branches: int = Field(default=3, ge=1)
+    # "split": cv_extract_agent + cv_match_agent | "fused": una sola llamada (CVExtractMatchSchema)
+    cv_pipeline: Literal["split", "fused"] = "split"
+    # "split": guardrails_agent + intent_agent | "combined": una sola llamada (GuardrailsIntentSchema)
+    classifier: Literal["split", "combined"] = "split"
+    # A/B test: fracción (0-1) de ejecuciones con el clasificador combinado; None = usar "classifier"
+    combined_classifier_share: Optional[float] = Field(default=None, ge=0, le=1)
+
+    class Config:
+        extra = 'forbid'
+
+
+class DraftingPolicy(BaseModel):
+    # Los borradores se generan con plantillas; rutas listadas aquí pasan además por el LLM
+    # (cv_reject, cv_forward, sales_internal, events, generic)
+    llm_polish: List[str] = []
+    # Redactar el rechazo en paralelo con cv_match y descartarlo si hay encaje.
+    # Requiere "cv_reject" en llm_polish: la plantilla es instantánea y no hay nada que especular
+    speculative_reject: bool = False
+
+    class Config:
+        extra = 'forbid'
+
+
+class InputPolicy(BaseModel):
+    # Vistas por etapa del texto de guardrails (preprocess.py): sin historial citado, firmas
+    # de móvil ni avisos legales, y acotadas en tokens. guardrails recibe siempre el texto completo.
+    enabled: bool = True
+    classifier_tokens: int = Field(default=600, ge=50)
+    extractor_tokens: int = Field(default=2500, ge=200)
+    # Tamaño de los fragmentos entre los que eligen los extractores
+    chunk_tokens: int = Field(default=250, ge=50)
+
+    class Config:
+        extra = 'forbid'
+
+
+class AgentLatencyPolicy(BaseModel):
+    # Límite duro de una llamada (None = solo el deadline de la petición)
+    timeout_s: Optional[float] = Field(default=60.0, gt=0)
+    # Fracción del tiempo restante de la petición tras la que se lanza el hedge
+    budget_share: float = Field(default=1.0, gt=0, le=1)
+    hedge: bool = False
+    # Percentil de latencia observada usado como retardo del hedge, y muestras necesarias
+    hedge_percentile: float = Field(default=0.95, gt=0, lt=1)
+    hedge_min_samples: int = Field(default=20, ge=1)
+
+    class Config:
+        extra = 'forbid'
+
+
+class LatencyPolicy(BaseModel):
+    # Cada entrada se mezcla sobre DEFAULT_AGENT_LATENCY: {"CV matcher": {"hedge": true}} basta
+    agents: Dict[str, AgentLatencyPolicy] = Field(default_factory=dict, validate_default=True)
+
+    class Config:
+        extra = 'forbid'
+
+    @field_validator("agents", mode="before")
+    @classmethod
+    def merge_defaults(cls, value: Optional[dict]) -> dict:
+        return merge_config(DEFAULT_AGENT_LATENCY, value or {})
+
+
+class LangPolicy(BaseModel):
+    accepted: List[str]
+    default_reply: str
+
+    class Config:
+        extra = 'forbid'
+
+
+class EmailTemplate(BaseModel):
+    subject_pattern: str
+    tone: str
+
+    class Config:
+        extra = 'forbid'
+
+
+class RateLimits(BaseModel):
+    # Cuota propia del tenant, además de la del modelo (scheduler); None = sin límite propio
+    requests_per_minute: Optional[float] = Field(default=None, gt=0)
+    tokens_per_minute: Optional[float] = Field(default=None, gt=0)
+
+    class Config:
+        extra = 'forbid'
+
+
+class RouterConfig(BaseModel):
+    """Full CONFIG file; unknown sections are rejected so typos do not go unnoticed."""
+    COMPANY: CompanyConfig
+    INFRAESTRUCTURA: Dict[str, Any] = {}
+    LINEAS_PRODUCTO: List[str]
+    CERTIFICACIONES_CALIDAD: List[str] = []
+    CONTRATOS_COMERCIALES: List[CommercialContract]
+    VACANTES: List[Vacancy]
+    EVENTOS_INTERES: List[str] = []
+    OWNERS: Dict[str, Owner]
+    THRESHOLDS: Thresholds
+    IDIOMAS: List[str]
+    GUARDRAILS_POLICY: GuardrailsPolicy
+    CV_POLICY: CVPolicy
+    SALES_POLICY: SalesPolicy
+    EVENTS_POLICY: EventsPolicy
+    ROUTING_POLICY: RoutingPolicy = RoutingPolicy()
+    DRAFTING_POLICY: DraftingPolicy = DraftingPolicy()
+    INPUT_POLICY: InputPolicy = InputPolicy()
+    LATENCY_POLICY: LatencyPolicy = Field(default_factory=LatencyPolicy)
+    LANG_POLICY: LangPolicy
+    EMAIL_TEMPLATES: Dict[str, EmailTemplate]
+    RATE_LIMITS: RateLimits = RateLimits()
+
+    class Config:
+        extra = 'forbid'
+
+    @model_validator(mode="after")
+    def check_references(self) -> "RouterConfig":
+        role_ids = [vacancy.role_id for vacancy in self.VACANTES]
+        duplicated = sorted({role_id for role_id in role_ids if role_ids.count(role_id) > 1})
+        if duplicated:
+            raise ValueError(f"VACANTES: duplicated role_id {duplicated}")
+        missing = sorted(set(CATEGORY_OWNERS.values()) - set(self.OWNERS))
+        if missing:
+            raise ValueError(f"OWNERS: missing owners {missing}")
+        if self.THRESHOLDS.FIT_ALTA_CONF < self.THRESHOLDS.FIT_OK:
+            raise ValueError("THRESHOLDS: FIT_ALTA_CONF must be >= FIT_OK")
+        dedup = self.CV_POLICY.dedup
+        if dedup.duplicate_threshold < dedup.reuse_match_threshold:
+            raise ValueError("CV_POLICY.dedup: duplicate_threshold must be >= reuse_match_threshold")
+        if self.INPUT_POLICY.chunk_tokens > self.INPUT_POLICY.extractor_tokens:
+            raise ValueError("INPUT_POLICY: chunk_tokens must be <= extractor_tokens")
+        if self.LANG_POLICY.default_reply not in self.LANG_POLICY.accepted:
+            raise ValueError("LANG_POLICY: default_reply must be one of accepted")
+        unknown = sorted(set(self.DRAFTING_POLICY.llm_polish) - set(self.EMAIL_TEMPLATES))
+        if unknown:
+            raise ValueError(f"DRAFTING_POLICY.llm_polish: unknown templates {unknown}")
+        if self.DRAFTING_POLICY.speculative_reject and "cv_reject" not in self.DRAFTING_POLICY.llm_polish:
+            raise ValueError("DRAFTING_POLICY: speculative_reject requires 'cv_reject' in llm_polish")
+        return self
+
+
+def validate_config(raw: dict) -> dict:
+    """Validate a CONFIG dict and return it normalized (defaults filled in); raises ValueError."""
+    return RouterConfig.model_validate(raw).model_dump()
+
+
+def read_config_file(path: Union[str, Path]) -> dict:
+    """Parse a JSON, TOML or YAML file into a dict (no validation)."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".json":
+        raw = json.loads(path.read_text(encoding="utf-8"))
+    elif suffix == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            raw = tomllib.load(f)
+    elif suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ValueError("YAML config requires PyYAML (pip install pyyaml)") from e
+        raw = yaml.safe_load(path.read_text(encoding="utf-8"))
+    else:
+        raise ValueError(f"Unsupported config format '{suffix}' (use .json, .toml or .yaml)")
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: the top level must be a mapping")
+    return raw
+
+
+def merge_config(base: dict, overrides: dict) -> dict:
+    """Deep-merge overrides into a copy of base (dicts merge, everything else is replaced)."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def load_config(path: Union[str, Path], base: Optional[Union[str, Path]] = None) -> dict:
+    """Read and validate a CONFIG file, merged over `base` when given (tenant overrides)."""
+    raw = read_config_file(path)
+    if base is not None:
+        raw = merge_config(read_config_file(base), raw)
+    return validate_config(raw)
+
+
+# ================================================================================
+# VERSIONS - Instantáneas inmutables con sus artefactos derivados
+# ================================================================================
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class ConfigVersion:
+    """One CONFIG snapshot; treat `data` as read-only, a reload creates a new version."""
+    data: dict
+    fingerprint: str
+    version: int = 0  # 0 = configuración ad hoc (replay, benchmarks), no cargada por el store
+    source: Optional[str] = None
+    loaded_at: float = field(default_factory=time.time)
+    _derived: Dict[Any, Any] = field(default_factory=dict, repr=False, compare=False)
+
+    def derived(self, key: Any, build: Callable[[], Any]) -> Any:
+        """Artifact computed once for this version (a concurrent first call may build it twice)."""
+        value = self._derived.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._derived[key] = build()
+        return value
+
+    @property
+    def vacancies(self) -> Dict[str, dict]:
+        """VACANTES by role_id."""
+        return self.derived("vacancies", lambda: {vacancy["role_id"]: vacancy for vacancy in self.data.get("VACANTES", [])})
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ConfigData(dict):
+    """
+    CONFIG dict that carries its ConfigVersion: version_of() is an attribute
+    read, valid for as long as any run holds the dict. Copies are plain dicts
+    (a modified copy is a different configuration).
+    """
+
+    __slots__ = ("version",)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def versioned(config: dict, **fields) -> dict:
+    """Wrap a CONFIG dict with its own version (fingerprint computed once); returns the ConfigData."""
+    data = ConfigData(config)
+    data.version = ConfigVersion(data, hash_payload(data), **fields)
+    return data
+
+
+# Dicts normales (no envueltos con versioned): versiones ad hoc de los últimos usados
+_recent: List[ConfigVersion] = []
+
+
+def version_of(config: dict) -> ConfigVersion:
+    """Version holding this CONFIG object; plain dicts get an ad hoc version (the last 16 are remembered)."""
+    version = getattr(config, "version", None)
+    if version is not None:
+        return version
+    for version in reversed(_recent):
+        if version.data is config:
+            return version
+    version = ConfigVersion(config, hash_payload(config))
+    _recent.append(version)
+    del _recent[:-16]
+    return version
+
+
+# ================================================================================
+# STORE - Carga, vigilancia y sustitución atómica
+# ================================================================================
+
+class ConfigStore:
+    """
+    Current CONFIG version loaded from `path` (merged over `base`, if given),
+    reloaded when either file changes.
+
+    An invalid file at startup raises; an invalid file on reload is reported
+    and the previous version stays active.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = CONFIG_PATH,
+        poll_interval: float = CONFIG_POLL_INTERVAL,
+        base: Optional[Union[str, Path]] = None,
+    ):
+        self.path = Path(path)
+        self.base = Path(base) if base is not None else None
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._listeners: List[Callable[[ConfigVersion], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._changed = None
+        self._stamp = self._file_stamp()
+        self._current = self._build(load_config(self.path, self.base), version=1)
+
+    def _file_stamp(self) -> tuple:
+        stamps = []
+        for path in (self.base, self.path):
+            try:
+                stat = path.stat() if path is not None else None
+            except OSError:
+                stat = None
+            stamps.append((stat.st_mtime_ns, stat.st_size) if stat is not None else None)
+        return tuple(stamps)
+
+    def _build(self, data: dict, version: int) -> ConfigVersion:
+        return versioned(data, version=version, source=str(self.path)).version
+
+    def current(self) -> ConfigVersion:
+        """The active version; take it once per run and keep it (reloads swap the reference)."""
+        return self._current
+
+    @property
+    def config(self) -> dict:
+        return self._current.data
+
+    def subscribe(self, listener: Callable[[ConfigVersion], None]) -> None:
+        """Call `listener(version)` after every successful reload."""
+        self._listeners.append(listener)
+
+    def reload(self, force: bool = False) -> bool:
+        """Reload if the file changed (or always with force); True when a new version became active."""
+        with self._lock:
+            stamp = self._file_stamp()
+            if not force and stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                data = load_config(self.path, self.base)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("⚠️ CONFIG no válido en %s, se mantiene la versión %d: %s", self.path, self._current.version, e,
+                               extra={"event": "config_invalid"})
+                return False
+            self.last_error = None
+            if hash_payload(data) == self._current.fingerprint:
+                return False
+            version = self._build(data, self._current.version + 1)
+            self._current = version
+            self.reloads += 1
+        logger.info("🔄 CONFIG recargado: versión %d (%s)", version.version, version.fingerprint[:12], extra={"event": "config_reloaded"})
+        for listener in self._listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                logger.warning("Error en listener de CONFIG: %s", e, extra={"event": "config_listener_error"})
+        return True
+
+    def watch(self) -> None:
+        """Start the polling thread (idempotent)."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def poll(self) -> bool:
+        """One watcher step: reload once the file changed and stayed unchanged for a poll interval."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            self._changed = None
+            return False
+        # Esperar a que el fichero deje de cambiar (editores que no escriben de forma atómica)
+        if stamp != self._changed:
+            self._changed = stamp
+            return False
+        return self.reload()
+
+    def _watch_loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+
+    def close(self) -> None:
+        """Stop watching (the tenant was removed)."""
+        self.stop()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def snapshot(self) -> dict:
+        return {
+            **self._current.describe(),
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# ================================================================================
+# TENANTS - Un ConfigStore por filial
+# ================================================================================
+
+class UnknownTenant(KeyError):
+    """The request names a tenant with no config file."""
+
+    def __str__(self) -> str:
+        return f"Unknown tenant: {self.args[0]}"
+
+
+class TenantRegistry:
+    """
+    Config stores by tenant ID.
+
+    The base file is the default tenant; every file in `tenants_dir` is a
+    tenant whose sections (COMPANY, VACANTES, OWNERS, EMAIL_TEMPLATES,
+    RATE_LIMITS...) are merged over the base file. Resolving a tenant is a
+    dict lookup; one thread polls every file, including tenants added or
+    removed while running.
+    """
+
+    def __init__(
+        self,
+        base_path: Union[str, Path] = CONFIG_PATH,
+        tenants_dir: Union[str, Path] = TENANTS_DIR,
+        default_tenant: str = DEFAULT_TENANT,
+        poll_interval: float = CONFIG_POLL_INTERVAL,
+    ):
+        self.base_path = Path(base_path)
+        self.tenants_dir = Path(tenants_dir)
+        self.default_tenant = default_tenant
+        self.poll_interval = poll_interval
+        self.default = ConfigStore(self.base_path, poll_interval)
+        self._stores: Dict[str, ConfigStore] = {default_tenant: self.default}
+        self._failed: Dict[Path, tuple] = {}  # Ficheros de tenant que no validaron (y su sello)
+        self._listeners: List[Callable[[str, ConfigVersion], None]] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.scan()
+
+    def _tenant_files(self) -> Dict[str, Path]:
+        if not self.tenants_dir.is_dir():
+            return {}
+        files = {}
+        for path in sorted(self.tenants_dir.iterdir()):
+            if path.suffix.lower() not in CONFIG_SUFFIXES or not TENANT_ID_PATTERN.match(path.stem):
+                continue
+            if path.stem == self.default_tenant or path.stem in files:
+                logger.warning("⚠️ Tenant duplicado ignorado: %s", path, extra={"event": "tenant_duplicate"})
+                continue
+            files[path.stem] = path
+        return files
+
+    def scan(self) -> None:
+        """Register new tenant files and drop the ones that disappeared."""
+        files = self._tenant_files()
+        for tenant_id in [t for t in self._stores if t != self.default_tenant and t not in files]:
+            self._stores.pop(tenant_id).close()
+            logger.info("🗑️ Tenant eliminado: %s", tenant_id, extra={"event": "tenant_removed"})
+        for tenant_id, path in files.items():
+            if tenant_id in self._stores:
+                continue
+            stamp = (path.stat().st_mtime_ns, path.stat().st_size) if path.exists() else None
+            if self._failed.get(path) == stamp:
+                continue  # Sigue sin cambios desde el último error
+            try:
+                store = ConfigStore(path, self.poll_interval, base=self.base_path)
+            except (OSError, ValueError) as e:
+                self._failed[path] = stamp
+                logger.warning("⚠️ CONFIG de tenant no válido en %s: %s", path, e, extra={"event": "config_invalid"})
+                continue
+            for listener in self._listeners:
+                self._subscribe_store(tenant_id, store, listener)
+            self._stores[tenant_id] = store
+            self._failed.pop(path, None)
+            logger.info("🏢 Tenant registrado: %s", tenant_id, extra={"event": "tenant_registered"})
+
+    def get(self, tenant_id: Optional[str] = None) -> ConfigStore:
+        store = self._stores.get(tenant_id or self.default_tenant)
+        if store is None:
+            raise UnknownTenant(tenant_id)
+        return store
+
+    def current(self, tenant_id: Optional[str] = None) -> ConfigVersion:
+        """Active config version of a tenant (None = default tenant); raises UnknownTenant."""
+        return self.get(tenant_id).current()
+
+    def tenants(self) -> List[str]:
+        return list(self._stores)
+
+    def subscribe(self, listener: Callable[[str, ConfigVersion], None]) -> None:
+        """Call `listener(tenant_id, version)` after every successful reload of any tenant, also ones added later."""
+        self._listeners.append(listener)
+        for tenant_id, store in list(self._stores.items()):
+            self._subscribe_store(tenant_id, store, listener)
+
+    @staticmethod
+    def _subscribe_store(tenant_id: str, store: ConfigStore, listener: Callable[[str, ConfigVersion], None]) -> None:
+        store.subscribe(lambda version: listener(tenant_id, version))
+
+    def poll(self) -> None:
+        self.scan()
+        for store in list(self._stores.values()):
+            store.poll()
+
+    def reload(self, force: bool = False) -> None:
+        self.scan()
+        for store in list(self._stores.values()):
+            store.reload(force)
+
+    def watch(self) -> None:
+        """Start the polling thread (idempotent)."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="tenant-config-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch_loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Error vigilando la configuración de tenants: %s", e, extra={"event": "config_watch_error"})
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def snapshot(self) -> dict:
+        return {
+            "default_tenant": self.default_tenant,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "tenants": {tenant_id: store.snapshot() for tenant_id, store in list(self._stores.items())},
+        }
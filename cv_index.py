@@ -0,0 +1,422 @@
+"""
+Índice vectorial local de CVs ya procesados (CVExtractSchema + resultado de la ruta).
+
+Sirve para detectar re-candidaturas: un CV casi idéntico a uno anterior (mismo
+tenant) puede devolver el resultado previo, o reutilizar su matching, en vez de
+recorrer de nuevo toda la ruta CV (ver router.find_prior_cv).
+
+- Embeddings de un embedder local intercambiable (ROUTER_CV_EMBEDDER):
+  "hashing[:dim]" (por defecto; hashing trick determinista, sin dependencias),
+  "sentence-transformers:<modelo>" (opcional) o "paquete.modulo:fabrica".
+- Búsqueda aproximada (ANN) con LSH de hiperplanos aleatorios en NumPy; por
+  debajo de EXACT_SEARCH_ROWS registros se compara con todos (producto matricial).
+- Persistencia en SQLite (WAL); cada proceso mantiene los vectores en memoria y
+  carga periódicamente los registros añadidos por otros procesos.
+"""
+
+import importlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from log_pipeline import logger
+from shared_store import connect_wal
+
+ROOT = Path(__file__).parent
+
+CV_INDEX_PATH = Path(os.getenv("ROUTER_CV_INDEX_DB", ROOT / "var" / "cv_index.sqlite3"))
+CV_EMBEDDER = os.getenv("ROUTER_CV_EMBEDDER", "hashing")
+CV_INDEX_REFRESH = float(os.getenv("ROUTER_CV_INDEX_REFRESH", "5"))  # Segundos entre cargas de registros ajenos
+
+# Con menos registros por tenant la búsqueda exacta es tan rápida como el LSH
+EXACT_SEARCH_ROWS = 2048
+
+
+# ================================================================================
+# EMBEDDERS
+# ================================================================================
+
+_TOKEN_RE = re.compile(r"[a-z0-9@._+-]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents so "Gestión" and "gestion" hash alike."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+class HashingEmbedder:
+    """
+    Deterministic hashing-trick embedder: word tokens plus character trigrams,
+    signed feature hashing (CRC32, stable across processes), sublinear tf and
+    L2 normalization. Small edits to a CV move its vector only slightly.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Dict[int, float]:
+        counts: Dict[int, float] = defaultdict(float)
+        for token in _TOKEN_RE.findall(normalize_text(text)):
+            grams = [token] + [f"#{token[i:i + 3]}" for i in range(max(len(token) - 2, 1))]
+            for gram in grams:
+                h = zlib.crc32(gram.encode("utf-8"))
+                # Bit alto del hash = signo (las colisiones tienden a anularse)
+                counts[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, value in self._features(text).items():
+                vectors[row, column] = np.sign(value) * np.log1p(abs(value))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model (optional dependency)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{model_name}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def load_embedder(spec: str = CV_EMBEDDER):
+    """Build the embedder named by ROUTER_CV_EMBEDDER; falls back to hashing if it cannot be loaded."""
+    kind, _, arg = spec.partition(":")
+    try:
+        if kind == "hashing":
+            return HashingEmbedder(int(arg) if arg else 1024)
+        if kind == "sentence-transformers":
+            return SentenceTransformerEmbedder(arg or "all-MiniLM-L6-v2")
+        # "paquete.modulo:fabrica" → fabrica() devuelve un objeto con name, dim y embed(texts)
+        return getattr(importlib.import_module(kind), arg)()
+    except Exception as e:
+        logger.warning("⚠️ No se pudo cargar el embedder '%s' (%s); se usa hashing", spec, e, extra={"event": "cv_index_error"})
+        return HashingEmbedder()
+
+
+def cv_text(cv: dict) -> str:
+    """Text embedded for a CVExtractSchema record (the fields that identify a candidacy)."""
+    return " ".join([
+        cv.get("full_name", ""),
+        cv.get("email", ""),
+        cv.get("phone", ""),
+        cv.get("location", ""),
+        f"{cv.get('years_experience', 0)} years",
+        " ".join(cv.get("skills", [])),
+        " ".join(cv.get("certifications", [])),
+        cv.get("target_department", ""),
+        cv.get("role_guess", ""),
+    ])
+
+
+# ================================================================================
+# ANN - LSH de hiperplanos aleatorios
+# ================================================================================
+
+class HyperplaneLSH:
+    """
+    Random-hyperplane LSH for cosine similarity: n_tables hash tables of n_bits
+    each. Queries probe their bucket and every bucket one bit away in each table.
+    """
+
+    def __init__(self, dim: int, n_tables: int = 8, n_bits: int = 12, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.planes = rng.standard_normal((n_tables * n_bits, dim)).astype(np.float32)
+        self.weights = 1 << np.arange(n_bits, dtype=np.int64)
+        self.tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(n_tables)]
+
+    def codes(self, vectors: np.ndarray) -> np.ndarray:
+        bits = (vectors @ self.planes.T > 0).reshape(len(vectors), self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ self.weights
+
+    def add(self, vectors: np.ndarray, first_row: int) -> None:
+        for offset, codes in enumerate(self.codes(vectors)):
+            for table, code in zip(self.tables, codes.tolist()):
+                table[code].append(first_row + offset)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        rows: List[int] = []
+        for table, code in zip(self.tables, self.codes(query[None, :])[0].tolist()):
+            rows.extend(table.get(code, ()))
+            for bit in range(self.n_bits):
+                rows.extend(table.get(code ^ (1 << bit), ()))
+        return np.unique(np.asarray(rows, dtype=np.int64))
+
+
+# ================================================================================
+# INDEX
+# ================================================================================
+
+@dataclass
+class CVRecord:
+    record_id: int
+    tenant_id: str
+    created_at: float
+    cv: dict
+    match: Optional[dict] = None
+    result: Optional[dict] = None
+    final_route: Optional[str] = None
+    config_fingerprint: Optional[str] = None
+    match_prompt_hash: Optional[str] = None  # Huella del prompt de cv_match con el que se obtuvo `match`
+    run_id: Optional[str] = None
+
+
+@dataclass
+class _Shard:
+    """Vectors and records of one tenant; rows grow by doubling the matrix."""
+    dim: int
+    vectors: np.ndarray = None
+    created_at: np.ndarray = None
+    records: List[CVRecord] = field(default_factory=list)
+    lsh: HyperplaneLSH = None
+
+    def __post_init__(self):
+        self.vectors = np.zeros((64, self.dim), dtype=np.float32)
+        self.created_at = np.zeros(64, dtype=np.float64)
+        self.lsh = HyperplaneLSH(self.dim)
+
+    def add(self, vectors: np.ndarray, records: List[CVRecord]) -> None:
+        start, end = len(self.records), len(self.records) + len(records)
+        if end > len(self.vectors):
+            capacity = max(end, 2 * len(self.vectors))
+            self.vectors = np.resize(self.vectors, (capacity, self.dim))
+            self.created_at = np.resize(self.created_at, capacity)
+        self.vectors[start:end] = vectors
+        self.created_at[start:end] = [record.created_at for record in records]
+        self.records.extend(records)
+        self.lsh.add(vectors, start)
+
+    def search(self, query: np.ndarray, k: int, since: Optional[float]) -> List[Tuple[float, CVRecord]]:
+        n = len(self.records)
+        if n == 0:
+            return []
+        rows = np.arange(n) if n <= EXACT_SEARCH_ROWS else self.lsh.candidates(query)
+        if since is not None and len(rows):
+            rows = rows[self.created_at[rows] >= since]
+        if not len(rows):
+            return []
+        scores = self.vectors[rows] @ query
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), self.records[rows[i]]) for i in top]
+
+
+class CVIndex:
+    """
+    Per-tenant vector index of processed CVs, persisted in SQLite.
+
+    add() stores a record and indexes it at once in this process; other
+    processes pick it up on their next refresh (every refresh_interval seconds,
+    triggered by searches).
+    """
+
+    def __init__(self, db_path: Path = CV_INDEX_PATH, embedder=None, refresh_interval: float = CV_INDEX_REFRESH):
+        self.db_path = Path(db_path)
+        self.embedder = embedder or load_embedder()
+        self.refresh_interval = refresh_interval
+        self.searches = 0
+        self.hits = 0
+        self._shards: Dict[str, _Shard] = {}
+        self._loaded_ids: set = set()
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.RLock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+        self.refresh()
+
+    def _init_schema(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cv_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    run_id TEXT,
+                    final_route TEXT,
+                    config_fingerprint TEXT,
+                    match_prompt_hash TEXT,
+                    cv TEXT NOT NULL,
+                    match TEXT,
+                    result TEXT,
+                    embedder TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cv_records_tenant ON cv_records (tenant_id, created_at)")
+
+    def _shard(self, tenant_id: str) -> _Shard:
+        shard = self._shards.get(tenant_id)
+        if shard is None:
+            shard = self._shards[tenant_id] = _Shard(self.embedder.dim)
+        return shard
+
+    def embed_cv(self, cv: dict) -> np.ndarray:
+        return self.embedder.embed([cv_text(cv)])[0]
+
+    # ---------------------------- Writes ----------------------------
+
+    def add(
+        self,
+        tenant_id: str,
+        cv: dict,
+        *,
+        match: Optional[dict] = None,
+        result: Optional[dict] = None,
+        final_route: Optional[str] = None,
+        config_fingerprint: Optional[str] = None,
+        match_prompt_hash: Optional[str] = None,
+        run_id: Optional[str] = None,
+    ) -> CVRecord:
+        vector = self.embed_cv(cv)
+        created_at = time.time()
+        with connect_wal(self.db_path) as conn:
+            cursor = conn.execute(
+                """INSERT INTO cv_records (tenant_id, created_at, run_id, final_route, config_fingerprint,
+                                           match_prompt_hash, cv, match, result, embedder, vector)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    tenant_id, created_at, run_id, final_route, config_fingerprint, match_prompt_hash,
+                    json.dumps(cv, ensure_ascii=False),
+                    json.dumps(match, ensure_ascii=False) if match is not None else None,
+                    json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                    self.embedder.name, vector.tobytes(),
+                ),
+            )
+            record_id = cursor.lastrowid
+        record = CVRecord(
+            record_id, tenant_id, created_at, cv, match, result,
+            final_route, config_fingerprint, match_prompt_hash, run_id,
+        )
+        with self._lock:
+            if record_id not in self._loaded_ids:
+                self._loaded_ids.add(record_id)
+                self._shard(tenant_id).add(vector[None, :], [record])
+        return record
+
+    # ---------------------------- Reads ----------------------------
+
+    def refresh(self, batch_size: int = 5000) -> int:
+        """Load records added since the last refresh (also by other processes); returns how many."""
+        loaded = 0
+        with self._lock:
+            with connect_wal(self.db_path) as conn:
+                while True:
+                    rows = conn.execute(
+                        "SELECT * FROM cv_records WHERE id > ? ORDER BY id LIMIT ?", (self._last_id, batch_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    self._last_id = rows[-1]["id"]
+                    rows = [row for row in rows if row["id"] not in self._loaded_ids]
+                    by_tenant: Dict[str, List[Any]] = defaultdict(list)
+                    for row in rows:
+                        by_tenant[row["tenant_id"]].append(row)
+                    for tenant_id, tenant_rows in by_tenant.items():
+                        self._load_rows(tenant_id, tenant_rows)
+                    loaded += len(rows)
+            self._refreshed_at = time.monotonic()
+        return loaded
+
+    def _load_rows(self, tenant_id: str, rows: List[Any]) -> None:
+        records = [
+            CVRecord(
+                row["id"], row["tenant_id"], row["created_at"], json.loads(row["cv"]),
+                json.loads(row["match"]) if row["match"] else None,
+                json.loads(row["result"]) if row["result"] else None,
+                row["final_route"], row["config_fingerprint"], row["match_prompt_hash"], row["run_id"],
+            )
+            for row in rows
+        ]
+        # Vectores de otro embedder (p. ej. tras cambiar ROUTER_CV_EMBEDDER): se recalculan
+        stale = [i for i, row in enumerate(rows) if row["embedder"] != self.embedder.name]
+        vectors = np.zeros((len(rows), self.embedder.dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            if row["embedder"] == self.embedder.name:
+                vectors[i] = np.frombuffer(row["vector"], dtype=np.float32)
+        if stale:
+            vectors[stale] = self.embedder.embed([cv_text(records[i].cv) for i in stale])
+        self._loaded_ids.update(row["id"] for row in rows)
+        self._shard(tenant_id).add(vectors, records)
+
+    def nearest(
+        self,
+        tenant_id: str,
+        cv: dict,
+        k: int = 1,
+        since: Optional[float] = None,
+    ) -> List[Tuple[float, CVRecord]]:
+        """The k most similar stored CVs of the tenant (cosine similarity, best first)."""
+        if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            self.refresh()
+        query = self.embed_cv(cv)
+        with self._lock:
+            shard = self._shards.get(tenant_id)
+            results = shard.search(query, k, since) if shard is not None else []
+            self.searches += 1
+            self.hits += bool(results)
+        return results
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "embedder": self.embedder.name,
+                "records": {tenant_id: len(shard.records) for tenant_id, shard in self._shards.items()},
+                "searches": self.searches,
+                "searches_with_candidates": self.hits,
+            }
+
+
+def load_records(
+    tenant_id: str,
+    final_routes: Optional[Sequence[str]] = None,
+    since: Optional[float] = None,
+    db_path: Path = CV_INDEX_PATH,
+) -> List[CVRecord]:
+    """Stored records of a tenant straight from SQLite (no embedder needed), oldest first."""
+    db_path = Path(db_path)
+    if not db_path.exists():
+        return []
+    where, params = ["tenant_id = ?"], [tenant_id]
+    if final_routes:
+        where.append(f"final_route IN ({', '.join('?' * len(final_routes))})")
+        params.extend(final_routes)
+    if since is not None:
+        where.append("created_at >= ?")
+        params.append(since)
+    with connect_wal(db_path) as conn:
+        rows = conn.execute(
+            f"""SELECT id, tenant_id, created_at, run_id, final_route, config_fingerprint, match_prompt_hash, cv
+                FROM cv_records WHERE {' AND '.join(where)} ORDER BY id""",
+            params,
+        ).fetchall()
+    return [
+        CVRecord(
+            row["id"], row["tenant_id"], row["created_at"], json.loads(row["cv"]),
+            final_route=row["final_route"], config_fingerprint=row["config_fingerprint"],
+            match_prompt_hash=row["match_prompt_hash"], run_id=row["run_id"],
+        )
+        for row in rows
+    ]
@@ -0,0 +1,287 @@
+"""
+Motor de plantillas precompiladas para los borradores de email (DraftEmailSchema).
+
+Los asuntos salen de CONFIG["EMAIL_TEMPLATES"] y los cuerpos de BODY_TEMPLATES,
+por ruta e idioma. Cada plantilla se compila una sola vez (lista de literales y
+campos) y el render es una simple concatenación, sin llamadas al LLM. El pulido
+con LLM es opcional por ruta (CONFIG["DRAFTING_POLICY"]["llm_polish"]).
+
+Sintaxis: {{campo}} o {{objeto.campo}}; las listas se unen con ", " y los
+campos ausentes se sustituyen por una cadena vacía.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from config_store import version_of
+
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+
+# ================================================================================
+# TEMPLATES - Cuerpos por ruta e idioma (los asuntos en español vienen de CONFIG)
+# ================================================================================
+
+# Asuntos para idiomas distintos del español (el español usa subject_pattern de CONFIG)
+SUBJECT_TRANSLATIONS: Dict[str, Dict[str, str]] = {
+    "cv_reject": {
+        "en": "Thank you for your application – {{company}}",
+        "pt": "Obrigado pela sua candidatura – {{company}}",
+    },
+    "events": {
+        "en": "Re: Event/partnership proposal",
+        "pt": "Re: Proposta de evento/parceria",
+    },
+    "generic": {
+        "en": "Received – {{company}}",
+        "pt": "Recebido – {{company}}",
+    },
+}
+
+BODY_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "cv_reject": {
+        "es": (
+            "Hola {{first_name}},\n\n"
+            "Muchas gracias por tu interés en {{company}} y por el tiempo dedicado a enviarnos tu candidatura.\n\n"
+            "Hemos revisado tu perfil con atención y, en este momento, no disponemos de una vacante que encaje "
+            "con tu experiencia. Conservaremos tu CV archivado durante 6 meses por si surge una oportunidad adecuada.\n\n"
+            "Te animamos a consultar periódicamente nuestra página de empleo: {{careers_url}}\n\n"
+            "Un cordial saludo,\n\n"
+            "Equipo de Recursos Humanos  \n{{company}}"
+        ),
+        "en": (
+            "Hello {{first_name}},\n\n"
+            "Thank you for your interest in {{company}} and for taking the time to send us your application.\n\n"
+            "We have carefully reviewed your profile and, at the moment, we do not have a vacancy that matches "
+            "your experience. We will keep your CV on file for 6 months in case a suitable opportunity arises.\n\n"
+            "We encourage you to check our careers page regularly: {{careers_url}}\n\n"
+            "Kind regards,\n\n"
+            "Human Resources Team  \n{{company}}"
+        ),
+        "pt": (
+            "Olá {{first_name}},\n\n"
+            "Muito obrigado pelo seu interesse na {{company}} e pelo tempo dedicado a enviar-nos a sua candidatura.\n\n"
+            "Analisámos o seu perfil com atenção e, neste momento, não temos uma vaga que se ajuste à sua "
+            "experiência. Manteremos o seu CV arquivado durante 6 meses caso surja uma oportunidade adequada.\n\n"
+            "Convidamo-lo a consultar periodicamente a nossa página de emprego: {{careers_url}}\n\n"
+            "Com os melhores cumprimentos,\n\n"
+            "Equipa de Recursos Humanos  \n{{company}}"
+        ),
+    },
+    "cv_forward": {
+        "es": (
+            "Hola {{owner_name}},\n\n"
+            "Os derivamos un candidato con encaje en **{{title}}** ({{role_id}}, fit {{match_score}}%).\n\n"
+            "**Candidato**\n"
+            "- Nombre: {{full_name}}\n"
+            "- Email: {{email}}\n"
+            "- Teléfono: {{phone}}\n"
+            "- Ubicación: {{location}}\n"
+            "- Experiencia: {{years_experience}} años\n"
+            "- Habilidades clave: {{skills}}\n"
+            "- Certificaciones: {{certifications}}\n"
+            "- Disponibilidad: {{availability}}\n\n"
+            "**Puestos coincidentes**\n"
+            "{{matched_roles}}\n\n"
+            "**Mejor coincidencia:** {{title}} – {{why}}\n\n"
+            "Se adjunta el CV original en el expediente del candidato."
+        ),
+    },
+    "sales_internal": {
+        "es": (
+            "Hola {{owner_name}},\n\n"
+            "Nuevo lead **{{priority}}** (score {{lead_score}}/100).\n\n"
+            "**Contacto**\n"
+            "- Empresa: {{company}}\n"
+            "- Nombre: {{contact_name}} ({{title}})\n"
+            "- Email: {{contact_email}}\n"
+            "- Teléfono: {{contact_phone}}\n\n"
+            "**Resumen de la consulta**  \n{{intent_summary}}\n\n"
+            "**Señales clave**\n"
+            "- Productos de interés: {{product_interest}}\n"
+            "- Presupuesto/volumen: {{budget_hint}}\n"
+            "- Plazo: {{timeline}}\n\n"
+            "{{account_history}}"
+            "**Acción recomendada:** responder en 24-48h."
+        ),
+    },
+    "events": {
+        "es": (
+            "Hola,\n\n"
+            "Gracias por contactar con {{company}}. Hemos recibido tu propuesta y el equipo de "
+            "{{owner_name}} la revisará.\n\n"
+            "Para valorarla, ¿podrías indicarnos?\n"
+            "1. Objetivo del evento o colaboración\n"
+            "2. Fechas y plazo de respuesta\n"
+            "3. Formato, ubicación y contexto (asistentes, patrocinio, prensa...)\n\n"
+            "Un cordial saludo,\n\n"
+            "{{company}}"
+        ),
+        "en": (
+            "Hello,\n\n"
+            "Thank you for contacting {{company}}. We have received your proposal and the "
+            "{{owner_name}} team will review it.\n\n"
+            "To assess it, could you let us know:\n"
+            "1. The goal of the event or partnership\n"
+            "2. Dates and response deadline\n"
+            "3. Format, location and context (attendees, sponsorship, press...)\n\n"
+            "Kind regards,\n\n"
+            "{{company}}"
+        ),
+        "pt": (
+            "Olá,\n\n"
+            "Obrigado por contactar a {{company}}. Recebemos a sua proposta e a equipa de "
+            "{{owner_name}} irá analisá-la.\n\n"
+            "Para a avaliarmos, poderia indicar-nos:\n"
+            "1. Objetivo do evento ou colaboração\n"
+            "2. Datas e prazo de resposta\n"
+            "3. Formato, local e contexto (participantes, patrocínio, imprensa...)\n\n"
+            "Com os melhores cumprimentos,\n\n"
+            "{{company}}"
+        ),
+    },
+    "generic": {
+        "es": (
+            "Hola,\n\n"
+            "Gracias por escribir a {{company}}. Hemos recibido tu mensaje.\n\n"
+            "Para poder ayudarte, ¿podrías indicarnos?\n"
+            "1. El objetivo de tu consulta\n"
+            "2. Plazo o urgencia\n"
+            "3. Cualquier contexto adicional relevante\n\n"
+            "Un cordial saludo,\n\n"
+            "{{owner_name}}  \n{{company}}"
+        ),
+        "en": (
+            "Hello,\n\n"
+            "Thank you for writing to {{company}}. We have received your message.\n\n"
+            "So that we can help you, could you let us know:\n"
+            "1. The purpose of your inquiry\n"
+            "2. Timeline or urgency\n"
+            "3. Any other relevant context\n\n"
+            "Kind regards,\n\n"
+            "{{owner_name}}  \n{{company}}"
+        ),
+        "pt": (
+            "Olá,\n\n"
+            "Obrigado por escrever à {{company}}. Recebemos a sua mensagem.\n\n"
+            "Para o podermos ajudar, poderia indicar-nos:\n"
+            "1. O objetivo do seu pedido\n"
+            "2. Prazo ou urgência\n"
+            "3. Qualquer contexto adicional relevante\n\n"
+            "Com os melhores cumprimentos,\n\n"
+            "{{owner_name}}  \n{{company}}"
+        ),
+    },
+}
+
+
+# ================================================================================
+# COMPILED TEMPLATES
+# ================================================================================
+
+class CompiledTemplate:
+    """Template split once into literal text and field paths; render() only joins strings."""
+
+    __slots__ = ("source", "segments")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.segments: List[Tuple[str, Optional[Tuple[str, ...]]]] = []
+        pos = 0
+        for match in PLACEHOLDER.finditer(source):
+            self.segments.append((source[pos:match.start()], tuple(match.group(1).split("."))))
+            pos = match.end()
+        self.segments.append((source[pos:], None))
+
+    def render(self, fields: Dict[str, Any]) -> str:
+        parts = []
+        for literal, path in self.segments:
+            parts.append(literal)
+            if path is not None:
+                parts.append(_format_value(_lookup(fields, path)))
+        return "".join(parts)
+
+
+def _lookup(fields: Dict[str, Any], path: Tuple[str, ...]) -> Any:
+    value: Any = fields
+    for key in path:
+        if isinstance(value, dict):
+            value = value.get(key)
+        else:
+            value = getattr(value, key, None)
+        if value is None:
+            return None
+    return value
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value if v not in (None, ""))
+    return str(value)
+
+
+# ================================================================================
+# ENGINE
+# ================================================================================
+
+class EmailTemplateEngine:
+    """
+    All (route, language) subject/body pairs for one CONFIG, compiled up front.
+
+    Unknown languages fall back to LANG_POLICY["default_reply"] and then to
+    Spanish; internal briefings (cv_forward, sales_internal) only exist in Spanish.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.default_language = config.get("LANG_POLICY", {}).get("default_reply", "es")
+        self.templates: Dict[Tuple[str, str], Tuple[CompiledTemplate, CompiledTemplate]] = {}
+        for key, bodies in BODY_TEMPLATES.items():
+            spanish_subject = config["EMAIL_TEMPLATES"][key]["subject_pattern"]
+            for language, body in bodies.items():
+                subject = spanish_subject if language == "es" else SUBJECT_TRANSLATIONS[key][language]
+                self.templates[(key, language)] = (CompiledTemplate(subject), CompiledTemplate(body))
+
+    def resolve_language(self, template_key: str, language: str) -> str:
+        for candidate in (language, self.default_language, "es"):
+            if (template_key, candidate) in self.templates:
+                return candidate
+        raise KeyError(f"No email template for route '{template_key}'")
+
+    def render(
+        self,
+        template_key: str,
+        language: str,
+        fields: Dict[str, Any],
+        *,
+        to: str = "",
+        cc: str = "",
+    ) -> Dict[str, str]:
+        """Render a DraftEmailSchema-shaped dict; company fields from CONFIG are always available."""
+        subject, body = self.templates[(template_key, self.resolve_language(template_key, language))]
+        company = self.config["COMPANY"]
+        values = {
+            "company": company["name"],
+            "careers_url": company.get("careers_url", ""),
+            "site_url": company.get("site_url", ""),
+            **fields,
+        }
+        return {
+            "to": to,
+            "cc": cc,
+            "subject": subject.render(values),
+            "body_markdown": body.render(values),
+        }
+
+
+def get_template_engine(config: dict) -> EmailTemplateEngine:
+    """Compiled engine for this CONFIG version (compiled once per version, per tenant)."""
+    return version_of(config).derived("email_engine", lambda: EmailTemplateEngine(config))
+
+
+def first_name(full_name: Optional[str]) -> str:
+    parts = (full_name or "").split()
+    return parts[0] if parts else ""
@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn para el modo multi-proceso.
+
+Uso:
+    gunicorn -c gunicorn_conf.py app:app
+
+Cada worker es un proceso uvicorn independiente. La cola de trabajos, la
+caché de resultados y los eventos WebSocket se comparten mediante SQLite en
+modo WAL (ver shared_store.py y job_queue.py), y la cuota del proveedor LLM
+se reparte entre los workers (ROUTER_PROCESS_COUNT).
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("ROUTER_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("ROUTER_WORKER_TIMEOUT", "600"))
+graceful_timeout = 30
+keepalive = 5
+
+# Los workers heredan el entorno del master: así cada uno conoce su parte de la cuota
+os.environ["ROUTER_PROCESS_COUNT"] = str(workers)
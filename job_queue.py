@@ -0,0 +1,385 @@
+"""
+Cola de trabajos persistente para el Router de OCEANIX Galicia S.A.
+Almacena los trabajos en SQLite con semántica at-least-once (lease + reintentos)
+y los procesa mediante un pool configurable de workers asyncio.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from log_pipeline import logger
+from shared_store import connect_wal
+
+
+# ================================================================================
+# JOB MODEL
+# ================================================================================
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    """A queued workflow request and its current state."""
+    job_id: str
+    kind: str
+    payload: dict
+    status: str
+    attempts: int
+    created_at: float
+    updated_at: float
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    # Set (in memory) by the worker pool when cancellation is requested for a running job
+    cancel_event: Optional[asyncio.Event] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# ================================================================================
+# SQLITE QUEUE
+# ================================================================================
+
+class JobQueue:
+    """
+    Cola persistente basada en SQLite.
+
+    Un worker reclama un trabajo con un lease de `lease_seconds`; si el proceso
+    muere antes de completarlo, el lease expira y el trabajo vuelve a estar
+    disponible (at-least-once). Tras `max_attempts` fallos queda en estado failed.
+    """
+
+    def __init__(self, db_path: Path, lease_seconds: float = 300.0, max_attempts: int = 3):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # WAL: varios procesos (workers gunicorn) comparten la misma cola
+        return connect_wal(self.db_path)
+
+    def _init_schema(self) -> None:
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "cancel_requested" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            job_id=row["job_id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+    def enqueue(self, payload: dict, kind: str = "workflow") -> str:
+        """Persist a new job and return its ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), JOB_PENDING, now, now),
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Atomically take the oldest available job.
+
+        Available means pending, or running with an expired lease (the worker
+        that held it crashed or was restarted) and attempts left. An expired
+        job that already used `max_attempts` never reached `fail()` (its worker
+        died), so it is marked failed here instead of being reclaimed forever.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (JOB_FAILED, "lease expired: worker lost", now, JOB_RUNNING, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT job_id FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (JOB_PENDING, JOB_RUNNING, now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires = ?, updated_at = ? WHERE job_id = ?",
+                (JOB_RUNNING, worker_id, now + self.lease_seconds, now, row["job_id"]),
+            )
+            job_row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._row_to_job(job_row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: str, worker_id: str) -> None:
+        """Extend the lease of a job that is still being processed."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                (now + self.lease_seconds, now, job_id, worker_id, JOB_RUNNING),
+            )
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> bool:
+        """
+        Store the result of a job still leased by `worker_id`. Returns False when
+        the lease was lost (expired and reclaimed): the other worker's outcome wins.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_owner = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (JOB_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> str:
+        """
+        Record a failed attempt. The job goes back to pending until
+        `max_attempts` is reached (or fails right away with retry=False).
+        Returns the resulting status (the current one, untouched, if
+        `worker_id` no longer holds the lease).
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT status, attempts, lease_owner FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return JOB_FAILED
+            if row["lease_owner"] != worker_id:
+                return row["status"]
+            status = JOB_PENDING if retry and row["attempts"] < self.max_attempts else JOB_FAILED
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (status, error, time.time(), job_id, worker_id),
+            )
+        return status
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """
+        Ask for a job to be cancelled. Pending jobs are cancelled right away;
+        running jobs are flagged and their worker aborts them on its next check.
+        Returns the job status after the request (None if the job does not exist).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                (JOB_CANCELLED, now, job_id, JOB_PENDING),
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ? AND status = ?",
+                (now, job_id, JOB_RUNNING),
+            )
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def mark_cancelled(self, job_id: str, worker_id: str, result: Optional[dict] = None) -> bool:
+        """
+        Final state for an aborted job; result may carry the partial usage.
+        Returns False if `worker_id` no longer holds the lease.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_owner = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (JOB_CANCELLED, json.dumps(result, ensure_ascii=False) if result else None,
+                 "cancelled", time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+# ================================================================================
+# WORKER POOL
+# ================================================================================
+
+JobHandler = Callable[[Job], Awaitable[dict]]
+JobListener = Callable[[Job], Awaitable[None]]
+
+
+class JobWorkerPool:
+    """
+    Pool de workers asyncio que consume la cola.
+
+    Las llamadas a SQLite se ejecutan en un hilo (asyncio.to_thread) para no
+    bloquear el event loop. `notify()` despierta a los workers en cuanto se
+    encola un trabajo desde este mismo proceso; el polling cubre el resto.
+    Las excepciones de `no_retry` fallan el trabajo sin reintentarlo.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: JobHandler,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        listeners: Optional[List[JobListener]] = None,
+        cancel_poll_interval: float = 1.0,
+        no_retry: Tuple[type, ...] = (),
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.no_retry = no_retry
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.cancel_poll_interval = cancel_poll_interval
+        self.listeners: List[JobListener] = listeners or []
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        self._stopping = False
+        prefix = uuid.uuid4().hex[:8]
+        for i in range(self.concurrency):
+            worker_id = f"{prefix}-{i}"
+            self._tasks.append(asyncio.create_task(self._worker(worker_id), name=f"job-worker-{worker_id}"))
+
+    async def stop(self) -> None:
+        """Stop the workers. Jobs in flight keep their lease and will be retried."""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _emit(self, job: Job) -> None:
+        for listener in self.listeners:
+            try:
+                await listener(job)
+            except Exception as e:
+                logger.warning("Error notifying job update: %s", e, extra={"event": "job_listener_error"})
+
+    async def _heartbeat(self, job: Job, worker_id: str) -> None:
+        """Renew the lease and watch for cancellation requests (possibly from another process)."""
+        lease_interval = max(self.queue.lease_seconds / 3, 1.0)
+        last_renewal = time.monotonic()
+        while True:
+            await asyncio.sleep(min(self.cancel_poll_interval, lease_interval))
+            if await asyncio.to_thread(self.queue.is_cancel_requested, job.job_id):
+                job.cancel_event.set()
+            if time.monotonic() - last_renewal >= lease_interval:
+                await asyncio.to_thread(self.queue.heartbeat, job.job_id, worker_id)
+                last_renewal = time.monotonic()
+
+    async def _worker(self, worker_id: str) -> None:
+        while not self._stopping:
+            job = await asyncio.to_thread(self.queue.claim, worker_id)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job.cancel_event = asyncio.Event()
+            await self._emit(job)
+            heartbeat = asyncio.create_task(self._heartbeat(job, worker_id))
+            try:
+                result = await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if job.cancel_event.is_set():
+                    # Cancelled on request: final, never retried
+                    partial = getattr(e, "usage", None)
+                    if await asyncio.to_thread(
+                        self.queue.mark_cancelled, job.job_id, worker_id, {"usage": partial} if partial else None
+                    ):
+                        job.status = JOB_CANCELLED
+                        job.error = "cancelled"
+                    else:
+                        job.status = JOB_RUNNING
+                else:
+                    job.status = await asyncio.to_thread(
+                        self.queue.fail, job.job_id, worker_id, str(e), not isinstance(e, self.no_retry)
+                    )
+                    job.error = str(e)
+            else:
+                if await asyncio.to_thread(self.queue.complete, job.job_id, worker_id, result):
+                    job.status = JOB_DONE
+                    job.result = result
+                else:
+                    # Lease lost while running: the reclaiming worker owns the job now
+                    job.status = JOB_RUNNING
+            finally:
+                heartbeat.cancel()
+            job.updated_at = time.time()
+            await self._emit(job)
@@ -0,0 +1,270 @@
+"""
+Control de latencia de cola (p99) por agente.
+
+- Presupuestos de timeout por agente derivados del deadline global de la petición
+- Hedged requests opcionales: si la llamada supera el p95 observado para ese
+  agente (o su parte del tiempo restante) se lanza un duplicado y se usa la
+  primera respuesta que llegue
+- Métricas de cuántas veces se dispara el hedge y cuánto cuesta
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+# ================================================================================
+# CONFIGURATION - Políticas por agente (CONFIG["LATENCY_POLICY"], clave: Agent.name)
+# ================================================================================
+
+@dataclass
+class AgentCallPolicy:
+    """
+    Timeout and hedging settings for one agent.
+
+    timeout_s:        hard cap for a single call (None = only the request deadline)
+    budget_share:     fraction of the remaining request time after which a hedge fires
+    hedge:            fire a duplicate call once the primary exceeds the hedge delay
+    hedge_percentile: latency percentile used as hedge delay
+    hedge_min_samples: observations required before hedging is enabled
+    """
+    timeout_s: Optional[float] = 60.0
+    budget_share: float = 1.0
+    hedge: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+
+
+DEFAULT_CALL_POLICY = AgentCallPolicy()
+
+# Deadline global por defecto para una ejecución completa del workflow (segundos)
+DEFAULT_WORKFLOW_TIMEOUT = float(os.getenv("ROUTER_WORKFLOW_TIMEOUT", "300"))
+
+
+def call_policies(config: dict) -> Dict[str, AgentCallPolicy]:
+    """Per-agent policies from CONFIG["LATENCY_POLICY"]["agents"] (validated by config_store)."""
+    agents = (config.get("LATENCY_POLICY") or {}).get("agents") or {}
+    return {name: AgentCallPolicy(**entry) for name, entry in agents.items()}
+
+
+class AgentTimeoutError(asyncio.TimeoutError):
+    """An agent call exceeded its timeout budget."""
+
+    def __init__(self, agent_name: str, budget: float, deadline_bound: bool = False):
+        super().__init__(f"Agent '{agent_name}' exceeded its time budget ({budget:.1f}s)")
+        self.agent_name = agent_name
+        self.budget = budget
+        self.deadline_bound = deadline_bound  # The budget was the remaining request time
+
+
+# ================================================================================
+# METRICS
+# ================================================================================
+
+@dataclass
+class AgentLatencyStats:
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=500))
+    calls: int = 0
+    timeouts: int = 0
+    hedges_fired: int = 0
+    hedges_won: int = 0
+    hedge_extra_tokens_est: int = 0
+    hedge_extra_tokens: int = 0  # Tokens actually spent by losing calls
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(p * len(ordered)))
+        return ordered[index]
+
+    def to_dict(self) -> dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedge_rate": round(self.hedges_fired / self.calls, 4) if self.calls else 0.0,
+            "hedge_extra_tokens_est": self.hedge_extra_tokens_est,
+            "hedge_extra_tokens": self.hedge_extra_tokens,
+        }
+
+
+class LatencyTracker:
+    """Per-agent latency samples and hedging counters."""
+
+    def __init__(self):
+        self.agents: Dict[str, AgentLatencyStats] = {}
+
+    def stats_for(self, agent_name: str) -> AgentLatencyStats:
+        if agent_name not in self.agents:
+            self.agents[agent_name] = AgentLatencyStats()
+        return self.agents[agent_name]
+
+    def snapshot(self) -> dict:
+        return {name: stats.to_dict() for name, stats in self.agents.items()}
+
+
+latency_tracker = LatencyTracker()
+
+
+# ================================================================================
+# EXECUTION
+# ================================================================================
+
+# Llamadas perdedoras de un hedge que siguen en segundo plano hasta terminar (perdedora -> espera)
+_hedge_losers: Dict[asyncio.Task, asyncio.Task] = {}
+
+
+def compute_budget(policy: AgentCallPolicy, deadline: Optional[float]) -> Tuple[Optional[float], Optional[float], bool]:
+    """
+    Budgets for this call, given its policy and the absolute request deadline.
+
+    Returns (hard, soft, deadline_bound): `hard` is the hard cap (timeout_s or
+    the remaining request time, whichever is lower); `soft` is the policy's
+    share of the remaining time, used only as a hedge trigger; `deadline_bound`
+    tells whether the hard cap comes from the request deadline.
+    """
+    hard = policy.timeout_s
+    soft = None
+    deadline_bound = False
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.monotonic())
+        soft = remaining * policy.budget_share
+        if hard is None or remaining <= hard:
+            hard, deadline_bound = remaining, True
+    return hard, soft, deadline_bound
+
+
+def _finish_loser(
+    loser: asyncio.Task,
+    budget: Optional[float],
+    on_loser_result: Optional[Callable[[T], None]],
+) -> None:
+    """Let the losing call finish (its tokens are already spent) and report its result."""
+    async def wait_loser():
+        try:
+            result = await asyncio.wait_for(loser, timeout=budget)
+        except (Exception, asyncio.CancelledError):
+            return
+        if on_loser_result is not None:
+            on_loser_result(result)
+
+    _hedge_losers[loser] = asyncio.create_task(wait_loser())
+    _hedge_losers[loser].add_done_callback(lambda _: _hedge_losers.pop(loser, None))
+
+
+async def _race(
+    primary: asyncio.Task,
+    hedge_delay: float,
+    hedge_call: Callable[[], Awaitable[T]],
+    stats: AgentLatencyStats,
+    estimated_tokens: int,
+    on_resolved: Optional[Callable[[bool], Awaitable[None]]],
+    on_loser_result: Optional[Callable[[T], None]],
+    loser_budget: Optional[float],
+) -> T:
+    """
+    Wait for primary; after hedge_delay fire a duplicate and return the first success.
+
+    `on_resolved(hedge_won)` runs before returning so the caller can route the
+    winner's hook events; the loser is left to finish and reported through
+    `on_loser_result`.
+    """
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result()
+
+    stats.hedges_fired += 1
+    stats.hedge_extra_tokens_est += estimated_tokens
+    hedge = asyncio.create_task(hedge_call())
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        stats.hedges_won += 1
+                    if on_resolved is not None:
+                        await on_resolved(task is hedge)
+                    for loser in pending:
+                        _finish_loser(loser, loser_budget, on_loser_result)
+                    pending = set()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_policy(
+    agent_name: str,
+    call: Callable[[], Awaitable[T]],
+    *,
+    policy: AgentCallPolicy = DEFAULT_CALL_POLICY,
+    deadline: Optional[float] = None,
+    estimated_tokens: int = 0,
+    tracker: LatencyTracker = latency_tracker,
+    hedge_call: Optional[Callable[[], Awaitable[T]]] = None,
+    on_resolved: Optional[Callable[[bool], Awaitable[None]]] = None,
+    on_loser_result: Optional[Callable[[T], None]] = None,
+) -> T:
+    """
+    Run `call()` under the agent's timeout budget, hedging it if `policy.hedge`.
+
+    The hedge fires at the observed latency percentile or once the call uses
+    up its `budget_share` of the remaining request time, whichever comes
+    first; only the hard cap (timeout_s / request deadline) aborts the call.
+    `hedge_call` (default: `call`) starts the duplicate.
+
+    Raises:
+        AgentTimeoutError: if the hard budget is exhausted before a response arrives
+    """
+    stats = tracker.stats_for(agent_name)
+    stats.calls += 1
+    budget, soft_budget, deadline_bound = compute_budget(policy, deadline)
+    if budget is not None and budget <= 0:
+        stats.timeouts += 1
+        raise AgentTimeoutError(agent_name, 0.0, deadline_bound)
+
+    hedge_delay = None
+    if policy.hedge:
+        if len(stats.samples) >= policy.hedge_min_samples:
+            hedge_delay = stats.percentile(policy.hedge_percentile)
+        if soft_budget is not None:
+            hedge_delay = soft_budget if hedge_delay is None else min(hedge_delay, soft_budget)
+
+    started = time.monotonic()
+    primary = asyncio.create_task(call())
+    try:
+        if hedge_delay is not None and (budget is None or hedge_delay < budget):
+            race = _race(primary, hedge_delay, hedge_call or call, stats, estimated_tokens,
+                         on_resolved, on_loser_result, budget)
+            result = await asyncio.wait_for(race, timeout=budget)
+        else:
+            result = await asyncio.wait_for(primary, timeout=budget)
+    except asyncio.TimeoutError:
+        stats.timeouts += 1
+        # Censored sample: the call took at least this long
+        stats.samples.append(time.monotonic() - started)
+        raise AgentTimeoutError(agent_name, budget or 0.0, deadline_bound) from None
+    finally:
+        if not primary.done() and primary not in _hedge_losers:
+            primary.cancel()
+
+    stats.samples.append(time.monotonic() - started)
+    return result
+
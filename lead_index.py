@@ -0,0 +1,366 @@
+"""
+Índice de cuentas comerciales: agrupa los leads (SalesExtractSchema) por empresa.
+
+Una misma empresa suele escribir desde varios contactos. Cada lead procesado se
+asigna a una cuenta por el dominio del email (salvo correos gratuitos) o, si no
+coincide ninguno, por el nombre de empresa normalizado ("Pescados Rías Baixas,
+S.L." → "pescados rias baixas") con búsqueda difusa en un índice de trigramas.
+La vista de cuenta (contactos, leads, mejor score, productos) acompaña al
+borrador para comercial@ y al payload (ver router.SALES_ROUTE).
+
+También guarda la extracción de cada mensaje: un mismo mensaje reenviado
+(mismo texto y mismo prompt del extractor) reutiliza la extracción anterior.
+
+Persistencia en SQLite (WAL, ROUTER_LEAD_INDEX_DB); cada proceso mantiene el
+índice en memoria y carga de forma incremental lo escrito por otros procesos.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from cv_index import normalize_text
+from shared_store import connect_wal
+
+ROOT = Path(__file__).parent
+
+LEAD_INDEX_PATH = Path(os.getenv("ROUTER_LEAD_INDEX_DB", ROOT / "var" / "lead_index.sqlite3"))
+# Similitud mínima (Dice sobre trigramas) entre nombres de empresa normalizados
+COMPANY_SIMILARITY = float(os.getenv("ROUTER_COMPANY_SIMILARITY", "0.8"))
+RECENT_LEADS = 5  # Leads recientes incluidos en la vista de cuenta
+
+# Dominios de correo gratuito: no identifican a una empresa
+FREE_MAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "yahoo.es", "hotmail.com", "hotmail.es", "outlook.com",
+    "outlook.es", "live.com", "msn.com", "icloud.com", "me.com", "aol.com", "gmx.com", "gmx.es",
+    "protonmail.com", "proton.me", "telefonica.net", "movistar.es",
+}
+
+# Formas jurídicas y palabras que no distinguen a una empresa
+_COMPANY_NOISE = {
+    "sa", "sl", "slu", "sll", "sau", "slne", "sc", "scoop", "coop", "cb", "ltd", "limited", "inc", "llc",
+    "gmbh", "ag", "sas", "sarl", "srl", "spa", "bv", "nv", "plc", "co", "corp", "corporation", "company",
+    "cia", "de", "del", "la", "las", "el", "los", "y", "e", "the", "and", "of",
+}
+
+
+def company_key(name: str) -> str:
+    """Normalized company name: no accents, punctuation, legal form or filler words."""
+    text = normalize_text(name).replace(".", "")
+    return " ".join(word for word in re.findall(r"[a-z0-9]+", text) if word not in _COMPANY_NOISE)
+
+
+def email_domain(email: str) -> Optional[str]:
+    """Company domain of an email address (None for free-mail providers or invalid addresses)."""
+    local, at, domain = email.strip().lower().rpartition("@")
+    if not at or not local or not domain or "." not in domain or domain in FREE_MAIL_DOMAINS:
+        return None
+    return domain.removeprefix("www.")
+
+
+# ================================================================================
+# TRIGRAM INDEX
+# ================================================================================
+
+class TrigramIndex:
+    """Fuzzy string lookup: postings from trigram to item ids, ranked by Dice coefficient."""
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        self.grams: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, item_id: str, text: str) -> None:
+        grams = self.trigrams(text)
+        self.grams[item_id] = grams
+        for gram in grams:
+            self.postings[gram].add(item_id)
+
+    def search(self, text: str, min_similarity: float) -> List[Tuple[float, str]]:
+        grams = self.trigrams(text)
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        matches = []
+        for item_id, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(self.grams[item_id]))
+            if similarity >= min_similarity:
+                matches.append((similarity, item_id))
+        return sorted(matches, reverse=True)
+
+
+# ================================================================================
+# ACCOUNTS
+# ================================================================================
+
+@dataclass
+class Account:
+    account_id: str
+    tenant_id: str
+    name: str
+    name_key: str
+    created_at: float
+    domains: Set[str] = field(default_factory=set)
+    leads: List[dict] = field(default_factory=list)  # Resumen de cada lead, en orden de llegada
+
+    def view(self) -> dict:
+        """Account-level aggregate of every lead merged into it."""
+        contacts: Dict[str, dict] = {}
+        products: Dict[str, None] = {}
+        for lead in self.leads:
+            key = lead["contact_email"].lower() or lead["contact_name"]
+            contacts[key] = {"name": lead["contact_name"], "email": lead["contact_email"], "title": lead["title"]}
+            products.update(dict.fromkeys(lead["product_interest"]))
+        best = max(self.leads, key=lambda lead: lead["lead_score"], default=None)
+        return {
+            "account_id": self.account_id,
+            "tenant_id": self.tenant_id,
+            "name": self.name,
+            "domains": sorted(self.domains),
+            "leads": len(self.leads),
+            "first_seen": self.leads[0]["created_at"] if self.leads else self.created_at,
+            "last_seen": self.leads[-1]["created_at"] if self.leads else self.created_at,
+            "best_score": best["lead_score"] if best else None,
+            "best_priority": best["priority"] if best else None,
+            "contacts": list(contacts.values()),
+            "product_interest": list(products),
+            "recent_leads": self.leads[-RECENT_LEADS:],
+        }
+
+
+def lead_summary(lead_id: int, created_at: float, run_id: Optional[str], extract: dict) -> dict:
+    return {
+        "lead_id": lead_id,
+        "run_id": run_id,
+        "created_at": created_at,
+        "contact_name": extract.get("contact_name", ""),
+        "contact_email": extract.get("contact_email", ""),
+        "title": extract.get("title", ""),
+        "lead_score": extract.get("lead_score", 0),
+        "priority": extract.get("priority"),
+        "product_interest": extract.get("product_interest", []),
+        "intent_summary": extract.get("intent_summary", ""),
+    }
+
+
+class _Tenant:
+    """In-memory accounts of one tenant with their domain, name and trigram lookups."""
+
+    def __init__(self):
+        self.accounts: Dict[str, Account] = {}
+        self.by_domain: Dict[str, str] = {}
+        self.by_key: Dict[str, str] = {}
+        self.names = TrigramIndex()
+
+    def add_account(self, account: Account) -> None:
+        self.accounts[account.account_id] = account
+        if account.name_key:
+            self.by_key.setdefault(account.name_key, account.account_id)
+            self.names.add(account.account_id, account.name_key)
+
+    def resolve(self, company: str, email: str) -> Tuple[Optional[Account], str]:
+        """Existing account of a lead and how it matched: "domain", "name", "similar_name" or "new"."""
+        domain = email_domain(email)
+        if domain and domain in self.by_domain:
+            return self.accounts[self.by_domain[domain]], "domain"
+        key = company_key(company)
+        if not key:
+            return None, "new"
+        if key in self.by_key:
+            return self.accounts[self.by_key[key]], "name"
+        for _, account_id in self.names.search(key, COMPANY_SIMILARITY):
+            account = self.accounts[account_id]
+            # Con dominios corporativos distintos son empresas distintas aunque el nombre se parezca
+            if domain is None or not account.domains:
+                return account, "similar_name"
+        return None, "new"
+
+
+class LeadIndex:
+    """
+    Company/domain index of processed sales leads, persisted in SQLite.
+
+    record() resolves (or creates) the account of a lead and stores it inside
+    one write transaction after catching up with other processes, so workers
+    agree on accounts. Lookups only touch memory.
+    """
+
+    def __init__(self, db_path: Path = LEAD_INDEX_PATH):
+        self.db_path = Path(db_path)
+        self._tenants: Dict[str, _Tenant] = defaultdict(_Tenant)
+        self._account_tenant: Dict[str, str] = {}
+        self._cursors = {"accounts": 0, "account_domains": 0, "leads": 0}
+        self._lock = threading.RLock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+        self.refresh()
+
+    def _init_schema(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS accounts (
+                    account_id TEXT PRIMARY KEY,
+                    tenant_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    name TEXT NOT NULL,
+                    name_key TEXT NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS account_domains (
+                    tenant_id TEXT NOT NULL,
+                    domain TEXT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    PRIMARY KEY (tenant_id, domain)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS leads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    account_id TEXT NOT NULL,
+                    tenant_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    run_id TEXT,
+                    input_hash TEXT,
+                    prompt_hash TEXT,
+                    extract TEXT NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_input ON leads (tenant_id, input_hash)")
+
+    # ---------------------------- Sync ----------------------------
+
+    def refresh(self) -> None:
+        """Load accounts, domains and leads written since the last refresh (also by other processes)."""
+        with self._lock, connect_wal(self.db_path) as conn:
+            self._refresh(conn)
+
+    def _refresh(self, conn) -> None:
+        for row in conn.execute(
+            "SELECT rowid, * FROM accounts WHERE rowid > ? ORDER BY rowid", (self._cursors["accounts"],)
+        ):
+            self._cursors["accounts"] = row["rowid"]
+            self._account_tenant[row["account_id"]] = row["tenant_id"]
+            self._tenants[row["tenant_id"]].add_account(
+                Account(row["account_id"], row["tenant_id"], row["name"], row["name_key"], row["created_at"])
+            )
+        for row in conn.execute(
+            "SELECT rowid, * FROM account_domains WHERE rowid > ? ORDER BY rowid", (self._cursors["account_domains"],)
+        ):
+            self._cursors["account_domains"] = row["rowid"]
+            tenant = self._tenants[row["tenant_id"]]
+            tenant.by_domain[row["domain"]] = row["account_id"]
+            tenant.accounts[row["account_id"]].domains.add(row["domain"])
+        for row in conn.execute(
+            "SELECT id, account_id, tenant_id, created_at, run_id, extract FROM leads WHERE id > ? ORDER BY id",
+            (self._cursors["leads"],),
+        ):
+            self._cursors["leads"] = row["id"]
+            account = self._tenants[row["tenant_id"]].accounts[row["account_id"]]
+            account.leads.append(lead_summary(row["id"], row["created_at"], row["run_id"], json.loads(row["extract"])))
+
+    # ---------------------------- Writes ----------------------------
+
+    def record(
+        self,
+        tenant_id: str,
+        extract: dict,
+        *,
+        run_id: Optional[str] = None,
+        input_hash: Optional[str] = None,
+        prompt_hash: Optional[str] = None,
+    ) -> dict:
+        """Merge a SalesExtractSchema dict into its account; returns the account view plus how it matched."""
+        now = time.time()
+        with self._lock, connect_wal(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")  # Un escritor a la vez entre procesos
+            try:
+                self._refresh(conn)
+                tenant = self._tenants[tenant_id]
+                account, matched_by = tenant.resolve(extract.get("company", ""), extract.get("contact_email", ""))
+                repeat = account is not None and bool(account.leads)
+                if account is None:
+                    account = Account(
+                        uuid.uuid4().hex, tenant_id, extract.get("company", ""),
+                        company_key(extract.get("company", "")), now,
+                    )
+                    conn.execute(
+                        "INSERT INTO accounts VALUES (?, ?, ?, ?, ?)",
+                        (account.account_id, tenant_id, now, account.name, account.name_key),
+                    )
+                domain = email_domain(extract.get("contact_email", ""))
+                if domain and domain not in tenant.by_domain:
+                    conn.execute("INSERT INTO account_domains VALUES (?, ?, ?)", (tenant_id, domain, account.account_id))
+                conn.execute(
+                    """INSERT INTO leads (account_id, tenant_id, created_at, run_id, input_hash, prompt_hash, extract)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (account.account_id, tenant_id, now, run_id, input_hash, prompt_hash, json.dumps(extract, ensure_ascii=False)),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            # El propio registro se carga como cualquier otro (mismo camino que los de otros procesos)
+            self._refresh(conn)
+            account = self._tenants[tenant_id].accounts[account.account_id]
+            return {**account.view(), "matched_by": matched_by, "repeat": repeat}
+
+    # ---------------------------- Reads ----------------------------
+
+    def find_extraction(self, tenant_id: str, input_hash: str, prompt_hash: str) -> Optional[dict]:
+        """Earlier extraction of the same message with the same extractor prompt, if any."""
+        with connect_wal(self.db_path) as conn:
+            row = conn.execute(
+                """SELECT extract FROM leads WHERE tenant_id = ? AND input_hash = ? AND prompt_hash = ?
+                   ORDER BY id DESC LIMIT 1""",
+                (tenant_id, input_hash, prompt_hash),
+            ).fetchone()
+        return json.loads(row["extract"]) if row is not None else None
+
+    def account(self, account_id: str) -> Optional[dict]:
+        with self._lock:
+            self.refresh()
+            tenant_id = self._account_tenant.get(account_id)
+            if tenant_id is None:
+                return None
+            return self._tenants[tenant_id].accounts[account_id].view()
+
+    def search(self, tenant_id: str, query: str, limit: int = 20) -> List[dict]:
+        """Accounts whose name or domain resembles `query`, best match first."""
+        with self._lock:
+            self.refresh()
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                return []
+            domain = email_domain(query) or query.strip().lower()
+            found: Dict[str, float] = {}
+            if domain in tenant.by_domain:
+                found[tenant.by_domain[domain]] = 1.0
+            key = company_key(query)
+            if key:
+                for similarity, account_id in tenant.names.search(key, min(COMPANY_SIMILARITY, 0.5)):
+                    found.setdefault(account_id, similarity)
+            ranked = sorted(found.items(), key=lambda item: -item[1])[:limit]
+            return [{**tenant.accounts[account_id].view(), "similarity": round(score, 3)} for account_id, score in ranked]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                tenant_id: {
+                    "accounts": len(tenant.accounts),
+                    "leads": sum(len(account.leads) for account in tenant.accounts.values()),
+                    "repeat_accounts": sum(len(account.leads) > 1 for account in tenant.accounts.values()),
+                }
+                for tenant_id, tenant in self._tenants.items()
+            }
@@ -0,0 +1,239 @@
+"""
+Pipeline de logging estructurado y de bajo coste para el router.
+
+- Los registros se encolan en una cola acotada y los escribe un hilo de fondo
+  (QueueListener); si la cola se llena se descartan en lugar de bloquear.
+- Niveles: INFO muestra el flujo de agentes y el uso de tokens; DEBUG añade
+  prompts, entradas y salidas completas.
+- Muestreo opcional de los registros DEBUG.
+- Serialización perezosa: los objetos pesados (prompts, modelos Pydantic,
+  mensajes multi-modales) solo se convierten a texto si el registro se emite.
+
+Variables de entorno: ROUTER_LOG_LEVEL, ROUTER_LOG_FORMAT (text|json),
+ROUTER_LOG_SAMPLE_RATE, ROUTER_LOG_QUEUE_SIZE.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Any, Optional
+
+
+LOGGER_NAME = "router"
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Campos estructurados que se pasan vía `extra=` y se incluyen en el formato JSON
+STRUCTURED_FIELDS = ("event", "agent", "step", "run_id", "requests", "input_tokens", "output_tokens", "total_tokens")
+
+
+# ================================================================================
+# LAZY VALUES - Serializados solo al emitir el registro
+# ================================================================================
+
+class LazyJSON:
+    """Pretty JSON of a dict/list/Pydantic model, computed on str()."""
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: Optional[int] = None):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        value = self.value
+        if hasattr(value, "model_dump"):
+            value = value.model_dump(by_alias=True)
+        if isinstance(value, (dict, list)):
+            text = json.dumps(value, ensure_ascii=False, indent=2, default=str)
+        else:
+            text = str(value)
+        return truncate(text, self.max_chars)
+
+
+class LazyText:
+    """Truncated text, or the joined str() of a list of items, computed on str()."""
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: Optional[int] = None):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        if self.value is None:
+            return ""
+        if isinstance(self.value, str):
+            return truncate(self.value, self.max_chars)
+        parts = []
+        size = 0
+        for item in self.value:
+            part = str(item)
+            parts.append(part)
+            size += len(part)
+            if self.max_chars is not None and size > self.max_chars:
+                break
+        return truncate("\n".join(parts), self.max_chars)
+
+
+class LazyInputSummary:
+    """One-line-per-part summary of a multi-modal input, without dumping base64 data."""
+
+    __slots__ = ("messages", "preview_chars")
+
+    def __init__(self, messages: list, preview_chars: int = 100):
+        self.messages = messages
+        self.preview_chars = preview_chars
+
+    def __str__(self) -> str:
+        lines = ["[MULTI-MODAL INPUT - Messages with files]"]
+        for msg in self.messages:
+            if not isinstance(msg, dict):
+                continue
+            lines.append(f"  Role: {msg.get('role', 'user')}")
+            content = msg.get("content", [])
+            if isinstance(content, str):
+                lines.append(f"    - Text: {content[:self.preview_chars]}...")
+            elif isinstance(content, list):
+                for item in content:
+                    if not isinstance(item, dict):
+                        continue
+                    item_type = item.get("type", "unknown")
+                    if item_type == "input_file":
+                        lines.append(f"    - File: {item.get('filename', 'file')}")
+                    elif item_type == "input_image":
+                        lines.append("    - Image (base64)")
+                    elif item_type in ("text", "input_text"):
+                        lines.append(f"    - Text: {item.get('text', '')[:self.preview_chars]}...")
+        return "\n".join(lines)
+
+
+def truncate(text: str, max_chars: Optional[int]) -> str:
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"\n...[{len(text) - max_chars} chars truncados]..."
+
+
+# ================================================================================
+# HANDLERS & FILTERS
+# ================================================================================
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at or below `max_level` (DEBUG by default)."""
+
+    def __init__(self, rate: float, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking queue handler.
+
+    Unlike the stdlib QueueHandler it does not format the record in the
+    caller: lazy arguments are rendered by the writer thread, only for
+    records that actually get written. When the queue is full the record is
+    dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields of the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in STRUCTURED_FIELDS:
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# ================================================================================
+# SETUP
+# ================================================================================
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[BoundedQueueHandler] = None
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    queue_size: Optional[int] = None,
+    stream=None,
+) -> logging.Logger:
+    """
+    Install the queue-backed pipeline on the "router" logger (idempotent).
+
+    Entry points (CLI, FastAPI app, benchmarks) call this once at startup.
+    """
+    global _listener, _queue_handler
+
+    level = (level or os.getenv("ROUTER_LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("ROUTER_LOG_FORMAT", "text")
+    sample_rate = sample_rate if sample_rate is not None else float(os.getenv("ROUTER_LOG_SAMPLE_RATE", "1.0"))
+    queue_size = queue_size or int(os.getenv("ROUTER_LOG_QUEUE_SIZE", "10000"))
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _queue_handler = BoundedQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(sample_rate))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    logger.handlers = [_queue_handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def shutdown_logging() -> None:
+    """Flush pending records and stop the writer thread."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+atexit.register(shutdown_logging)
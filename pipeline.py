@@ -0,0 +1,258 @@
+"""
+Motor de pipelines declarativos (DAG) para el router.
+
+Cada ruta se describe como un conjunto de nodos con sus dependencias; el
+ejecutor lanza en paralelo todos los nodos cuyas entradas ya están resueltas,
+de modo que el paralelismo sale del grafo y no del código de cada rama.
+
+- inputs: dependencias de datos (el nodo recibe sus valores)
+- after/when: dependencias de control; si `when` es falso el nodo se omite
+  (y con él, los nodos que dependen de su salida)
+- speculative: el nodo arranca con sus inputs, sin esperar a `after`; si luego
+  `when` resulta falso se cancela (o se descarta su resultado)
+- cache_key: caché LRU por nodo, compartida entre ejecuciones
+- retries: reintentos con backoff exponencial ante errores
+- known: valores ya conocidos (p. ej. de otra etapa o de una grabación); los
+  nodos correspondientes no se ejecutan
+"""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class _Skipped:
+    """Marker value of a node whose `when` was false (or that depends on one)."""
+
+    def __repr__(self) -> str:
+        return "SKIPPED"
+
+
+SKIPPED = _Skipped()
+
+NodeFn = Callable[[Dict[str, Any], Any], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class Node:
+    name: str
+    run: NodeFn  # async (values, state) -> output
+    inputs: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+    when: Optional[Callable[[Dict[str, Any]], bool]] = None
+    speculative: bool = False
+    cache_key: Optional[Callable[[Dict[str, Any], Any], str]] = None  # (values, state) -> key
+    retries: int = 0
+    agent: Optional[str] = None  # Agente que ejecuta el nodo (solo informativo: logs, métricas)
+    on_cached: Optional[Callable[[Dict[str, Any], Any, Any], None]] = None  # (values, state, output) en aciertos de caché
+
+    @property
+    def dependencies(self) -> Tuple[str, ...]:
+        return self.inputs + self.after
+
+
+class PipelineError(ValueError):
+    """Invalid pipeline definition (unknown dependency or cycle)."""
+
+
+class Pipeline:
+    """A validated DAG of nodes; `outputs` lists candidate result nodes (first non-skipped wins)."""
+
+    def __init__(self, name: str, nodes: Iterable[Node], outputs: Tuple[str, ...], sources: Tuple[str, ...] = ()):
+        self.name = name
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self.nodes or node.name in sources:
+                raise PipelineError(f"{name}: duplicate node '{node.name}'")
+            self.nodes[node.name] = node
+        self.outputs = outputs
+        self.sources = sources  # Valores que debe aportar quien ejecuta (known)
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}  # 1 = visitando, 2 = hecho
+
+        def visit(name: str, path: Tuple[str, ...]) -> None:
+            if name in self.sources or state.get(name) == 2:
+                return
+            if name not in self.nodes:
+                raise PipelineError(f"{self.name}: '{path[-1]}' depends on unknown node '{name}'")
+            if state.get(name) == 1:
+                raise PipelineError(f"{self.name}: cycle {' → '.join(path + (name,))}")
+            state[name] = 1
+            for dep in self.nodes[name].dependencies:
+                visit(dep, path + (name,))
+            state[name] = 2
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, ())
+        for output in self.outputs:
+            if output not in self.nodes:
+                raise PipelineError(f"{self.name}: unknown output node '{output}'")
+        return order
+
+    def result(self, values: Dict[str, Any]) -> Any:
+        for output in self.outputs:
+            value = values.get(output, SKIPPED)
+            if value is not SKIPPED:
+                return value
+        return SKIPPED
+
+
+class NodeCache:
+    """Small in-process LRU shared by every pipeline run."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return SKIPPED
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class PipelineExecutor:
+    """
+    Runs a Pipeline: every node starts as soon as its dependencies are resolved.
+
+    If a node fails (after its retries) the nodes still running are cancelled
+    and the error propagates. Exceptions listed in `no_retry` are never retried.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[NodeCache] = None,
+        no_retry: Tuple[type, ...] = (),
+        retry_backoff: float = 0.5,
+        on_speculation: Optional[Callable[[Node, bool, Any], Awaitable[None]]] = None,
+    ):
+        self.cache = cache or NodeCache()
+        self.no_retry = no_retry
+        self.retry_backoff = retry_backoff
+        self.on_speculation = on_speculation  # (node, used, state): resultado de cada nodo especulativo
+
+    async def _run_node(self, node: Node, values: Dict[str, Any], state: Any) -> Any:
+        key = node.cache_key(values, state) if node.cache_key is not None else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not SKIPPED:
+                if node.on_cached is not None:
+                    node.on_cached(values, state, cached)
+                return cached
+        attempt = 0
+        while True:
+            try:
+                output = await node.run(values, state)
+                break
+            except Exception as e:
+                if attempt >= node.retries or isinstance(e, self.no_retry):
+                    raise
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+                attempt += 1
+        if key is not None:
+            self.cache.set(key, output)
+        return output
+
+    async def execute(self, pipeline: Pipeline, state: Any, known: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run every node not already in `known`; returns all values (skipped nodes map to SKIPPED)."""
+        values: Dict[str, Any] = dict(known or {})
+        missing = [source for source in pipeline.sources if source not in values]
+        if missing:
+            raise PipelineError(f"{pipeline.name}: missing source values {missing}")
+
+        pending = [name for name in pipeline.order if name not in values]
+        running: Dict[asyncio.Task, Node] = {}
+        # Nodos especulativos lanzados cuya condición (after/when) aún no se conoce
+        speculating: Dict[str, asyncio.Task] = {}
+
+        def resolved(names: Tuple[str, ...]) -> bool:
+            return all(name in values for name in names)
+
+        def start(node: Node) -> asyncio.Task:
+            return asyncio.create_task(self._run_node(node, values, state))
+
+        try:
+            while pending:
+                progressed = False
+                for name in list(pending):
+                    node = pipeline.nodes[name]
+                    if name in speculating:
+                        if not resolved(node.after):
+                            continue
+                        # Condición resuelta: conservar o descartar la ejecución especulativa
+                        task = speculating.pop(name)
+                        pending.remove(name)
+                        progressed = True
+                        used = node.when is None or node.when(values)
+                        if used:
+                            running[task] = node
+                        else:
+                            task.cancel()
+                            await asyncio.gather(task, return_exceptions=True)
+                            values[name] = SKIPPED
+                        if self.on_speculation:
+                            await self.on_speculation(node, used, state)
+                        continue
+                    if not resolved(node.inputs):
+                        continue
+                    if any(values[dep] is SKIPPED for dep in node.inputs):
+                        values[name] = SKIPPED
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    if not resolved(node.after):
+                        if node.speculative:
+                            speculating[name] = start(node)
+                            progressed = True
+                        continue
+                    pending.remove(name)
+                    progressed = True
+                    if node.when is not None and not node.when(values):
+                        values[name] = SKIPPED
+                        continue
+                    running[start(node)] = node
+                if progressed or not pending:
+                    continue
+
+                waiting = set(running) | {task for task in speculating.values() if not task.done()}
+                if not waiting:
+                    raise PipelineError(f"{pipeline.name}: unresolvable nodes {pending}")
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = running.pop(task, None)
+                    result = task.result()  # Propaga errores (también de nodos especulativos)
+                    if node is not None:
+                        values[node.name] = result
+
+            # Nodos especulativos aceptados que siguen en curso
+            for task, node in list(running.items()):
+                values[node.name] = await task
+                running.pop(task)
+        except BaseException:
+            tasks = list(running) + list(speculating.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.on_speculation:
+                for name in speculating:
+                    await self.on_speculation(pipeline.nodes[name], False, state)
+            raise
+        return values
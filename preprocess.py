@@ -0,0 +1,287 @@
+"""
+Preprocesado de la entrada con presupuesto de tokens por etapa.
+
+guardrails devuelve el texto completo (safe_text); hilos largos con respuestas
+citadas, firmas, avisos legales o adjuntos pegados multiplican los tokens de
+cada agente que lo recibe. InputViews limpia el texto una vez por ejecución y da
+a cada etapa una vista acotada (CONFIG["INPUT_POLICY"]):
+
+- "classifier" (intent_agent): asunto + los primeros N tokens del cuerpo limpio.
+- "cv" / "sales" (extractores): el cuerpo limpio si cabe; si no, los fragmentos
+  más relevantes según heurísticas locales (palabras clave de la etapa, datos de
+  contacto), en su orden original, más la firma (título y teléfono del contacto).
+
+Los tokens se cuentan con tiktoken si está instalado (opcional); si no, con la
+misma aproximación que el scheduler (≈4 caracteres por token).
+"""
+
+import math
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+GAP_MARKER = "[…]"  # Marca de fragmentos omitidos en las vistas de los extractores
+
+
+# ================================================================================
+# TOKENIZER
+# ================================================================================
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """First max_tokens tokens of text (cut at a word boundary with the approximate tokenizer)."""
+    encoding = _encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
+
+
+# ================================================================================
+# CLEANING
+# ================================================================================
+
+_QUOTED_LINE = re.compile(r"^\s*>")
+# Inicio del historial citado de una respuesta
+_REPLY_MARKERS = [
+    re.compile(r"^\s*-{2,}\s*(original message|mensaje original|mensagem original)\s*-{2,}\s*$", re.I),
+    re.compile(r"^\s*(on|el|em)\s.{5,200}\s(wrote|escribió|escreveu)\s*:\s*$", re.I),
+]
+# Cabecera de Outlook: "De:/From:" seguida de "Enviado:/Sent:/Fecha:/Date:" en las líneas siguientes
+_OUTLOOK_FROM = re.compile(r"^\s*\*?(de|from)\s*:\*?\s", re.I)
+_OUTLOOK_SENT = re.compile(r"^\s*\*?(enviado|sent|fecha|date)\s*:\*?\s", re.I)
+_SIGNATURE_DELIMITER = re.compile(r"^--\s?$")
+_MOBILE_FOOTER = re.compile(r"^\s*(enviado desde mi|sent from my|get outlook for)\b", re.I)
+_BOILERPLATE = re.compile(
+    r"confidencial|confidential|aviso legal|legal notice|disclaimer|protecci[oó]n de datos|rgpd|gdpr"
+    r"|destinatario|intended recipient|antes de imprimir|before printing|medio ?ambiente|environment"
+    r"|darse de baja|unsubscribe",
+    re.I,
+)
+_SUBJECT = re.compile(r"^\s*(asunto|subject)\s*:\s*(.+)$", re.I | re.M)
+_CONTACT = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+|\+?\d[\d\s().-]{7,}\d")
+
+
+@dataclass(frozen=True)
+class CleanText:
+    subject: str
+    body: str
+    signature: str
+
+
+def _cut_reply_history(lines: List[str]) -> List[str]:
+    seen_content = False
+    for i, line in enumerate(lines):
+        if seen_content:
+            if any(marker.match(line) for marker in _REPLY_MARKERS):
+                return lines[:i]
+            if _OUTLOOK_FROM.match(line) and any(_OUTLOOK_SENT.match(l) for l in lines[i + 1:i + 4]):
+                return lines[:i]
+        if line.strip() and not _SUBJECT.match(line):
+            seen_content = True
+    return lines
+
+
+def _is_boilerplate(paragraph: str) -> bool:
+    # Párrafos de aviso legal: varias coincidencias y ninguna señal de contenido propio (contacto)
+    return len(_BOILERPLATE.findall(paragraph)) >= 2 and len(paragraph) < 2000 and not _CONTACT.search(paragraph)
+
+
+def clean_text(text: str) -> CleanText:
+    """Split a message into subject, body (no quoted history, boilerplate or mobile footers) and signature."""
+    subject_match = _SUBJECT.search(text[:2000])
+    subject = subject_match.group(2).strip() if subject_match else ""
+
+    lines = [line for line in text.replace("\r\n", "\n").split("\n") if not _QUOTED_LINE.match(line)]
+    lines = _cut_reply_history(lines)
+    lines = [line for line in lines if not _MOBILE_FOOTER.match(line)]
+    signature: List[str] = []
+    for i, line in enumerate(lines):
+        if _SIGNATURE_DELIMITER.match(line):
+            lines, signature = lines[:i], lines[i + 1:]
+            break
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", "\n".join(lines))]
+    body = "\n\n".join(p for p in paragraphs if p and not _is_boilerplate(p))
+    signature_text = "\n".join(l.strip() for l in signature if l.strip())
+    if _is_boilerplate(signature_text):
+        signature_text = ""
+    return CleanText(subject, re.sub(r"[ \t]+\n", "\n", body), signature_text)
+
+
+# ================================================================================
+# CHUNK SELECTION
+# ================================================================================
+
+# Palabras clave por extractor (raíces, sin tildes ni mayúsculas)
+STAGE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "cv": (
+        "experien", "años", "anos", "years", "habilidad", "skill", "competenc", "certific", "titulaci", "formaci",
+        "educat", "estudios", "licencia", "licen", "idioma", "language", "disponib", "availab", "puesto", "cargo",
+        "position", "empresa", "company", "curriculum", "perfil", "profile", "responsab", "logros", "carnet",
+    ),
+    "sales": (
+        "pedido", "order", "compra", "purchas", "cotizaci", "presupuesto", "quote", "precio", "price", "tarifa",
+        "volumen", "volume", "tonelada", "kg", "kilos", "mensual", "semanal", "monthly", "weekly", "contrato",
+        "contract", "suministr", "supply", "plazo", "fecha", "deadline", "temporada", "msc", "ifs", "iso", "brc",
+        "trazabilidad", "traceab", "certific", "director", "gerente", "ceo", "compras", "procurement", "producto",
+    ),
+}
+
+
+def split_chunks(text: str, chunk_tokens: int) -> List[str]:
+    """Paragraphs merged (or long ones split by lines) into chunks of about chunk_tokens."""
+    pieces: List[str] = []
+    for paragraph in text.split("\n\n"):
+        if count_tokens(paragraph) <= chunk_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(line for line in paragraph.split("\n") if line.strip())
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and size + tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        if tokens > chunk_tokens:
+            piece = truncate_tokens(piece, chunk_tokens)
+            tokens = chunk_tokens
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def chunk_score(chunk: str, keywords: Tuple[str, ...]) -> float:
+    lowered = chunk.lower()
+    hits = sum(lowered.count(keyword) for keyword in keywords) + 2 * len(_CONTACT.findall(chunk))
+    return hits / math.sqrt(max(count_tokens(chunk), 1))
+
+
+def select_chunks(text: str, keywords: Tuple[str, ...], budget: int, chunk_tokens: int) -> str:
+    """The first chunk plus the best-scoring ones that fit in budget, in their original order."""
+    chunks = split_chunks(text, chunk_tokens)
+    sizes = [count_tokens(chunk) for chunk in chunks]
+    chosen = {0}
+    used = sizes[0]
+    ranked = sorted(range(1, len(chunks)), key=lambda i: -chunk_score(chunks[i], keywords))
+    for i in ranked:
+        if used + sizes[i] <= budget:
+            chosen.add(i)
+            used += sizes[i]
+    parts: List[str] = []
+    for i in sorted(chosen):
+        if parts and i - 1 not in chosen:
+            parts.append(GAP_MARKER)
+        parts.append(chunks[i])
+    if max(chosen) < len(chunks) - 1:
+        parts.append(GAP_MARKER)
+    return "\n\n".join(parts)
+
+
+# ================================================================================
+# VIEWS
+# ================================================================================
+
+class PreprocessStats:
+    """Tokens of the full safe_text vs tokens actually sent, per stage (all runs of this process)."""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, original: int, sent: int) -> None:
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"views": 0, "original_tokens": 0, "sent_tokens": 0, "truncated": 0})
+            entry["views"] += 1
+            entry["original_tokens"] += original
+            entry["sent_tokens"] += sent
+            entry["truncated"] += sent < original
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    **entry,
+                    "saved_tokens": entry["original_tokens"] - entry["sent_tokens"],
+                    "saved_ratio": round(1 - entry["sent_tokens"] / entry["original_tokens"], 3) if entry["original_tokens"] else 0.0,
+                }
+                for stage, entry in self._stages.items()
+            }
+
+
+class InputViews:
+    """
+    Budgeted views of one run's safe_text, built on first use per stage.
+
+    policy is CONFIG["INPUT_POLICY"]; with enabled=False every view is the
+    full text.
+    """
+
+    def __init__(self, text: str, policy: dict, stats: Optional[PreprocessStats] = None):
+        self.text = text
+        self.policy = policy
+        self.stats = stats
+        self._clean: Optional[CleanText] = None
+        self._views: Dict[str, str] = {}
+        self._original_tokens: Optional[int] = None
+
+    @property
+    def clean(self) -> CleanText:
+        if self._clean is None:
+            self._clean = clean_text(self.text)
+        return self._clean
+
+    def view(self, stage: str) -> str:
+        if stage not in self._views:
+            self._views[stage] = self._build(stage)
+            if self.stats is not None:
+                if self._original_tokens is None:
+                    self._original_tokens = count_tokens(self.text)
+                self.stats.record(stage, self._original_tokens, count_tokens(self._views[stage]))
+        return self._views[stage]
+
+    def _build(self, stage: str) -> str:
+        if not self.policy["enabled"]:
+            return self.text
+        clean = self.clean
+        if stage == "classifier":
+            head = truncate_tokens(clean.body, self.policy["classifier_tokens"])
+            if clean.subject and clean.subject not in head:
+                head = f"Asunto: {clean.subject}\n\n{head}"
+            return head
+        budget = self.policy["extractor_tokens"]
+        signature = truncate_tokens(clean.signature, self.policy["chunk_tokens"]) if clean.signature else ""
+        budget -= count_tokens(signature)
+        body = clean.body
+        if count_tokens(body) > budget:
+            body = select_chunks(body, STAGE_KEYWORDS[stage], budget, self.policy["chunk_tokens"])
+        return f"{body}\n\n{signature}" if signature else body
@@ -0,0 +1,366 @@
+"""
+Replay del tráfico grabado (run_store) contra una configuración candidata.
+
+Cada ejecución grabada se vuelve a enrutar con el CONFIG candidato, pero las
+llamadas al LLM se sustituyen por las salidas grabadas siempre que el prompt del
+agente (instrucciones renderizadas + esquema + modelo) y su entrada sean
+idénticos. Solo se recalculan las etapas deterministas (decisiones, plantillas,
+selección de ramas) y las de prompt o entrada distintos; estas últimas llaman
+al LLM, salvo con --offline, que reutiliza la salida grabada y marca la etapa
+como "stale". Las ejecuciones con PDF o imágenes solo guardan un resumen de la
+entrada: si el prompt del clasificador cambió se informan como no reproducibles
+en lugar de recalcularlo sobre el resumen. Las ejecuciones se reparten entre procesos y el resultado es un
+informe de cambios de ruta.
+
+Uso:
+    python replay.py [--config candidato.json] [--tenant id] [--since 2026-01-01] [--until ...]
+                     [--limit 500] [--workers 4] [--offline] [--output diff.jsonl]
+
+--config es un fichero (JSON, TOML o YAML) con el CONFIG completo o solo las
+secciones que cambian (se mezcla sobre el CONFIG actual; las listas se sustituyen
+enteras) y se valida igual que config/router_config.json.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+from config_store import DEFAULT_TENANT, merge_config, read_config_file, validate_config, version_of, versioned
+from run_store import RunStore, parse_time
+from shared_store import hash_payload
+
+ROOT = Path(__file__).parent
+
+# Agentes cuya entrada es el mensaje original (primer paso de cada ejecución)
+CLASSIFIER_AGENTS = ("Guardrails", "Guardrails+Intent")
+
+# Pasos grabados con una salida válida (respuesta del LLM, caché de nodos, replay previo o índice de CVs)
+REUSABLE_STATUSES = ("ok", "cached", "replayed", "reused")
+
+
+class ReplayMiss(Exception):
+    """Offline replay needs an agent output that was never recorded."""
+
+
+class NotReplayable(Exception):
+    """The run cannot be re-routed faithfully (e.g. a PDF/image run whose classifier prompt changed)."""
+
+
+class RecordedCalls:
+    """
+    Recorded agent outputs of one run, looked up by agent, prompt and input.
+
+    Returns None when the call must go to the LLM (prompt or input changed);
+    offline it falls back to the recorded output of the same agent instead.
+    """
+
+    def __init__(self, run: dict, offline: bool = False, same_config: bool = False, multimodal: bool = False):
+        self.offline = offline
+        self.same_config = same_config
+        # El run store guarda solo un resumen de las entradas PDF/imagen: el clasificador no se puede recalcular
+        self.multimodal = multimodal
+        self.steps = [
+            step for step in run["agents"]
+            if step["status"] in REUSABLE_STATUSES and step.get("output") is not None
+        ]
+        self.by_input = {(step["agent"], step["input"]): step for step in self.steps}
+        self.stages: List[dict] = []
+
+    def lookup(self, agent_name: str, prompt_hash: str, inp: str) -> Optional[dict]:
+        step = self.by_input.get((agent_name, inp))
+        if step is not None:
+            recorded_hash = step.get("prompt_hash")
+            # Ejecuciones grabadas sin prompt_hash: válidas solo con la misma configuración
+            if recorded_hash == prompt_hash or (recorded_hash is None and self.same_config):
+                self.stages.append({"agent": agent_name, "action": "replayed"})
+                return step["output"]
+        reason = "input_changed" if step is None else "prompt_changed"
+        if self.multimodal and agent_name in CLASSIFIER_AGENTS and not self.offline:
+            raise NotReplayable(f"{agent_name}: multimodal input not recorded ({reason})")
+        if not self.offline:
+            self.stages.append({"agent": agent_name, "action": "recomputed", "reason": reason})
+            return None
+        fallback = step or next((s for s in self.steps if s["agent"] == agent_name), None)
+        if fallback is None:
+            raise ReplayMiss(f"{agent_name}: no recorded output ({reason})")
+        self.stages.append({"agent": agent_name, "action": "stale", "reason": reason})
+        return fallback["output"]
+
+    def recorded(self, step_name: str) -> Optional[Any]:
+        """Recorded output of a non-LLM step (e.g. router.LEAD_INDEX_STEP), or None."""
+        return next((step["output"] for step in self.steps if step["agent"] == step_name), None)
+
+
+def load_candidate_config(path: Optional[str], tenant_id: Optional[str] = None) -> dict:
+    """Candidate CONFIG: the file merged over the tenant's active CONFIG (default tenant if None)."""
+    import router
+
+    current = router.tenant_registry.current(tenant_id).data
+    if not path:
+        return current
+    return versioned(validate_config(merge_config(current, read_config_file(path))))
+
+
+def with_classifier(config: dict, mode: str) -> dict:
+    """Config variant forcing a classifier mode (built once per config version and mode)."""
+    def build() -> dict:
+        variant = copy.deepcopy(config)
+        policy = variant.setdefault("ROUTING_POLICY", {})
+        policy["classifier"] = mode
+        policy["combined_classifier_share"] = None
+        return versioned(variant)
+
+    return version_of(config).derived(("classifier", mode), build)
+
+
+def is_multimodal(run: dict, classifier_step: dict) -> bool:
+    """
+    Whether the run's input was a PDF/image: the classifier then received the
+    messages and the run store only kept their summary, so the recorded input
+    no longer hashes to the run's input_hash.
+    """
+    return hash_payload(classifier_step["input"], []) != run.get("input_hash")
+
+
+def run_routes(result: Optional[dict]) -> List[str]:
+    """Final route(s) of a result; multi_route expands to its branches."""
+    if not result:
+        return []
+    if result.get("final_route") == "multi_route":
+        return [route.get("final_route") for route in result.get("payload", {}).get("routes", [])]
+    return [result.get("final_route")]
+
+
+def duplicate_sources(result: Optional[dict]) -> List[str]:
+    """Run ids whose result a near-duplicate CV returned (router.duplicate_result), per branch."""
+    if not result:
+        return []
+    branches = result["payload"].get("routes", []) if result.get("final_route") == "multi_route" else [result]
+    return [
+        branch["payload"]["duplicate_of"]["run_id"]
+        for branch in branches
+        if (branch.get("payload") or {}).get("duplicate_of", {}).get("run_id")
+    ]
+
+
+def changed_fields(old: Optional[dict], new: Optional[dict]) -> List[str]:
+    """Top-level payload keys whose value differs (per branch for multi_route)."""
+    def payloads(result):
+        if not result:
+            return []
+        if result.get("final_route") == "multi_route":
+            return [route.get("payload", {}) for route in result["payload"].get("routes", [])]
+        return [result.get("payload", {})]
+
+    fields = set()
+    for old_payload, new_payload in zip(payloads(old), payloads(new)):
+        for key in set(old_payload) | set(new_payload):
+            if old_payload.get(key) != new_payload.get(key):
+                fields.add(key)
+    return sorted(fields)
+
+
+# ================================================================================
+# REPLAY (worker processes)
+# ================================================================================
+
+async def replay_run(run: dict, config: dict, offline: bool) -> dict:
+    """Re-route one recorded run with the candidate config; returns its diff entry."""
+    import router
+
+    first = next((step for step in run["agents"] if step["agent"] in CLASSIFIER_AGENTS), None)
+    entry = {
+        "run_id": run["run_id"],
+        "created_at": run["created_at"],
+        "old_routes": run_routes(run.get("result")),
+        "new_routes": [],
+        "route_changed": False,
+        "changed_fields": [],
+        "stages": {},
+        "error": None,
+        "not_replayable": None,
+    }
+    if first is None:
+        entry["error"] = "no recorded classifier input"
+        return entry
+
+    # Mantener el modo de clasificador grabado para poder reutilizar sus salidas
+    run_config = with_classifier(config, "combined" if first["agent"] == "Guardrails+Intent" else "split")
+
+    calls = RecordedCalls(
+        run,
+        offline=offline,
+        same_config=run.get("config_fingerprint") == router.config_fingerprint(config),
+        multimodal=is_multimodal(run, first),
+    )
+    try:
+        # Texto: la entrada del clasificador es el mensaje original. PDF/imagen: solo su
+        # resumen, válido mientras la salida grabada del clasificador se pueda reutilizar
+        result = await router.run_workflow_async(
+            router.WorkflowInput(input_as_text=first["input"]),
+            hooks=router.RouterHooks(),
+            priority="background",
+            config=run_config,
+            replay=calls,
+            tenant_id=run.get("tenant_id"),
+        )
+    except NotReplayable as e:
+        entry["not_replayable"] = str(e)
+        result = None
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        result = None
+    entry["new_routes"] = run_routes(result)
+    entry["route_changed"] = result is not None and entry["new_routes"] != entry["old_routes"]
+    entry["changed_fields"] = changed_fields(run.get("result"), result) if result else []
+    entry["stages"] = dict(Counter(stage["action"] for stage in calls.stages))
+    entry["recomputed_agents"] = sorted({stage["agent"] for stage in calls.stages if stage["action"] != "replayed"})
+    entry["new_result"] = result
+    return entry
+
+
+def replay_chunk(
+    runs: List[dict],
+    config_path: Optional[str],
+    offline: bool,
+    concurrency: int,
+    tenant_id: Optional[str] = None,
+) -> List[dict]:
+    """Worker entry point: replay a chunk of runs concurrently in this process."""
+    from log_pipeline import configure_logging
+
+    configure_logging(level="WARNING")
+    config = load_candidate_config(config_path, tenant_id)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(run):
+        async with semaphore:
+            return await replay_run(run, config, offline)
+
+    async def all_runs():
+        return await asyncio.gather(*(one(run) for run in runs))
+
+    return asyncio.run(all_runs())
+
+
+def _init_worker(workers: int) -> None:
+    # La cuota del proveedor se reparte entre los procesos (ver scheduler)
+    os.environ["ROUTER_PROCESS_COUNT"] = str(workers)
+
+
+def chunked(runs: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    chunk: List[dict] = []
+    for run in runs:
+        chunk.append(run)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ================================================================================
+# REPORT
+# ================================================================================
+
+def summarize(entries: List[dict]) -> dict:
+    transitions = Counter(
+        (" + ".join(e["old_routes"]) or "-", " + ".join(e["new_routes"]) or "-")
+        for e in entries if e["route_changed"]
+    )
+    stages = Counter()
+    for entry in entries:
+        stages.update(entry["stages"])
+    return {
+        "runs": len(entries),
+        "route_changed": sum(e["route_changed"] for e in entries),
+        "payload_changed": sum(bool(e["changed_fields"]) and not e["route_changed"] for e in entries),
+        "errors": sum(e["error"] is not None for e in entries),
+        "not_replayable": sum(e.get("not_replayable") is not None for e in entries),
+        "transitions": [{"from": old, "to": new, "runs": n} for (old, new), n in transitions.most_common()],
+        "stages": dict(stages),
+        "recomputed_agents": dict(Counter(a for e in entries for a in e.get("recomputed_agents", []))),
+    }
+
+
+def print_report(summary: dict) -> None:
+    print(f"Ejecuciones: {summary['runs']} | ruta cambiada: {summary['route_changed']} | "
+          f"solo payload cambiado: {summary['payload_changed']} | errores: {summary['errors']} | "
+          f"no reproducibles (PDF/imagen con clasificador cambiado): {summary['not_replayable']}")
+    stages = summary["stages"]
+    total = sum(stages.values()) or 1
+    print(f"Etapas LLM: {stages.get('replayed', 0)} reutilizadas ({stages.get('replayed', 0) / total:.0%}), "
+          f"{stages.get('recomputed', 0)} recalculadas, {stages.get('stale', 0)} obsoletas (offline)")
+    if summary["recomputed_agents"]:
+        print("Agentes recalculados: " + ", ".join(f"{a} ×{n}" for a, n in summary["recomputed_agents"].items()))
+    if summary["transitions"]:
+        print("\nCambios de ruta:")
+        for t in summary["transitions"]:
+            print(f"  {t['from']:<40} → {t['to']:<40} {t['runs']:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="JSON/TOML/YAML con el CONFIG candidato (completo o parcial)")
+    parser.add_argument("--db", default=os.getenv("ROUTER_RUN_DB", str(ROOT / "var" / "runs.sqlite3")))
+    parser.add_argument("--tenant", help="Tenant cuyas ejecuciones se reproducen (el candidato se mezcla sobre su CONFIG)")
+    parser.add_argument("--since", help="Fecha ISO (o epoch) inicial, inclusiva")
+    parser.add_argument("--until", help="Fecha ISO (o epoch) final, exclusiva")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos")
+    parser.add_argument("--concurrency", type=int, default=8, help="Ejecuciones simultáneas por proceso")
+    parser.add_argument("--chunk-size", type=int, default=25)
+    parser.add_argument("--offline", action="store_true", help="No llamar al LLM: reutilizar salidas aunque el prompt cambie")
+    parser.add_argument("--output", help="Fichero JSONL con el diff por ejecución")
+    args = parser.parse_args()
+
+    store = RunStore(Path(args.db))
+
+    tenant = args.tenant or DEFAULT_TENANT
+
+    def recorded_runs() -> Iterator[dict]:
+        count = 0
+        # Las ejecuciones anteriores a los tenants (tenant_id nulo) son del tenant por defecto
+        tenant_filter = None if tenant == DEFAULT_TENANT else tenant
+        for run in store.iter_runs(parse_time(args.since), parse_time(args.until), tenant_id=tenant_filter):
+            if run["status"] != "ok" or (run.get("tenant_id") or DEFAULT_TENANT) != tenant:
+                continue
+            # Un CV duplicado no llamó a los agentes que se saltó: se añaden los pasos de la ejecución original
+            for source_id in duplicate_sources(run.get("result")):
+                source = store.get(source_id)
+                if source is not None:
+                    run["agents"] = source["agents"] + run["agents"]
+            yield run
+            count += 1
+            if args.limit is not None and count >= args.limit:
+                return
+
+    entries: List[dict] = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.workers,)) as pool:
+        pending = set()
+        for chunk in chunked(recorded_runs(), args.chunk_size):
+            # Pocos bloques en vuelo: las ejecuciones se leen del store a medida que se procesan
+            if len(pending) >= 2 * args.workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries.extend(future.result())
+            pending.add(pool.submit(replay_chunk, chunk, args.config, args.offline, args.concurrency, tenant))
+        for future in as_completed(pending):
+            entries.extend(future.result())
+
+    entries.sort(key=lambda e: e["created_at"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    print_report(summarize(entries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Matching inverso: candidatos ya procesados frente a vacantes nuevas.
+
+Cuando aparece un role_id nuevo en CONFIG["VACANTES"], los CVs guardados en el
+índice de CVs (cv_index.py), por defecto los rechazados (hr_cv_reject), se
+puntúan contra la vacante en un solo lote con NumPy, sin llamadas al LLM, con
+las mismas reglas que el prompt de cv_match_agent (CONFIG["CV_POLICY"]):
+habilidades, experiencia, certificaciones e idioma. El resultado es una lista
+corta ordenada por puntuación, guardada en la base de datos del índice.
+
+VacancyWatcher lanza el matching al recargarse un CONFIG con vacantes nuevas;
+también bajo demanda en GET /api/vacancies/{role_id}/shortlist.
+
+Uso:
+    python reverse_match.py --role FLOTA-CAP-01 [--tenant id] [--all-routes] [--limit 50] [--min-score 70] [--output lista.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config_store import DEFAULT_TENANT, ConfigVersion, TenantRegistry, version_of
+from cv_index import CV_INDEX_PATH, CVRecord, load_records, normalize_text
+from log_pipeline import logger
+from shared_store import connect_wal
+
+REVERSE_MATCH_ENABLED = os.getenv("ROUTER_REVERSE_MATCH", "1") == "1"  # Matching automático al abrir vacantes
+SHORTLIST_SIZE = int(os.getenv("ROUTER_SHORTLIST_SIZE", "50"))
+
+# Rutas cuyos candidatos se reconsideran por defecto
+DEFAULT_ROUTES = ("hr_cv_reject",)
+
+# Bonus de idioma del prompt de matching (sobre 10); el resto de idiomas, OTHER_LANGUAGE_BONUS
+LANGUAGE_BONUS = {"es": 10, "en": 7, "pt": 7}
+OTHER_LANGUAGE_BONUS = 5
+
+_STOPWORDS = {"de", "del", "la", "el", "los", "las", "y", "e", "en", "con", "para", "of", "and", "the", "in"}
+_EXCEEDS_RULE = re.compile(r"exceeds_by_(\d+)_years?")
+
+
+def term_key(text: str) -> str:
+    """Canonical form of a skill or certification: "Gestión de tripulación" → "gestion_tripulacion"."""
+    words = re.findall(r"[a-z0-9]+", normalize_text(text))
+    return "_".join(word for word in words if word not in _STOPWORDS)
+
+
+# ================================================================================
+# SCORER
+# ================================================================================
+
+@dataclass
+class CandidatePool:
+    """
+    Candidates as flat arrays: experience per row and (row, term id) pairs for
+    skills and certifications, so scoring against any set of vacancies is a
+    handful of array operations.
+    """
+    records: List[CVRecord]
+    experience: np.ndarray
+    terms: Dict[str, int]
+    skill_rows: np.ndarray
+    skill_terms: np.ndarray
+    cert_rows: np.ndarray
+    cert_terms: np.ndarray
+
+    @classmethod
+    def from_records(cls, records: List[CVRecord]) -> "CandidatePool":
+        terms: Dict[str, int] = {}
+        pairs = {"skills": ([], []), "certifications": ([], [])}
+        for row, record in enumerate(records):
+            for field_name, (rows, ids) in pairs.items():
+                for value in set(map(term_key, record.cv.get(field_name, []))):
+                    rows.append(row)
+                    ids.append(terms.setdefault(value, len(terms)))
+        return cls(
+            records,
+            np.array([record.cv.get("years_experience", 0) for record in records], dtype=np.int32),
+            terms,
+            *(np.asarray(values, dtype=np.int64) for rows_ids in pairs.values() for values in rows_ids),
+        )
+
+    def overlap(self, rows: np.ndarray, term_ids: np.ndarray, required: List[List[str]]) -> np.ndarray:
+        """(candidates, vacancies) matrix: how many of each vacancy's required terms every candidate has."""
+        columns = {key: i for i, key in enumerate(sorted({key for keys in required for key in keys}))}
+        lookup = np.full(len(self.terms), -1, dtype=np.int64)
+        for key, column in columns.items():
+            if key in self.terms:
+                lookup[self.terms[key]] = column
+        candidate_columns = lookup[term_ids]
+        known = candidate_columns >= 0
+        has = np.zeros((len(self.records), len(columns)), dtype=np.float32)
+        has[rows[known], candidate_columns[known]] = 1.0
+        wants = np.zeros((len(required), len(columns)), dtype=np.float32)
+        for j, keys in enumerate(required):
+            wants[j, [columns[key] for key in keys]] = 1.0
+        return has @ wants.T
+
+
+def experience_points(diff: np.ndarray, rules: Dict[str, int], cap: int) -> np.ndarray:
+    """meets_minimum plus the largest exceeds_by_N_years bonus reached, capped."""
+    bonus = np.zeros(diff.shape, dtype=np.float32)
+    for key, value in rules.items():
+        match = _EXCEEDS_RULE.fullmatch(key)
+        if match:
+            bonus = np.where(diff >= int(match.group(1)), np.maximum(bonus, value), bonus)
+    points = np.where(diff >= 0, rules.get("meets_minimum", 0) + bonus, 0)
+    return np.minimum(points, cap)
+
+
+def score_candidates(pool: CandidatePool, vacancies: List[dict], config: dict, language: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Score every candidate against every vacancy: (candidates, vacancies) arrays
+    per component plus "total" (0-100), following CONFIG["CV_POLICY"] as the
+    matcher prompt does. The candidate language is not stored, so the language
+    bonus uses `language` (default: LANG_POLICY.default_reply) for everyone.
+    """
+    policy = config["CV_POLICY"]
+    weights = policy["matching_weights"]
+    required_skills = [sorted({term_key(s) for s in v["skills_req"]}) for v in vacancies]
+    required_certs = [sorted({term_key(c) for c in v.get("certifications_req", [])}) for v in vacancies]
+
+    skill_counts = pool.overlap(pool.skill_rows, pool.skill_terms, required_skills)
+    n_skills = np.array([max(len(keys), 1) for keys in required_skills], dtype=np.float32)
+    # Sin habilidades requeridas: la parte de habilidades se da completa
+    skills = np.where(
+        np.array([len(keys) for keys in required_skills]) > 0,
+        skill_counts / n_skills * weights.get("skills_overlap", 0),
+        weights.get("skills_overlap", 0),
+    )
+
+    diff = pool.experience[:, None] - np.array([v["min_exp"] for v in vacancies], dtype=np.int32)[None, :]
+    experience = experience_points(diff, policy["experience_bonus_rules"], weights.get("experience_match", 0))
+
+    cert_counts = pool.overlap(pool.cert_rows, pool.cert_terms, required_certs)
+    n_certs = np.array([max(len(keys), 1) for keys in required_certs], dtype=np.float32)
+    certifications = np.minimum(
+        cert_counts / n_certs * policy["certifications_boost"].get("sector_required", 0),
+        weights.get("certifications_bonus", 0),
+    )
+
+    language = language or config["LANG_POLICY"]["default_reply"]
+    language_points = LANGUAGE_BONUS.get(language, OTHER_LANGUAGE_BONUS) * weights.get("language_bonus", 0) / 10
+    total = np.clip(np.rint(skills + experience + certifications + language_points), 0, 100).astype(np.int32)
+    return {
+        "skills": skills,
+        "experience": experience,
+        "certifications": certifications,
+        "language": np.full(total.shape, language_points, dtype=np.float32),
+        "total": total,
+    }
+
+
+def latest_per_candidate(records: List[CVRecord]) -> List[CVRecord]:
+    """Keep the most recent record of each candidate (by email; records without email stay)."""
+    latest: Dict[str, CVRecord] = {}
+    for record in records:
+        email = record.cv.get("email", "").strip().lower()
+        latest[email or f"#{record.record_id}"] = record
+    return sorted(latest.values(), key=lambda record: record.record_id)
+
+
+def shortlist(
+    records: List[CVRecord],
+    vacancies: List[dict],
+    config: dict,
+    *,
+    routes: Optional[Sequence[str]] = DEFAULT_ROUTES,
+    min_score: Optional[int] = None,
+    limit: int = SHORTLIST_SIZE,
+) -> Dict[str, List[dict]]:
+    """Ranked candidates (score >= min_score, default THRESHOLDS.FIT_OK) for each vacancy, keyed by role_id."""
+    candidates = [
+        record for record in latest_per_candidate(records)
+        if not routes or record.final_route in routes
+    ]
+    if not candidates or not vacancies:
+        return {vacancy["role_id"]: [] for vacancy in vacancies}
+    min_score = config["THRESHOLDS"]["FIT_OK"] if min_score is None else min_score
+    pool = CandidatePool.from_records(candidates)
+    scores = score_candidates(pool, vacancies, config)
+
+    result = {}
+    for j, vacancy in enumerate(vacancies):
+        total = scores["total"][:, j]
+        rows = np.flatnonzero(total >= min_score)
+        # Orden por puntuación y, a igualdad, por experiencia
+        rows = rows[np.lexsort((-pool.experience[rows], -total[rows]))][:limit]
+        required = {term_key(skill): skill for skill in vacancy["skills_req"]}
+        result[vacancy["role_id"]] = [
+            {
+                "record_id": pool.records[i].record_id,
+                "run_id": pool.records[i].run_id,
+                "full_name": pool.records[i].cv.get("full_name"),
+                "email": pool.records[i].cv.get("email"),
+                "years_experience": int(pool.experience[i]),
+                "match_score": int(total[i]),
+                "breakdown": {name: round(float(scores[name][i, j]), 1) for name in ("skills", "experience", "certifications", "language")},
+                "matched_skills": sorted(required[key] for key in {term_key(s) for s in pool.records[i].cv.get("skills", [])} & set(required)),
+                "previous_route": pool.records[i].final_route,
+                "processed_at": pool.records[i].created_at,
+            }
+            for i in rows
+        ]
+    return result
+
+
+# ================================================================================
+# JOBS
+# ================================================================================
+
+class ShortlistStore:
+    """Latest shortlist per tenant and vacancy, next to the CV index."""
+
+    def __init__(self, db_path: Path = CV_INDEX_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS vacancy_shortlists (
+                    tenant_id TEXT NOT NULL,
+                    role_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    config_fingerprint TEXT,
+                    scanned INTEGER NOT NULL,
+                    elapsed_ms REAL,
+                    candidates TEXT NOT NULL,
+                    PRIMARY KEY (tenant_id, role_id)
+                )"""
+            )
+
+    def save(self, tenant_id: str, role_id: str, entry: dict) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO vacancy_shortlists VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    tenant_id, role_id, entry["created_at"], entry["config_fingerprint"],
+                    entry["scanned"], entry["elapsed_ms"], json.dumps(entry["candidates"], ensure_ascii=False),
+                ),
+            )
+
+    def get(self, tenant_id: str, role_id: str) -> Optional[dict]:
+        with connect_wal(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT * FROM vacancy_shortlists WHERE tenant_id = ? AND role_id = ?", (tenant_id, role_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "candidates": json.loads(row["candidates"])}
+
+
+def run_reverse_match(
+    tenant_id: str,
+    config: dict,
+    role_ids: Optional[Sequence[str]] = None,
+    *,
+    routes: Optional[Sequence[str]] = DEFAULT_ROUTES,
+    min_score: Optional[int] = None,
+    limit: int = SHORTLIST_SIZE,
+    db_path: Path = CV_INDEX_PATH,
+    store: Optional[ShortlistStore] = None,
+) -> Dict[str, dict]:
+    """Score the tenant's stored candidates against `role_ids` (default: every vacancy); saves each shortlist if `store`."""
+    started = time.monotonic()
+    by_role = version_of(config).vacancies
+    vacancies = list(by_role.values()) if role_ids is None else [by_role[r] for r in role_ids if r in by_role]
+    records = load_records(tenant_id, db_path=db_path)
+    lists = shortlist(records, vacancies, config, routes=routes, min_score=min_score, limit=limit)
+    elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+    entries = {}
+    for role_id, candidates in lists.items():
+        entries[role_id] = {
+            "tenant_id": tenant_id,
+            "role_id": role_id,
+            "created_at": time.time(),
+            "config_fingerprint": version_of(config).fingerprint,
+            "scanned": len(records),
+            "elapsed_ms": elapsed_ms,
+            "candidates": candidates,
+        }
+        if store is not None:
+            store.save(tenant_id, role_id, entries[role_id])
+    return entries
+
+
+class VacancyWatcher:
+    """
+    Runs the reverse match for the role_ids a config reload adds (per tenant),
+    in a background thread so the config watcher is not held up.
+    """
+
+    def __init__(self, registry: TenantRegistry, store: Optional[ShortlistStore] = None):
+        self.registry = registry
+        self.store = store or ShortlistStore()
+        self.jobs = 0
+        self.last_job: Optional[dict] = None
+        self._known = {tenant_id: set(registry.current(tenant_id).vacancies) for tenant_id in registry.tenants()}
+        registry.subscribe(self._on_reload)
+
+    def _on_reload(self, tenant_id: str, version: ConfigVersion) -> None:
+        role_ids = list(version.vacancies)
+        new = [role_id for role_id in role_ids if role_id not in self._known.get(tenant_id, set())]
+        self._known[tenant_id] = set(role_ids)
+        if new:
+            threading.Thread(
+                target=self._run, args=(tenant_id, version.data, new), name="reverse-match", daemon=True
+            ).start()
+
+    def _run(self, tenant_id: str, config: dict, role_ids: List[str]) -> None:
+        try:
+            entries = run_reverse_match(tenant_id, config, role_ids, db_path=self.store.db_path, store=self.store)
+        except Exception as e:
+            logger.warning("Error en el matching inverso (%s: %s): %s", tenant_id, role_ids, e, extra={"event": "reverse_match_error"})
+            return
+        self.jobs += 1
+        self.last_job = {
+            "tenant_id": tenant_id,
+            "role_ids": role_ids,
+            "shortlisted": {role_id: len(entry["candidates"]) for role_id, entry in entries.items()},
+        }
+        for role_id, entry in entries.items():
+            logger.info(
+                "🎯 Vacante nueva %s (%s): %d candidatos preseleccionados de %d CVs en %s ms",
+                role_id, tenant_id, len(entry["candidates"]), entry["scanned"], entry["elapsed_ms"],
+                extra={"event": "reverse_match"},
+            )
+
+
+# ================================================================================
+# CLI
+# ================================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", action="append", help="role_id de la vacante (repetible; por defecto, todas)")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT)
+    parser.add_argument("--all-routes", action="store_true", help="Incluir también los candidatos ya derivados")
+    parser.add_argument("--limit", type=int, default=SHORTLIST_SIZE)
+    parser.add_argument("--min-score", type=int, default=None, help="Puntuación mínima (por defecto THRESHOLDS.FIT_OK)")
+    parser.add_argument("--db", default=str(CV_INDEX_PATH))
+    parser.add_argument("--output", help="Fichero JSON con las listas")
+    args = parser.parse_args()
+
+    config = TenantRegistry().current(args.tenant).data
+    unknown = set(args.role or []) - set(version_of(config).vacancies)
+    if unknown:
+        parser.error(f"vacantes desconocidas: {sorted(unknown)}")
+    entries = run_reverse_match(
+        args.tenant, config, args.role,
+        routes=None if args.all_routes else DEFAULT_ROUTES,
+        min_score=args.min_score, limit=args.limit,
+        db_path=Path(args.db), store=ShortlistStore(Path(args.db)),
+    )
+    for role_id, entry in entries.items():
+        print(f"{role_id}: {len(entry['candidates'])} candidatos de {entry['scanned']} CVs ({entry['elapsed_ms']} ms)")
+        for candidate in entry["candidates"][:10]:
+            print(f"  {candidate['match_score']:>3}  {candidate['full_name']} <{candidate['email']}>  {', '.join(candidate['matched_skills'])}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,48 @@ Implementación completa con esquemas Pydantic, gestión de contexto y OpenAI Ag
 Procesa solicitudes de empleo, consultas comerciales, eventos y consultas generales.
 """
 
+from __future__ import annotations
+
 import asyncio
 import base64
 import json
+import logging
 import os
+import random
 import sys
-from dataclasses import dataclass
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Literal, Optional, Union
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal, Optional, Union
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
-from agents import Agent, ModelSettings, RunConfig, Runner, AgentOutputSchema, RunHooks
-from agents.run import RunContextWrapper
-from openai import OpenAI
-from openai.types.shared import Reasoning
+# El SDK de agentes (y openai) se importa bajo demanda: ver AgentRegistry y __getattr__
+if TYPE_CHECKING:
+    from agents import Agent, RunConfig, RunHooks
+    from agents.run import RunContextWrapper
+    from openai import OpenAI
+
+    from cv_index import CVIndex, CVRecord
+    from lead_index import LeadIndex
+    from replay import RecordedCalls
+    from run_store import RunStore
+
+from latency import (
+    DEFAULT_CALL_POLICY, DEFAULT_WORKFLOW_TIMEOUT, AgentCallPolicy, AgentTimeoutError, call_policies, call_with_policy,
+    latency_tracker,
+)
+from config_store import CATEGORY_OWNERS, TenantRegistry, version_of
+from email_templates import first_name, get_template_engine
+from log_pipeline import LazyInputSummary, LazyJSON, LazyText, configure_logging, logger
+from pipeline import SKIPPED, Node, NodeCache, Pipeline, PipelineExecutor
+from preprocess import InputViews, PreprocessStats
+from scheduler import RateLimitExhausted, estimate_tokens, is_rate_limit_error, outbound_scheduler
+from shared_store import hash_payload
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -29,304 +55,12 @@ load_dotenv()
 # CONFIGURATION - Configuración completa para OCEANIX Galicia S.A.
 # ================================================================================
 
-CONFIG = {
-    "COMPANY": {
-        "name": "OCEANIX Galicia S.A.",
-        "type": "Empresa Pesquera Integrada",
-        "sector": "Productos del Mar",
-        "mission": "Ofrecer productos del mar de máxima calidad con trazabilidad completa desde la captura hasta el cliente final",
-        "year_founded": 2006,
-        "location": "Vigo, Galicia, España",
-        "employees": 980,
-        "annual_revenue_eur": "74M",
-        "site_url": "https://oceanix-galicia.es",
-        "careers_url": "https://oceanix-galicia.es/trabaja-con-nosotros",
-        "commercial_contact_url": "https://oceanix-galicia.es/contacto-comercial"
-    },
-    "INFRAESTRUCTURA": {
-        "flota": {
-            "cantidad": 4,
-            "tipo": "Buques arrastreros de altura",
-            "puerto_base": "Vigo",
-            "barcos": [
-                {"nombre": "Perla", "capacidad_ton": 480, "tripulacion": 24},
-                {"nombre": "Silenciosa María", "capacidad_ton": 550, "tripulacion": 28},
-                {"nombre": "Holandés Errante", "capacidad_ton": 600, "tripulacion": 30},
-                {"nombre": "Endeavour", "capacidad_ton": 500, "tripulacion": 25}
-            ]
-        },
-        "plantas_procesamiento": [
-            {"ubicacion": "Ribeira", "capacidad_dia_ton": 60, "empleados": 160, "funciones": ["recepcion", "limpieza", "fileteado"]},
-            {"ubicacion": "Burela", "capacidad_dia_ton": 70, "empleados": 190, "funciones": ["congelado", "subproductos"]}
-        ],
-        "plantas_envasado": [
-            {"ubicacion": "Vigo", "empleados": 280, "funciones": ["enlatados", "atmosfera_modificada", "vacio", "etiquetado"]},
-            {"ubicacion": "A Coruña", "empleados": 180, "funciones": ["preparados", "filetes_empanados"]}
-        ],
-        "logistica": {
-            "camiones_total": 25,
-            "camiones_largo_recorrido": 10,
-            "cobertura": ["Galicia", "Norte de España", "Portugal"]
-        }
-    },
-    "LINEAS_PRODUCTO": [
-        "Pescado_Fresco",
-        "Pescado_Congelado",
-        "Conservas_Enlatados",
-        "Preparados_Valor_Añadido",
-        "Subproductos_Industriales"
-    ],
-    "CERTIFICACIONES_CALIDAD": [
-        "ISO_22000_Seguridad_Alimentaria",
-        "MSC_Pesca_Sostenible",
-        "IFS_Food_Estandar_Internacional",
-        "Trazabilidad_Completa_Lote",
-        "Control_Temperatura_24_7"
-    ],
-    "CONTRATOS_COMERCIALES": [
-        {
-            "name": "Básico",
-            "target": "Pequeños distribuidores, pescaderías locales",
-            "volumen_mensual_ton": "5-20",
-            "condiciones": "Pedidos flexibles, entrega regional"
-        },
-        {
-            "name": "Profesional",
-            "target": "Cadenas regionales, HoReCa",
-            "volumen_mensual_ton": "50-200",
-            "condiciones": "Contrato anual, entregas programadas, cuenta dedicada"
-        },
-        {
-            "name": "Enterprise",
-            "target": "Grandes superficies, exportación",
-            "volumen_mensual_ton": ">300",
-            "condiciones": "Contrato plurianual, marca blanca, logística integrada"
-        }
-    ],
-    "VACANTES": [
-        {
-            "role_id": "FLOTA-CAP-01",
-            "dept": "Flota Pesquera",
-            "title": "Capitán de Barco Pesquero",
-            "skills_req": ["licencia_capitan", "navegacion", "gestion_tripulacion", "conocimiento_caladeros"],
-            "min_exp": 8,
-            "certifications_req": ["Capitán de la Marina Mercante", "Certificado STCW"]
-        },
-        {
-            "role_id": "FLOTA-OFI-01",
-            "dept": "Flota Pesquera",
-            "title": "Oficial de Máquinas",
-            "skills_req": ["mecanica_naval", "refrigeracion", "mantenimiento_motores"],
-            "min_exp": 5,
-            "certifications_req": ["Oficial de Máquinas"]
-        },
-        {
-            "role_id": "PROD-JEFE-01",
-            "dept": "Producción",
-            "title": "Jefe de Planta de Procesamiento",
-            "skills_req": ["gestion_produccion", "seguridad_alimentaria", "iso_22000", "gestion_equipos"],
-            "min_exp": 6,
-            "certifications_req": ["Curso de manipulador de alimentos superior"]
-        },
-        {
-            "role_id": "PROD-FIL-01",
-            "dept": "Producción",
-            "title": "Operario de Fileteado",
-            "skills_req": ["corte_pescado", "manipulacion_alimentos", "trabajo_cadena"],
-            "min_exp": 1,
-            "certifications_req": ["Manipulador de alimentos"]
-        },
-        {
-            "role_id": "PROD-SUP-01",
-            "dept": "Producción",
-            "title": "Supervisor de Envasado",
-            "skills_req": ["control_calidad", "gestion_linea_produccion", "etiquetado", "trazabilidad"],
-            "min_exp": 3,
-            "certifications_req": ["Manipulador de alimentos", "IFS Food"]
-        },
-        {
-            "role_id": "QUAL-TEC-01",
-            "dept": "Calidad",
-            "title": "Técnico de Calidad Alimentaria",
-            "skills_req": ["microbiologia", "haccp", "auditorias", "laboratorio"],
-            "min_exp": 3,
-            "certifications_req": ["Técnico en Calidad Alimentaria", "Auditor IFS/BRC"]
-        },
-        {
-            "role_id": "QUAL-INS-01",
-            "dept": "Calidad",
-            "title": "Inspector de Trazabilidad",
-            "skills_req": ["trazabilidad", "normativa_ue", "sistemas_gestion", "etiquetado"],
-            "min_exp": 2,
-            "certifications_req": ["Manipulador de alimentos"]
-        },
-        {
-            "role_id": "LOG-RESP-01",
-            "dept": "Logística",
-            "title": "Responsable de Distribución",
-            "skills_req": ["gestion_logistica", "optimizacion_rutas", "cadena_frio", "erp"],
-            "min_exp": 5,
-            "certifications_req": ["CAP (Certificado Aptitud Profesional)"]
-        },
-        {
-            "role_id": "LOG-COND-01",
-            "dept": "Logística",
-            "title": "Conductor Camión Frigorífico",
-            "skills_req": ["conduccion_camion", "control_temperatura", "rutas_internacionales"],
-            "min_exp": 2,
-            "certifications_req": ["Carnet C+E", "CAP", "ADR (opcional)"]
-        },
-        {
-            "role_id": "COM-AM-01",
-            "dept": "Comercial",
-            "title": "Account Manager HoReCa",
-            "skills_req": ["ventas_b2b", "sector_horeca", "negociacion", "crm"],
-            "min_exp": 3,
-            "certifications_req": []
-        },
-        {
-            "role_id": "COM-EXP-01",
-            "dept": "Comercial",
-            "title": "Export Manager",
-            "skills_req": ["comercio_internacional", "exportacion", "incoterms", "ingles_negociacion", "normativa_aduanas"],
-            "min_exp": 5,
-            "certifications_req": []
-        },
-        {
-            "role_id": "IT-SYS-01",
-            "dept": "IT",
-            "title": "Técnico de Sistemas (ERP/Trazabilidad)",
-            "skills_req": ["erp", "bases_datos", "sql", "redes", "soporte_tecnico"],
-            "min_exp": 3,
-            "certifications_req": []
-        }
-    ],
-    "EVENTOS_INTERES": [
-        "Conxemar_Vigo",
-        "Seafood_Expo_Global",
-        "Alimentaria_Barcelona",
-        "Fish_International_Bremen",
-        "Seafood_Summit",
-        "Foro_Economia_del_Mar"
-    ],
-    "OWNERS": {
-        "hr": {"email": "rrhh@oceanix-galicia.es", "name": "Recursos Humanos"},
-        "sales": {"email": "comercial@oceanix-galicia.es", "name": "Departamento Comercial"},
-        "events": {"email": "marketing@oceanix-galicia.es", "name": "Marketing y Comunicación"},
-        "fleet": {"email": "flota@oceanix-galicia.es", "name": "Gestión de Flota"},
-        "production": {"email": "produccion@oceanix-galicia.es", "name": "Dirección de Producción"},
-        "quality": {"email": "calidad@oceanix-galicia.es", "name": "Control de Calidad"},
-        "logistics": {"email": "logistica@oceanix-galicia.es", "name": "Logística y Distribución"},
-        "other": {"email": "info@oceanix-galicia.es", "name": "Recepción General"}
-    },
-    "THRESHOLDS": {
-        "FIT_OK": 70,
-        "FIT_ALTA_CONF": 85,
-        "LEAD_A": 80,
-        "LEAD_B": 50
-    },
-    "IDIOMAS": ["es", "en", "pt", "fr", "other"],
-    "GUARDRAILS_POLICY": {
-        "blocking_categories": [
-            "violence",
-            "sexual_content",
-            "hate_speech",
-            "harassment",
-            "illegal_activity",
-            "self_harm"
-        ],
-        "pii_rules": {
-            "detect": ["phone_numbers", "addresses", "national_ids"],
-            "redact_method": "replace_with_placeholder",
-            "keep_emails": True
-        },
-        "jailbreak_patterns": [
-            "ignore previous instructions",
-            "disregard your rules",
-            "override your policy",
-            "you are now in DAN mode",
-            "pretend you are"
-        ]
-    },
-    "CV_POLICY": {
-        "matching_weights": {
-            "skills_overlap": 40,
-            "experience_match": 30,
-            "certifications_bonus": 20,
-            "language_bonus": 10
-        },
-        "experience_bonus_rules": {
-            "meets_minimum": 10,
-            "exceeds_by_1_year": 5,
-            "exceeds_by_2_years": 10,
-            "exceeds_by_5_years": 15
-        },
-        "certifications_boost": {
-            "sector_required": 20,
-            "safety_food_handling": 15,
-            "international_standard": 10
-        }
-    },
-    "SALES_POLICY": {
-        "score_weights": {
-            "corporate_domain": 15,
-            "volume_commitment": 25,
-            "timeline_clear": 20,
-            "decision_maker_title": 20,
-            "quality_certifications_req": 20
-        },
-        "priority_rules": {
-            "A": 80,
-            "B": 50
-        },
-        "decision_maker_titles": [
-            "ceo", "director", "gerente", "responsable_compras", "jefe_compras",
-            "procurement", "supply_chain", "director_operaciones"
-        ],
-        "high_value_sectors": [
-            "gran_superficie", "cadena_hoteles", "distribuidor_nacional",
-            "exportador", "mayorista_alimentacion"
-        ]
-    },
-    "EVENTS_POLICY": {
-        "valid_topics": [
-            "Pesca", "Acuicultura", "Seguridad Alimentaria", "Sostenibilidad Marina",
-            "Logística Cadena Frío", "Trazabilidad", "Certificaciones", "Exportación"
-        ],
-        "valid_regions": ["ES", "EU", "LATAM", "EMEA", "Galicia", "Norte de España"],
-        "valid_formats": ["feria", "congreso", "webinar", "jornada_tecnica", "networking", "misión_comercial"]
-    },
-    "LANG_POLICY": {
-        "accepted": ["es", "en", "pt", "fr"],
-        "default_reply": "es"
-    },
-    "EMAIL_TEMPLATES": {
-        "cv_forward": {
-            "subject_pattern": "Candidato potencial – {{title}} (fit {{match_score}}%)",
-            "tone": "profesional, interno, directo"
-        },
-        "cv_reject": {
-            "subject_pattern": "Gracias por tu candidatura – OCEANIX Galicia",
-            "tone": "amable, neutro, agradecido"
-        },
-        "sales_internal": {
-            "subject_pattern": "Lead {{priority}} – {{company}} (score: {{lead_score}})",
-            "tone": "briefing ejecutivo, datos clave"
-        },
-        "sales_external": {
-            "subject_pattern": "Gracias por tu interés en OCEANIX Galicia",
-            "tone": "profesional, consultivo, sin promesas"
-        },
-        "events": {
-            "subject_pattern": "Re: Propuesta de evento/alianza",
-            "tone": "abierto, solicita detalles"
-        },
-        "generic": {
-            "subject_pattern": "Recibido – OCEANIX Galicia",
-            "tone": "neutro, solicita contexto"
-        }
-    }
-}
+# El CONFIG vive en config/router_config.json (ROUTER_CONFIG_PATH), validado con
+# los modelos de config_store y recargado en caliente; router.CONFIG devuelve la
+# versión activa y cada ejecución conserva la instantánea con la que empezó.
+# Cada filial (tenant) tiene su fichero en config/tenants/, mezclado sobre el base.
+tenant_registry = TenantRegistry()
+config_store = tenant_registry.default
 
 
 # ================================================================================
@@ -378,6 +112,7 @@ class GuardrailsSchema(BaseModel):
 
 class IntentSchema(BaseModel):
     category: Literal["cv", "sales", "event", "other"]
+    categories: List[Literal["cv", "sales", "event", "other"]]  # Todas las intenciones presentes (multi-label)
     confidence: float = Field(ge=0, le=1)
     language: Literal["es", "en", "pt", "other"]
     
@@ -385,6 +120,15 @@ class IntentSchema(BaseModel):
         extra = 'forbid'
 
 
+class GuardrailsIntentSchema(BaseModel):
+    """Composite output of the combined classifier; intent is ignored when guardrails.pass is false."""
+    guardrails: GuardrailsSchema
+    intent: IntentSchema
+    
+    class Config:
+        extra = 'forbid'
+
+
 class CVExtractSchema(BaseModel):
     full_name: str
     email: str
@@ -424,6 +168,15 @@ class CVMatchSchema(BaseModel):
         extra = 'forbid'
 
 
+class CVExtractMatchSchema(BaseModel):
+    """Composite output of the fused CV agent: extraction and matching in one call."""
+    cv_extract: CVExtractSchema
+    cv_match: CVMatchSchema
+    
+    class Config:
+        extra = 'forbid'
+
+
 class OwnerMapSchema(BaseModel):
     route_department: Literal[
         "hr", "sales", "marketing", "events", "fleet", 
@@ -466,7 +219,8 @@ class DraftEmailSchema(BaseModel):
 class RouterOutputSchema(BaseModel):
     final_route: Literal[
         "hr_cv_reject", "hr_cv_forward", "sales_forward", 
-        "events_forward", "other", "guardrails_block"
+        "events_forward", "other", "guardrails_block",
+        "multi_route",  # Varias intenciones: payload.routes con la salida de cada rama
     ]
     payload: dict
     
@@ -478,10 +232,93 @@ class RouterOutputSchema(BaseModel):
 # CONTEXT - Dependency injection for CONFIG
 # ================================================================================
 
+class CancellationToken:
+    """
+    Cooperative cancellation signal for a workflow run.
+    
+    Set by whoever owns the run (WebSocket disconnect, job cancellation, ...);
+    run_agent_with_logs checks it before every agent and aborts the call in flight.
+    """
+    
+    def __init__(self, event: Optional[asyncio.Event] = None, reason: str = "cancelled"):
+        self._event = event or asyncio.Event()
+        self.reason = reason  # Motivo por defecto si el evento se activa desde fuera
+    
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    async def wait(self) -> None:
+        await self._event.wait()
+
+
+class WorkflowCancelled(Exception):
+    """The run was aborted (cancellation or deadline); carries the usage consumed so far."""
+    
+    def __init__(self, reason: str, usage: dict):
+        super().__init__(f"Workflow cancelled: {reason}")
+        self.reason = reason
+        self.usage = usage
+
+
 @dataclass
 class RouterContext:
     """Context passed to all agents containing the canonical configuration."""
     config: dict
+    tenant_id: Optional[str] = None  # Filial a la que pertenece la ejecución (None = tenant por defecto)
+    run_id: Optional[str] = None
+    priority: str = "interactive"  # Carril del scheduler: interactive | batch | background
+    deadline: Optional[float] = None  # Deadline absoluto (time.monotonic) de la petición completa
+    cancel_token: Optional[CancellationToken] = None
+    usage_log: List[dict] = field(default_factory=list)  # Uso de tokens por agente (también parcial)
+    agent_io: List[dict] = field(default_factory=list)  # Entrada/salida de cada llamada, alineada con usage_log
+    started_at: float = field(default_factory=time.monotonic)
+    intent: Optional[IntentSchema] = None  # Intención clasificada y ramas ejecutadas (registro de ejecuciones)
+    categories: List[str] = field(default_factory=list)
+    replay: Optional[RecordedCalls] = None  # Salidas grabadas que sustituyen a las llamadas al LLM (replay.py)
+    
+    def record_usage(
+        self,
+        agent_name: str,
+        usage,
+        status: str = "ok",
+        *,
+        started: Optional[float] = None,
+        inp: Optional[str] = None,
+        output=None,
+        prompt_hash: Optional[str] = None,
+    ) -> None:
+        now = time.monotonic()
+        self.usage_log.append({
+            "agent": agent_name,
+            "status": status,
+            "requests": getattr(usage, "requests", 0),
+            "input_tokens": getattr(usage, "input_tokens", 0),
+            "output_tokens": getattr(usage, "output_tokens", 0),
+            "total_tokens": getattr(usage, "total_tokens", 0),
+            "started_ms": round(((started or now) - self.started_at) * 1000, 1),
+            "elapsed_ms": round((now - (started or now)) * 1000, 1),
+        })
+        self.agent_io.append({"input": inp, "output": output, "prompt_hash": prompt_hash})
+    
+    def usage_summary(self) -> dict:
+        return {
+            "agents": list(self.usage_log),
+            "total_tokens": sum(entry["total_tokens"] for entry in self.usage_log),
+            "requests": sum(entry["requests"] for entry in self.usage_log),
+        }
+    
+    def check_cancelled(self) -> None:
+        """Raise WorkflowCancelled if the run was cancelled or its deadline passed."""
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise WorkflowCancelled(self.cancel_token.reason, self.usage_summary())
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise WorkflowCancelled("deadline_exceeded", self.usage_summary())
 
 
 # ================================================================================
@@ -537,12 +374,17 @@ def get_intent_instructions(
 **CONTEXTO DE LA EMPRESA:**
 {json.dumps(company, indent=2, ensure_ascii=False)}
 
-**CLASIFICAR EN UNA CATEGORÍA:**
+**CLASIFICAR EN CATEGORÍAS:**
 - "cv": Solicitud de empleo, currículum, candidatura laboral
 - "sales": Consulta comercial, solicitud de presupuesto, pedido de productos
 - "event": Conferencia, feria, patrocinio, prensa, alianza comercial
 - "other": Cualquier otra cosa
 
+Un mismo mensaje puede contener varias intenciones (p. ej. una consulta comercial
+y una invitación a una feria). "category" es la intención principal; "categories"
+lista TODAS las intenciones presentes, empezando por la principal. Usa "other"
+solo si no aplica ninguna de las demás.
+
 **DETECTAR IDIOMA:**
 - "es", "en", "pt", "fr", o "other"
 
@@ -552,12 +394,40 @@ def get_intent_instructions(
 **OUTPUT:** Devuelve SOLO JSON válido que cumpla IntentSchema:
 {{
   "category": "cv|sales|event|other",
+  "categories": ["cv|sales|event|other", ...],
   "confidence": 0.0-1.0,
   "language": "es|en|pt|fr|other"
 }}
 """
 
 
+def get_guardrails_intent_instructions(
+    ctx: RunContextWrapper[RouterContext], 
+    agent: Agent[RouterContext]
+) -> str:
+    # Una sola lectura del texto: guardrails y clasificación de intención en la misma llamada
+    guardrails = get_guardrails_instructions(ctx, agent).split("**OUTPUT:**")[0].strip()
+    intent = get_intent_instructions(ctx, agent).split("**OUTPUT:**")[0].strip()
+    
+    return f"""You run two checks on the incoming message in a single pass.
+
+## PART 1 - GUARDRAILS (guardrails)
+{guardrails}
+
+## PART 2 - INTENT (intent)
+Classify the safe_text produced in part 1. If pass=false, still return a valid intent
+object (it will be ignored).
+
+{intent}
+
+**OUTPUT:** Return ONLY valid JSON matching GuardrailsIntentSchema:
+{{
+  "guardrails": {{"pass": true|false, "safe_text": "...", "flags": {{...}}}},
+  "intent": {{"category": "...", "categories": [...], "confidence": 0.0-1.0, "language": "..."}}
+}}
+"""
+
+
 def get_cv_extract_instructions(
     ctx: RunContextWrapper[RouterContext], 
     agent: Agent[RouterContext]
@@ -647,12 +517,39 @@ def get_cv_match_instructions(
 """
 
 
+def get_cv_extract_match_instructions(
+    ctx: RunContextWrapper[RouterContext], 
+    agent: Agent[RouterContext]
+) -> str:
+    # Reutiliza las instrucciones de ambos agentes sin sus bloques OUTPUT individuales
+    extract = get_cv_extract_instructions(ctx, agent).split("**OUTPUT:**")[0].strip()
+    match = get_cv_match_instructions(ctx, agent).split("**OUTPUT:**")[0].strip()
+    
+    return f"""Realizas en una sola pasada la extracción de datos del candidato y su evaluación contra las vacantes.
+
+## PASO 1 - EXTRACCIÓN (cv_extract)
+{extract}
+
+## PASO 2 - MATCHING (cv_match)
+Evalúa los datos extraídos en el paso 1 (no el texto original).
+
+{match}
+
+**OUTPUT:** Devuelve SOLO JSON válido que cumpla CVExtractMatchSchema:
+{{
+  "cv_extract": {{...CVExtractSchema...}},
+  "cv_match": {{"vacancies_found": true|false, "matched_roles": [...], "best_match": {{...}} | null}}
+}}
+"""
+
+
 def get_owner_map_instructions(
     ctx: RunContextWrapper[RouterContext], 
     agent: Agent[RouterContext]
 ) -> str:
     config = ctx.context.config
     owners = config['OWNERS']
+    mapping = "\n".join(f"- {category} → {department}" for category, department in CATEGORY_OWNERS.items())
     
     return f"""You map intent categories to internal owners.
 
@@ -660,10 +557,7 @@ def get_owner_map_instructions(
 {json.dumps(owners, indent=2)}
 
 **MAPPING:**
-- cv → hr
-- sales → sales
-- event → events
-- other → other
+{mapping}
 
 **OUTPUT:** Return ONLY valid JSON matching OwnerMapSchema:
 {{
@@ -739,11 +633,14 @@ def get_draft_reject_instructions(
 - Animar a revisar página de carreras periódicamente
 - Tono cálido, profesional, en español
 
+**SI RECIBES `template_draft`:** es un borrador generado con plantilla. Úsalo como base,
+mejora la redacción y adáptalo a los datos de `data`, sin cambiar destinatarios ni cifras.
+
 **OUTPUT:** Devuelve SOLO JSON válido que cumpla DraftEmailSchema:
 {{
   "to": "<candidate_email>",
   "cc": "",
-  "subject": "Gracias por tu candidatura – OCEANIX Galicia",
+  "subject": "{template['subject_pattern']}",
   "body_markdown": "<cuerpo del email en markdown>"
 }}
 """
@@ -767,6 +664,9 @@ def get_draft_hr_forward_instructions(
 - Mejor coincidencia destacada con razonamiento
 - Tono profesional, briefing interno
 
+**SI RECIBES `template_draft`:** es un borrador generado con plantilla. Úsalo como base,
+mejora la redacción y adáptalo a los datos de `data`, sin cambiar destinatarios ni cifras.
+
 **OUTPUT:** Devuelve SOLO JSON válido que cumpla DraftEmailSchema.
 """
 
@@ -791,6 +691,9 @@ def get_draft_sales_forward_instructions(
 - Acción recomendada (responder en 24-48h)
 - Tono briefing ejecutivo
 
+**SI RECIBES `template_draft`:** es un borrador generado con plantilla. Úsalo como base,
+mejora la redacción y adáptalo a los datos de `data`, sin cambiar destinatarios ni cifras.
+
 **OUTPUT:** Devuelve SOLO JSON válido que cumpla DraftEmailSchema.
 """
 
@@ -814,6 +717,9 @@ def get_draft_generic_ack_instructions(
 - Tono profesional, neutral
 - Usar idioma por defecto (español) a menos que el contexto sugiera otro
 
+**SI RECIBES `template_draft`:** es un borrador generado con plantilla. Úsalo como base,
+mejora la redacción y adáptalo a los datos de `data`, sin cambiar destinatarios ni cifras.
+
 **OUTPUT:** Devuelve SOLO JSON válido que cumpla DraftEmailSchema.
 """
 
@@ -847,185 +753,169 @@ Include all provided data in payload. Ensure valid JSON.
 
 
 # ================================================================================
-# AGENT DEFINITIONS - All agents with proper types
+# AGENT DEFINITIONS - Lazy registry, each Agent is built on first use
 # ================================================================================
 
-guardrails_agent = Agent[RouterContext](
-    name="Guardrails",
-    instructions=get_guardrails_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=GuardrailsSchema,
-)
+@dataclass(frozen=True)
+class AgentSpec:
+    """Declarative definition of an agent; AgentRegistry turns it into an Agent on demand."""
+    name: str
+    instructions: Union[str, Callable]
+    output_type: type
+    strict_json_schema: bool = True
+    model: str = "gpt-5-mini"
+    reasoning_effort: str = "low"
+    verbosity: str = "low"
+
+
+AGENT_SPECS: Dict[str, AgentSpec] = {
+    # Clasificación
+    "guardrails_agent": AgentSpec("Guardrails", get_guardrails_instructions, GuardrailsSchema),
+    "intent_agent": AgentSpec("Intent classifier", get_intent_instructions, IntentSchema),
+    "guardrails_intent_agent": AgentSpec("Guardrails+Intent", get_guardrails_intent_instructions, GuardrailsIntentSchema),
+
+    # Extracción y matching
+    "cv_extract_agent": AgentSpec("CV extractor", get_cv_extract_instructions, CVExtractSchema),
+    "cv_match_agent": AgentSpec("CV matcher", get_cv_match_instructions, CVMatchSchema),
+    "cv_extract_match_agent": AgentSpec("CV extract+match", get_cv_extract_match_instructions, CVExtractMatchSchema),
+    "owner_map_agent": AgentSpec("Owner mapping", get_owner_map_instructions, OwnerMapSchema),
+    "sales_extract_agent": AgentSpec("Sales extractor", get_sales_extract_instructions, SalesExtractSchema),
+
+    # Redactores (pulido opcional de las plantillas)
+    "draft_reject_agent": AgentSpec("Draft HR reject", get_draft_reject_instructions, DraftEmailSchema),
+    "draft_hr_forward_agent": AgentSpec("Draft HR forward", get_draft_hr_forward_instructions, DraftEmailSchema),
+    "draft_sales_forward_agent": AgentSpec("Draft Sales forward", get_draft_sales_forward_instructions, DraftEmailSchema),
+    "draft_generic_ack_agent": AgentSpec("Draft generic ack", get_draft_generic_ack_instructions, DraftEmailSchema),
+
+    # Packagers
+    "hr_reject_packager": AgentSpec("Packager HR reject", get_packager_instructions("hr_cv_reject"), RouterOutputSchema, strict_json_schema=False),
+    "hr_forward_packager": AgentSpec("Packager HR forward", get_packager_instructions("hr_cv_forward"), RouterOutputSchema, strict_json_schema=False),
+    "sales_packager": AgentSpec("Packager Sales", get_packager_instructions("sales_forward"), RouterOutputSchema, strict_json_schema=False),
+    "events_packager": AgentSpec("Packager Events", get_packager_instructions("events_forward"), RouterOutputSchema, strict_json_schema=False),
+    "other_packager": AgentSpec("Packager Other", get_packager_instructions("other"), RouterOutputSchema, strict_json_schema=False),
+    "guardrails_block_packager": AgentSpec("Packager Guardrails Block", get_packager_instructions("guardrails_block"), RouterOutputSchema, strict_json_schema=False),
+}
 
-intent_agent = Agent[RouterContext](
-    name="Intent classifier",
-    instructions=get_intent_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=IntentSchema,
-)
 
-cv_extract_agent = Agent[RouterContext](
-    name="CV extractor",
-    instructions=get_cv_extract_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=CVExtractSchema,
-)
+class AgentRegistry:
+    """
+    Builds agents from AGENT_SPECS the first time they are requested.
+    
+    Importing router therefore does not import the agents SDK nor openai;
+    warm_up() builds everything ahead of time (e.g. in the background after
+    the server starts).
+    """
+    
+    def __init__(self, specs: Dict[str, AgentSpec]):
+        self.specs = specs
+        self._agents: Dict[str, Agent] = {}
+    
+    def __getitem__(self, key: str) -> Agent:
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = self._agents[key] = self._build(self.specs[key])
+        return agent
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.specs
+    
+    @staticmethod
+    def _build(spec: AgentSpec) -> Agent:
+        from agents import Agent, AgentOutputSchema, ModelSettings
+        from openai.types.shared import Reasoning
+        
+        output_type = spec.output_type
+        if not spec.strict_json_schema:
+            output_type = AgentOutputSchema(spec.output_type, strict_json_schema=False)
+        return Agent[RouterContext](
+            name=spec.name,
+            instructions=versioned_instructions(spec),
+            model=spec.model,
+            model_settings=ModelSettings(
+                reasoning=Reasoning(effort=spec.reasoning_effort),
+                verbosity=spec.verbosity
+            ),
+            output_type=output_type,
+        )
+    
+    def built(self) -> List[str]:
+        return list(self._agents)
+    
+    def warm_up(self) -> None:
+        """Import the SDK and build every agent now instead of on the first request."""
+        for key in self.specs:
+            self[key]
 
-cv_match_agent = Agent[RouterContext](
-    name="CV matcher",
-    instructions=get_cv_match_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=CVMatchSchema,
-)
 
-owner_map_agent = Agent[RouterContext](
-    name="Owner mapping",
-    instructions=get_owner_map_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=OwnerMapSchema,
-)
+agent_registry = AgentRegistry(AGENT_SPECS)
 
-sales_extract_agent = Agent[RouterContext](
-    name="Sales extractor",
-    instructions=get_sales_extract_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=SalesExtractSchema,
-)
+AGENT_SPECS_BY_NAME: Dict[str, AgentSpec] = {spec.name: spec for spec in AGENT_SPECS.values()}
 
-draft_reject_agent = Agent[RouterContext](
-    name="Draft HR reject",
-    instructions=get_draft_reject_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=DraftEmailSchema,
-)
 
-draft_hr_forward_agent = Agent[RouterContext](
-    name="Draft HR forward",
-    instructions=get_draft_hr_forward_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=DraftEmailSchema,
-)
+def render_instructions(spec: AgentSpec, config: dict) -> str:
+    """Instructions of an agent under this CONFIG, rendered once per config version."""
+    if not callable(spec.instructions):
+        return spec.instructions
+    # Las instrucciones solo dependen de ctx.context.config: se renderizan sin el SDK
+    return version_of(config).derived(
+        ("instructions", spec.name),
+        lambda: spec.instructions(SimpleNamespace(context=RouterContext(config=config)), None),
+    )
 
-draft_sales_forward_agent = Agent[RouterContext](
-    name="Draft Sales forward",
-    instructions=get_draft_sales_forward_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=DraftEmailSchema,
-)
 
-draft_generic_ack_agent = Agent[RouterContext](
-    name="Draft generic ack",
-    instructions=get_draft_generic_ack_instructions,
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=DraftEmailSchema,
-)
+def versioned_instructions(spec: AgentSpec) -> Union[str, Callable]:
+    """Instructions callable for the SDK that reuses the rendering of the run's CONFIG version."""
+    if not callable(spec.instructions):
+        return spec.instructions
+    
+    def instructions(ctx: RunContextWrapper[RouterContext], agent: Agent[RouterContext]) -> str:
+        return render_instructions(spec, ctx.context.config)
+    
+    return instructions
 
-# Packager agents
-hr_reject_packager = Agent[RouterContext](
-    name="Packager HR reject",
-    instructions=get_packager_instructions("hr_cv_reject"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
 
-hr_forward_packager = Agent[RouterContext](
-    name="Packager HR forward",
-    instructions=get_packager_instructions("hr_cv_forward"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
+def prompt_fingerprint(agent_name: str, config: dict) -> str:
+    """Hash of what an agent is asked under this CONFIG: rendered instructions, schema and model settings."""
+    spec = AGENT_SPECS_BY_NAME.get(agent_name)
+    if spec is None:
+        return ""
+    return version_of(config).derived(("prompt_hash", agent_name), lambda: hash_payload(
+        render_instructions(spec, config),
+        spec.output_type.model_json_schema(),
+        [spec.model, spec.reasoning_effort, spec.verbosity, spec.strict_json_schema],
+    ))
 
-sales_packager = Agent[RouterContext](
-    name="Packager Sales",
-    instructions=get_packager_instructions("sales_forward"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
 
-events_packager = Agent[RouterContext](
-    name="Packager Events",
-    instructions=get_packager_instructions("events_forward"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
+def call_policy(agent_name: str, config: dict) -> AgentCallPolicy:
+    """Timeout/hedging policy of an agent under this CONFIG (LATENCY_POLICY), built once per version."""
+    policies = version_of(config).derived("call_policies", lambda: call_policies(config))
+    return policies.get(agent_name, DEFAULT_CALL_POLICY)
 
-other_packager = Agent[RouterContext](
-    name="Packager Other",
-    instructions=get_packager_instructions("other"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
 
-guardrails_block_packager = Agent[RouterContext](
-    name="Packager Guardrails Block",
-    instructions=get_packager_instructions("guardrails_block"),
-    model="gpt-5-mini",
-    model_settings=ModelSettings(
-        reasoning=Reasoning(effort="low"),
-        verbosity="low"
-    ),
-    output_type=AgentOutputSchema(RouterOutputSchema, strict_json_schema=False),
-)
+# Nombres del SDK que router re-exportaba; se resuelven bajo demanda en __getattr__
+_SDK_EXPORTS = {
+    "Agent": "agents",
+    "AgentOutputSchema": "agents",
+    "ModelSettings": "agents",
+    "RunConfig": "agents",
+    "Runner": "agents",
+    "RunHooks": "agents",
+    "RunContextWrapper": "agents.run",
+    "OpenAI": "openai",
+    "Reasoning": "openai.types.shared",
+}
+
+
+def __getattr__(name: str):
+    """Backwards compatibility: router.guardrails_agent, router.Runner, ... resolved lazily."""
+    if name == "CONFIG":
+        return config_store.current().data
+    if name in AGENT_SPECS:
+        return agent_registry[name]
+    if name in _SDK_EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(_SDK_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ================================================================================
@@ -1217,31 +1107,155 @@ def serialize_for_llm(data: BaseModel | dict | str) -> str:
 # TRACE & LOGGING - Mostrar input/output por agente en terminal
 # ================================================================================
 
-class TerminalRunHooks(RunHooks[RouterContext]):
+class RouterHooks:
+    """
+    SDK-free base for run hooks (same methods as agents.RunHooks, all no-ops).
+    
+    Subclasses don't need the agents SDK at import time; run_agent_with_logs
+    wraps them with as_run_hooks() before calling Runner.run.
+    """
+    
+    async def on_agent_start(self, context, agent) -> None:
+        pass
+    
+    async def on_agent_end(self, context, agent, output) -> None:
+        pass
+    
+    async def on_handoff(self, context, from_agent, to_agent) -> None:
+        pass
+    
+    async def on_tool_start(self, context, agent, tool) -> None:
+        pass
+    
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        pass
+    
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        pass
+    
+    async def on_llm_end(self, context, agent, response) -> None:
+        pass
+
+
+@lru_cache(maxsize=None)
+def _run_hooks_adapter() -> type:
+    """agents.RunHooks subclass forwarding every event to a RouterHooks (built on first use)."""
+    from agents import RunHooks
+    
+    class RunHooksAdapter(RunHooks[RouterContext]):
+        def __init__(self, target: RouterHooks):
+            self.target = target
+        
+        async def on_agent_start(self, context, agent):
+            await self.target.on_agent_start(context, agent)
+        
+        async def on_agent_end(self, context, agent, output):
+            await self.target.on_agent_end(context, agent, output)
+        
+        async def on_handoff(self, context, from_agent, to_agent):
+            await self.target.on_handoff(context, from_agent, to_agent)
+        
+        async def on_tool_start(self, context, agent, tool):
+            await self.target.on_tool_start(context, agent, tool)
+        
+        async def on_tool_end(self, context, agent, tool, result):
+            await self.target.on_tool_end(context, agent, tool, result)
+        
+        async def on_llm_start(self, context, agent, system_prompt, input_items):
+            await self.target.on_llm_start(context, agent, system_prompt, input_items)
+        
+        async def on_llm_end(self, context, agent, response):
+            await self.target.on_llm_end(context, agent, response)
+    
+    return RunHooksAdapter
+
+
+def as_run_hooks(hooks):
+    """Hooks accepted by Runner.run: SDK RunHooks pass through, RouterHooks get wrapped."""
+    if isinstance(hooks, RouterHooks):
+        return _run_hooks_adapter()(hooks)
+    return hooks
+
+
+class HedgedCallHooks(RouterHooks):
+    """
+    Hooks for one attempt of a possibly hedged agent call.
+    
+    The primary attempt forwards its events live; a hedge buffers them. When
+    the race resolves the loser is muted and the winner's pending events go
+    through (minus the ones the primary already announced), so every agent
+    call reports a single start/end pair.
+    """
+    
+    def __init__(self, target, live: bool):
+        self.target = target
+        self.live = live
+        self.muted = False
+        self.buffered: List[tuple] = []
+        self.forwarded: set = set()
+    
+    async def _forward(self, name: str, *args) -> None:
+        if self.muted:
+            return
+        if not self.live:
+            self.buffered.append((name, args))
+            return
+        self.forwarded.add(name)
+        await getattr(self.target, name)(*args)
+    
+    def mute(self) -> None:
+        self.muted = True
+        self.buffered.clear()
+    
+    async def promote(self, already_sent: set) -> None:
+        """Become the live attempt, replaying buffered events not yet sent by the other attempt."""
+        self.live = True
+        buffered, self.buffered = self.buffered, []
+        for name, args in buffered:
+            if name not in already_sent:
+                await self._forward(name, *args)
+    
+    async def on_agent_start(self, context, agent) -> None:
+        await self._forward("on_agent_start", context, agent)
+    
+    async def on_agent_end(self, context, agent, output) -> None:
+        await self._forward("on_agent_end", context, agent, output)
+    
+    async def on_handoff(self, context, from_agent, to_agent) -> None:
+        await self._forward("on_handoff", context, from_agent, to_agent)
+    
+    async def on_tool_start(self, context, agent, tool) -> None:
+        await self._forward("on_tool_start", context, agent, tool)
+    
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        await self._forward("on_tool_end", context, agent, tool, result)
+    
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        await self._forward("on_llm_start", context, agent, system_prompt, input_items)
+    
+    async def on_llm_end(self, context, agent, response) -> None:
+        await self._forward("on_llm_end", context, agent, response)
+
+
+class TerminalRunHooks(RouterHooks):
     """
     Hooks de ejecución para ver en terminal el flujo completo:
     - Inicio/fin de cada agente
     - Uso de tokens por agente
     - Handoffs y herramientas
     - Llamadas LLM
+    
+    Los eventos se envían al pipeline de logging (log_pipeline.py): nada se
+    formatea en el hot path y los prompts completos solo se serializan a nivel DEBUG.
     """
     def __init__(self, max_chars: int = 8000):
         self.step = 0
         self.max_chars = max_chars
 
-    def _hr(self, title: str) -> None:
-        print(f"\n{'=' * 20} {title} {'=' * 20}")
-
-    def _short(self, text: str) -> str:
-        if text is None:
-            return ""
-        if len(text) <= self.max_chars:
-            return text
-        return text[: self.max_chars] + f"\n...[{len(text)-self.max_chars} chars truncados]..."
-
     async def on_agent_start(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext]) -> None:
         self.step += 1
-        self._hr(f"[{self.step}] START Agent: {agent.name}")
+        logger.info("\n%s [%d] START Agent: %s %s", "=" * 20, self.step, agent.name, "=" * 20,
+                    extra={"event": "agent_start", "agent": agent.name, "step": self.step})
 
     async def on_llm_start(
         self,
@@ -1250,39 +1264,71 @@ class TerminalRunHooks(RunHooks[RouterContext]):
         system_prompt: Optional[str],
         input_items: list,
     ) -> None:
-        print(f"[LLM] {agent.name} → preparando llamada")
-        if system_prompt:
-            print("• system_prompt:")
-            print(self._short(system_prompt))
-        if input_items:
-            try:
-                # Intento de mostrar items de entrada de forma legible
-                payload = []
-                for it in input_items:
-                    payload.append(str(it))
-                print("• input_items:")
-                print(self._short("\n".join(payload)))
-            except Exception:
-                pass
+        logger.info("[LLM] %s → preparando llamada", agent.name, extra={"event": "llm_start", "agent": agent.name})
+        if system_prompt and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("• system_prompt:\n%s", LazyText(system_prompt, self.max_chars),
+                         extra={"event": "system_prompt", "agent": agent.name})
+        if input_items and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("• input_items:\n%s", LazyText(input_items, self.max_chars),
+                         extra={"event": "input_items", "agent": agent.name})
 
     async def on_llm_end(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext], response) -> None:
-        # Evitamos volcar respuestas muy grandes del LLM; el output final ya se imprime abajo.
-        print(f"[LLM] {agent.name} ← respuesta recibida")
+        # Evitamos volcar respuestas muy grandes del LLM; el output final ya se registra aparte.
+        logger.info("[LLM] %s ← respuesta recibida", agent.name, extra={"event": "llm_end", "agent": agent.name})
 
     async def on_tool_start(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext], tool) -> None:
-        print(f"[TOOL] {agent.name} → {getattr(tool, 'name', repr(tool))}")
+        logger.info("[TOOL] %s → %s", agent.name, getattr(tool, 'name', None) or tool,
+                    extra={"event": "tool_start", "agent": agent.name})
 
     async def on_tool_end(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext], tool, result: str) -> None:
-        print(f"[TOOL] {agent.name} ← {getattr(tool, 'name', repr(tool))} (ok)")
+        logger.info("[TOOL] %s ← %s (ok)", agent.name, getattr(tool, 'name', None) or tool,
+                    extra={"event": "tool_end", "agent": agent.name})
 
     async def on_handoff(self, context: RunContextWrapper[RouterContext], from_agent: Agent[RouterContext], to_agent: Agent[RouterContext]) -> None:
-        print(f"[HANDOFF] {from_agent.name} → {to_agent.name}")
+        logger.info("[HANDOFF] %s → %s", from_agent.name, to_agent.name,
+                    extra={"event": "handoff", "agent": from_agent.name})
 
     async def on_agent_end(self, context: RunContextWrapper[RouterContext], agent: Agent[RouterContext], output) -> None:
         # Tokens por agente
         u = context.usage
-        print(f"[USAGE] {agent.name} → requests={u.requests} input_tokens={u.input_tokens} output_tokens={u.output_tokens} total_tokens={u.total_tokens}")
-        self._hr(f"END Agent: {agent.name}")
+        logger.info(
+            "[USAGE] %s → requests=%d input_tokens=%d output_tokens=%d total_tokens=%d\n%s END Agent: %s %s",
+            agent.name, u.requests, u.input_tokens, u.output_tokens, u.total_tokens, "=" * 20, agent.name, "=" * 20,
+            extra={
+                "event": "agent_end",
+                "agent": agent.name,
+                "requests": u.requests,
+                "input_tokens": u.input_tokens,
+                "output_tokens": u.output_tokens,
+                "total_tokens": u.total_tokens,
+            },
+        )
+
+
+def log_agent_input(agent: Agent[RouterContext], inp: Union[str, List[dict]]) -> None:
+    """Log the input sent to an agent (full text only at DEBUG)."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if isinstance(inp, list):
+        # Multi-modal input (images, PDFs): resumen sin volcar base64
+        logger.debug("\n>>> INPUT → %s:\n%s", agent.name, LazyInputSummary(inp),
+                     extra={"event": "agent_input", "agent": agent.name})
+    else:
+        logger.debug("\n>>> INPUT → %s:\n%s", agent.name, LazyText(inp),
+                     extra={"event": "agent_input", "agent": agent.name})
+
+
+def log_agent_output(agent: Agent[RouterContext], out) -> None:
+    """Log an agent's structured output (serialized only at DEBUG)."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("\n<<< OUTPUT ← %s:\n%s", agent.name, LazyJSON(out),
+                     extra={"event": "agent_output", "agent": agent.name})
+
+
+@dataclass
+class ReplayedResult:
+    """Stand-in for the SDK RunResult when a recorded output is reused (replay)."""
+    final_output: Any
 
 
 async def run_agent_with_logs(
@@ -1291,81 +1337,993 @@ async def run_agent_with_logs(
     *,
     context: RouterContext,
     run_config: RunConfig,
-    hooks: TerminalRunHooks,
+    hooks: Union[RouterHooks, RunHooks[RouterContext]],
 ):
     """
     Helper que envuelve Runner.run para mostrar input/output de cada agente.
     Soporta tanto entradas de texto simple como mensajes multi-modales.
-    """
-    # Mostrar INPUT de manera apropiada según el tipo
-    if isinstance(inp, list):
-        # Multi-modal input (images, PDFs)
-        print(f"\n>>> INPUT → {agent.name}:")
-        print("[MULTI-MODAL INPUT - Messages with files]")
-        # Show simplified version to avoid printing large base64 strings
-        for msg in inp:
-            if isinstance(msg, dict):
-                role = msg.get("role", "user")
-                content = msg.get("content", [])
-                print(f"  Role: {role}")
-                
-                # Handle string content (simple text message)
-                if isinstance(content, str):
-                    print(f"    - Text: {content[:100]}...")
-                # Handle list content (multi-modal message)
-                elif isinstance(content, list):
-                    for item in content:
-                        if isinstance(item, dict):
-                            item_type = item.get("type", "unknown")
-                            if item_type == "input_file":
-                                filename = item.get("filename", "file")
-                                print(f"    - File: {filename}")
-                            elif item_type == "input_image":
-                                print(f"    - Image (base64)")
-                            elif item_type == "text":
-                                text = item.get("text", "")
-                                print(f"    - Text: {text[:100]}...")
-    else:
-        # Text input
-        print(f"\n>>> INPUT → {agent.name}:\n{inp if isinstance(inp, str) else serialize_for_llm(inp)}")
     
-    result = await Runner.run(agent, inp, context=context, run_config=run_config, hooks=hooks)
+    Raises:
+        WorkflowCancelled: si el token se cancela o vence el deadline antes o durante la llamada
+    """
+    # No lanzar más llamadas si ya nadie espera el resultado
+    context.check_cancelled()
+    
+    # Registrar INPUT (serialización perezosa, solo si el nivel lo emite)
+    log_agent_input(agent, inp)
+    
+    started = time.monotonic()
+    recorded_input = inp if isinstance(inp, str) else str(LazyInputSummary(inp))
+    prompt_hash = prompt_fingerprint(agent.name, context.config)
+    
+    # Replay: reutilizar la salida grabada si el prompt y la entrada no han cambiado
+    if context.replay is not None:
+        recorded = context.replay.lookup(agent.name, prompt_hash, recorded_input)
+        if recorded is not None:
+            out = AGENT_SPECS_BY_NAME[agent.name].output_type.model_validate(recorded)
+            context.record_usage(agent.name, None, status="replayed", started=started,
+                                 inp=recorded_input, output=recorded, prompt_hash=prompt_hash)
+            log_agent_output(agent, out)
+            return ReplayedResult(out)
+    
+    # Todas las llamadas salientes pasan por el scheduler global (rate limit + AIMD + prioridad)
+    model = agent.model if isinstance(agent.model, str) else str(agent.model)
+    estimated = estimate_tokens(inp)
+    
+    from agents import Runner
+    # Hedge: el duplicado no emite eventos salvo que gane (un solo start/end por llamada)
+    primary_hooks = HedgedCallHooks(hooks, live=True)
+    hedge_hooks = HedgedCallHooks(hooks, live=False)
+    
+    async def call_once(attempt_hooks: HedgedCallHooks = primary_hooks):
+        sdk_hooks = as_run_hooks(attempt_hooks)
+        attempt = 0
+        while True:
+            try:
+                async with outbound_scheduler.slot(
+                    model, context.priority, estimated,
+                    tenant=context.tenant_id, tenant_limits=context.config.get("RATE_LIMITS"),
+                ) as permit:
+                    run_result = await Runner.run(agent, inp, context=context, run_config=run_config, hooks=sdk_hooks)
+                    permit.record_usage(run_result.context_wrapper.usage.total_tokens)
+                return run_result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt >= outbound_scheduler.max_retries:
+                    # Única capa que reintenta 429: ni el nodo ni el trabajo vuelven a intentarlo
+                    raise RateLimitExhausted(attempt + 1) from e
+                outbound_scheduler.stats.retries += 1
+                await asyncio.sleep(outbound_scheduler.backoff_delay(attempt))
+                attempt += 1
+    
+    async def on_resolved(hedge_won: bool) -> None:
+        winner, loser = (hedge_hooks, primary_hooks) if hedge_won else (primary_hooks, hedge_hooks)
+        loser.mute()
+        await winner.promote(loser.forwarded)
+    
+    def on_loser_result(run_result) -> None:
+        # Coste real del hedge: los tokens de la llamada que perdió la carrera
+        usage = run_result.context_wrapper.usage
+        latency_tracker.stats_for(agent.name).hedge_extra_tokens += usage.total_tokens
+        context.record_usage(agent.name, usage, status="hedge_lost", started=started, inp=recorded_input, prompt_hash=prompt_hash)
+    
+    # Presupuesto de tiempo por agente (derivado del deadline) y hedging opcional
+    call = asyncio.create_task(call_with_policy(
+        agent.name,
+        call_once,
+        policy=call_policy(agent.name, context.config),
+        deadline=context.deadline,
+        estimated_tokens=estimated,
+        hedge_call=lambda: call_once(hedge_hooks),
+        on_resolved=on_resolved,
+        on_loser_result=on_loser_result,
+    ))
+    try:
+        if context.cancel_token is not None:
+            # Carrera contra el token: si se cancela, abortamos la llamada en curso
+            cancelled = asyncio.create_task(context.cancel_token.wait())
+            try:
+                await asyncio.wait({call, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                cancelled.cancel()
+            if not call.done():
+                call.cancel()
+                await asyncio.gather(call, return_exceptions=True)
+                context.record_usage(agent.name, None, status="aborted", started=started, inp=recorded_input, prompt_hash=prompt_hash)
+                context.check_cancelled()
+        result = await call
+    except AgentTimeoutError as e:
+        context.record_usage(agent.name, None, status="timeout", started=started, inp=recorded_input, prompt_hash=prompt_hash)
+        # Si el presupuesto se agotó por el deadline global, es una cancelación del run
+        if e.deadline_bound:
+            raise WorkflowCancelled("deadline_exceeded", context.usage_summary()) from None
+        context.check_cancelled()
+        raise
+    except asyncio.CancelledError:
+        # Cancelación desde fuera (rama hermana fallida, borrador especulativo descartado...)
+        if not call.done():
+            call.cancel()
+            await asyncio.gather(call, return_exceptions=True)
+            context.record_usage(agent.name, None, status="aborted", started=started, inp=recorded_input, prompt_hash=prompt_hash)
+        raise
+    except WorkflowCancelled:
+        raise
+    except Exception:
+        context.record_usage(agent.name, None, status="error", started=started, inp=recorded_input, prompt_hash=prompt_hash)
+        raise
     out = result.final_output
+    context.record_usage(
+        agent.name,
+        result.context_wrapper.usage,
+        started=started,
+        inp=recorded_input,
+        output=out.model_dump(by_alias=True) if isinstance(out, BaseModel) else out,
+        prompt_hash=prompt_hash,
+    )
     
-    # Mostrar OUTPUT estructurado y legible
-    if isinstance(out, BaseModel):
-        printable = json.dumps(out.model_dump(by_alias=True), ensure_ascii=False, indent=2)
-    elif isinstance(out, (dict, list)):
-        printable = json.dumps(out, ensure_ascii=False, indent=2)
-    else:
-        printable = str(out)
-    print(f"\n<<< OUTPUT ← {agent.name}:\n{printable}")
+    # Registrar OUTPUT estructurado
+    log_agent_output(agent, out)
     return result
 
 
-async def run_workflow_async(workflow: WorkflowInput, hooks: Optional[RunHooks[RouterContext]] = None) -> dict:
+# ================================================================================
+# ROUTE GRAPHS - Declarative pipelines per category, run by pipeline.PipelineExecutor
+# ================================================================================
+
+NODE_CACHE_SIZE = int(os.getenv("ROUTER_NODE_CACHE_SIZE", "512"))
+
+
+@dataclass
+class StepState:
+    """What every node needs to call agents: the run context, tracing config and hooks."""
+    context: RouterContext
+    run_config: RunConfig
+    hooks: Union[RouterHooks, RunHooks[RouterContext]]
+
+
+def config_fingerprint(config: dict) -> str:
+    """Hash of a CONFIG version (computed once per version) so cached nodes follow config changes."""
+    return version_of(config).fingerprint
+
+
+def dump(model: BaseModel) -> dict:
+    return model.model_dump(by_alias=True)
+
+
+def safe_text(values: dict) -> str:
+    return values["guard"].safe_text
+
+
+def input_view(stage: str) -> Callable[[dict], str]:
+    """build_input for an agent that gets the budgeted view of safe_text for stage."""
+    return lambda values: values["views"].view(stage)
+
+
+def guard_passed(values: dict) -> bool:
+    return values["guard"].pass_
+
+
+def tenant_of(context: RouterContext) -> str:
+    return context.tenant_id or tenant_registry.default_tenant
+
+
+def agent_node(
+    name: str,
+    agent_key: str,
+    inputs: tuple,
+    build_input: Callable[[dict], Union[str, List[dict]]],
+    *,
+    cache: bool = False,
+    cache_on: Optional[Callable[[dict], object]] = None,
+    reuse: Optional[Callable[[dict], Optional[BaseModel]]] = None,
+    **options,
+) -> Node:
+    """
+    Node that runs one agent on build_input(values) and yields its final_output.
+    
+    With cache=True the output is reused for the same agent, input and CONFIG;
+    cache_on narrows the key to the part of the values the agent really depends on.
+    reuse(values) may return an earlier output to use instead of calling the agent.
+    """
+    def record_without_call(values: dict, state: StepState, output, status: str) -> None:
+        # Queda en el registro de la ejecución como si el agente hubiera respondido
+        agent_name = AGENT_SPECS[agent_key].name
+        state.context.record_usage(
+            agent_name, None, status=status,
+            inp=build_input(values), output=dump(output),
+            prompt_hash=prompt_fingerprint(agent_name, state.context.config),
+        )
+    
+    async def run(values: dict, state: StepState):
+        if reuse is not None:
+            output = reuse(values)
+            if output is not None:
+                record_without_call(values, state, output, "reused")
+                return output
+        result = await run_agent_with_logs(
+            agent_registry[agent_key],
+            build_input(values),
+            context=state.context,
+            run_config=state.run_config,
+            hooks=state.hooks,
+        )
+        return result.final_output
+    
+    def cache_key(values: dict, state: StepState) -> str:
+        key_input = cache_on(values) if cache_on is not None else build_input(values)
+        return hash_payload(agent_key, key_input, config_fingerprint(state.context.config))
+    
+    def on_cached(values: dict, state: StepState, output) -> None:
+        record_without_call(values, state, output, "cached")
+    
+    return Node(
+        name, run, inputs=inputs, agent=agent_key,
+        cache_key=cache_key if cache else None, on_cached=on_cached if cache else None, **options,
+    )
+
+
+def draft_node(
+    name: str,
+    template_key: str,
+    polish_agent_key: str,
+    inputs: tuple,
+    build: Callable[[dict], dict],
+    **options,
+) -> Node:
+    """Node that renders a DraftEmailSchema; build(values) returns draft_email's agent_input/fields/to/cc/language."""
+    async def run(values: dict, state: StepState) -> DraftEmailSchema:
+        return await draft_email(
+            template_key,
+            agent_registry[polish_agent_key],
+            **build(values),
+            context=state.context,
+            run_config=state.run_config,
+            hooks=state.hooks,
+        )
+    
+    return Node(name, run, inputs=inputs, agent=polish_agent_key, **options)
+
+
+def pick_node(name: str, source: str, attribute: str, **options) -> Node:
+    """Node that projects one field of a composite output (fused/combined agents)."""
+    async def run(values: dict, state: StepState):
+        return getattr(values[source], attribute)
+    
+    return Node(name, run, inputs=(source,), **options)
+
+
+def owner_node() -> Node:
+    # El owner solo depende de la categoría (CONFIG["OWNERS"]): caché por categoría
+    return agent_node(
+        "owner", "owner_map_agent", ("intent",),
+        lambda v: serialize_for_llm(v["intent"]),
+        cache=True, cache_on=lambda v: v["intent"].category,
+    )
+
+
+def ack_route(category: str, template_key: str, packager_key: str, note: str) -> Pipeline:
+    """Owner mapping + acknowledgment to the sender (cc owner) + packaging; shared by event and other."""
+    return Pipeline(category, [
+        owner_node(),
+        draft_node(
+            "draft", template_key, "draft_generic_ack_agent", ("intent", "owner"),
+            lambda v: {
+                "agent_input": note,
+                "fields": {"owner_name": v["owner"].owner_name},
+                "cc": v["owner"].owner_email,
+                "language": v["intent"].language,
+            },
+        ),
+        agent_node(
+            "package", packager_key, ("draft", "owner"),
+            lambda v: serialize_for_llm({"draft_email": dump(v["draft"]), "owner_map": dump(v["owner"])}),
+        ),
+    ], outputs=("package",), sources=("guard", "intent", "views"))
+
+
+_cv_index = None
+
+
+def get_cv_index() -> "CVIndex":
+    """Index of previously processed CVs shared by this process (opened on first use)."""
+    global _cv_index
+    if _cv_index is None:
+        from cv_index import CVIndex
+        _cv_index = CVIndex()
+    return _cv_index
+
+
+@dataclass
+class PriorCV:
+    """Most similar CV the tenant already processed (see cv_index.py)."""
+    record: "CVRecord"
+    similarity: float
+    duplicate: bool  # Devolver el resultado previo tal cual
+    match: Optional[CVMatchSchema]  # Matching previo reutilizable (mismo prompt de matching), o None
+
+
+def cv_dedup_enabled(context: RouterContext) -> bool:
+    # En replay se reproduce la ejecución grabada: ni se consulta ni se amplía el índice
+    return context.replay is None and context.config["CV_POLICY"]["dedup"]["enabled"]
+
+
+def cv_match_prompt_hash(config: dict) -> str:
+    """Fingerprint of the prompt that produces CVMatchSchema in the active CV pipeline."""
+    agent_key = "cv_extract_match_agent" if config["ROUTING_POLICY"]["cv_pipeline"] == "fused" else "cv_match_agent"
+    return prompt_fingerprint(AGENT_SPECS[agent_key].name, config)
+
+
+async def find_prior_cv(values: dict, state: StepState) -> Optional[PriorCV]:
+    context = state.context
+    if not cv_dedup_enabled(context):
+        return None
+    policy = context.config["CV_POLICY"]["dedup"]
+    try:
+        nearest = await asyncio.to_thread(
+            get_cv_index().nearest,
+            tenant_of(context),
+            values["cv"].model_dump(),
+            since=time.time() - policy["max_age_days"] * 86400,
+        )
+    except Exception as e:
+        # El índice es una optimización: si falla, la ruta sigue completa
+        logger.warning("[CV index] búsqueda fallida: %s", e, extra={"event": "cv_index_error"})
+        return None
+    if not nearest:
+        return None
+    similarity, record = nearest[0]
+    if similarity < policy["reuse_match_threshold"]:
+        return None
+    duplicate = (
+        similarity >= policy["duplicate_threshold"]
+        and record.result is not None
+        and record.config_fingerprint == config_fingerprint(context.config)
+    )
+    reusable = record.match is not None and record.match_prompt_hash == cv_match_prompt_hash(context.config)
+    if not duplicate and not reusable:
+        return None
+    logger.info(
+        "[CV index] CV similar (%.3f) a #%d → %s", similarity, record.record_id,
+        "duplicado" if duplicate else "reutiliza matching", extra={"event": "cv_prior"},
+    )
+    return PriorCV(record, similarity, duplicate, CVMatchSchema.model_validate(record.match) if reusable else None)
+
+
+def cv_is_duplicate(values: dict) -> bool:
+    return values["prior"] is not None and values["prior"].duplicate
+
+
+def cv_reused_match(values: dict) -> Optional[CVMatchSchema]:
+    return values["prior"].match if values["prior"] is not None else None
+
+
+async def duplicate_result(values: dict, state: StepState) -> RouterOutputSchema:
+    prior: PriorCV = values["prior"]
+    output = RouterOutputSchema.model_validate(prior.record.result)
+    return output.model_copy(update={"payload": {
+        **output.payload,
+        "duplicate_of": {
+            "record_id": prior.record.record_id,
+            "run_id": prior.record.run_id,
+            "similarity": round(prior.similarity, 4),
+            "processed_at": prior.record.created_at,
+        },
+    }})
+
+
+async def remember_cv(values: dict, state: StepState) -> None:
+    context = state.context
+    if not cv_dedup_enabled(context):
+        return None
+    output = values["pack_reject"] if values["pack_reject"] is not SKIPPED else values["pack_forward"]
+    try:
+        await asyncio.to_thread(
+            get_cv_index().add,
+            tenant_of(context),
+            values["cv"].model_dump(),
+            match=dump(values["match"]),
+            result=dump(output),
+            final_route=output.final_route,
+            config_fingerprint=config_fingerprint(context.config),
+            match_prompt_hash=cv_match_prompt_hash(context.config),
+            run_id=context.run_id,
+        )
+    except Exception as e:
+        logger.warning("[CV index] no se pudo guardar el CV: %s", e, extra={"event": "cv_index_error"})
+    return None
+
+
+def cv_should_reject(values: dict) -> bool:
+    match: CVMatchSchema = values["match"]
+    if match is SKIPPED:
+        # Duplicado de un CV ya procesado: no se redacta nada
+        return False
+    return not match.vacancies_found or len(match.matched_roles) == 0 or match.best_match is None
+
+
+def cv_forward_fields(values: dict) -> dict:
+    cv, match, owner = values["cv"], values["match"], values["owner"]
+    return {
+        "agent_input": {
+            "cv_extract": dump(cv),
+            "matched_roles": [dump(r) for r in match.matched_roles],
+            "owner_map": dump(owner),
+        },
+        "fields": {
+            **cv.model_dump(),
+            **match.best_match.model_dump(),
+            "owner_name": owner.owner_name,
+            "matched_roles": "\n".join(
+                f"- {r.title} ({r.role_id}, {r.department}): {r.match_score}%" for r in match.matched_roles
+            ),
+        },
+        "to": owner.owner_email,
+        "language": "es",
+    }
+
+
+@lru_cache(maxsize=None)
+def cv_route(fused: bool, speculative_reject: bool) -> Pipeline:
+    """
+    CV: extract, match against vacancies, then forward to HR or reject.
+    
+    Every CV is looked up in the tenant's index of processed CVs first: a
+    near-duplicate returns the earlier result, a close one reuses its match
+    and only redrafts (CONFIG["CV_POLICY"]["dedup"]).
+    
+    fused: extraction + matching in a single structured call.
+    speculative_reject: the rejection draft starts as soon as cv is extracted
+    and is cancelled if the match forwards the candidate.
+    """
+    if fused:
+        extract = [
+            agent_node("cv_extract_match", "cv_extract_match_agent", ("views",), input_view("cv"), cache=True, retries=1),
+            pick_node("cv", "cv_extract_match", "cv_extract"),
+            pick_node("match", "cv_extract_match", "cv_match", after=("prior",), when=lambda v: not cv_is_duplicate(v)),
+        ]
+    else:
+        extract = [
+            agent_node("cv", "cv_extract_agent", ("views",), input_view("cv"), cache=True, retries=1),
+            agent_node(
+                "match", "cv_match_agent", ("cv",),
+                lambda v: f"Candidate data:\n{serialize_for_llm(v['cv'])}",
+                cache=True, retries=1, reuse=cv_reused_match,
+                after=("prior",), when=lambda v: not cv_is_duplicate(v),
+            ),
+        ]
+    return Pipeline("cv", [
+        owner_node(),
+        *extract,
+        Node("prior", find_prior_cv, inputs=("cv",)),
+        Node("duplicate", duplicate_result, inputs=("prior",), when=cv_is_duplicate),
+        draft_node(
+            "draft_reject", "cv_reject", "draft_reject_agent", ("cv", "intent"),
+            lambda v: {
+                "agent_input": dump(v["cv"]),
+                "fields": {**v["cv"].model_dump(), "first_name": first_name(v["cv"].full_name)},
+                "to": v["cv"].email,
+                "language": v["intent"].language,
+            },
+            after=("match",), when=cv_should_reject, speculative=speculative_reject,
+        ),
+        agent_node(
+            "pack_reject", "hr_reject_packager", ("cv", "draft_reject", "owner"),
+            lambda v: serialize_for_llm({
+                "reason": "no_vacancies",
+                "cv_extract": dump(v["cv"]),
+                "draft_email": dump(v["draft_reject"]),
+                "owner_map": dump(v["owner"]),
+            }),
+        ),
+        draft_node(
+            "draft_forward", "cv_forward", "draft_hr_forward_agent", ("cv", "match", "owner"),
+            cv_forward_fields, when=lambda v: not cv_should_reject(v),
+        ),
+        agent_node(
+            "pack_forward", "hr_forward_packager", ("cv", "match", "draft_forward", "owner"),
+            lambda v: serialize_for_llm({
+                "cv_extract": dump(v["cv"]),
+                "matched_roles": [dump(r) for r in v["match"].matched_roles],
+                "draft_email": dump(v["draft_forward"]),
+                "owner_map": dump(v["owner"]),
+            }),
+        ),
+        Node("remember", remember_cv, inputs=("cv", "match"), after=("pack_reject", "pack_forward")),
+    ], outputs=("duplicate", "pack_reject", "pack_forward"), sources=("guard", "intent", "views"))
+
+
+_lead_index = None
+
+# Paso del registro de la ejecución con la vista de cuenta (el replay la reutiliza)
+LEAD_INDEX_STEP = "Lead index"
+
+
+def get_lead_index() -> "LeadIndex":
+    """Company/domain index of processed leads shared by this process (opened on first use)."""
+    global _lead_index
+    if _lead_index is None:
+        from lead_index import LeadIndex
+        _lead_index = LeadIndex()
+    return _lead_index
+
+
+def sales_input_hash(values: dict) -> str:
+    return hash_payload("sales_extract_agent", values["views"].view("sales"))
+
+
+async def find_prior_extraction(values: dict, state: StepState) -> Optional[SalesExtractSchema]:
+    """Extraction of the very same message (same extractor prompt) stored by an earlier run, if any."""
+    context = state.context
+    if context.replay is not None:
+        return None
+    try:
+        extract = await asyncio.to_thread(
+            get_lead_index().find_extraction,
+            tenant_of(context),
+            sales_input_hash(values),
+            prompt_fingerprint(AGENT_SPECS["sales_extract_agent"].name, context.config),
+        )
+    except Exception as e:
+        logger.warning("[Lead index] búsqueda fallida: %s", e, extra={"event": "lead_index_error"})
+        return None
+    return SalesExtractSchema.model_validate(extract) if extract is not None else None
+
+
+async def merge_account(values: dict, state: StepState) -> Optional[dict]:
+    """Add the lead to its company account; returns the account view (None if the index is unavailable)."""
+    context = state.context
+    if context.replay is not None:
+        # En replay no se escribe en el índice: vista de cuenta de la ejecución original
+        return context.replay.recorded(LEAD_INDEX_STEP)
+    sales: SalesExtractSchema = values["sales"]
+    started = time.monotonic()
+    try:
+        account = await asyncio.to_thread(
+            get_lead_index().record,
+            tenant_of(context),
+            sales.model_dump(),
+            run_id=context.run_id,
+            input_hash=sales_input_hash(values),
+            prompt_hash=prompt_fingerprint(AGENT_SPECS["sales_extract_agent"].name, context.config),
+        )
+    except Exception as e:
+        logger.warning("[Lead index] no se pudo registrar el lead: %s", e, extra={"event": "lead_index_error"})
+        return None
+    if account["repeat"]:
+        logger.info(
+            "[Lead index] %s → cuenta %s (%d leads, por %s)", sales.company, account["name"], account["leads"],
+            account["matched_by"], extra={"event": "lead_repeat"},
+        )
+    context.record_usage(LEAD_INDEX_STEP, None, started=started, inp=sales.company, output=account)
+    return account
+
+
+def account_history(account: Optional[dict]) -> str:
+    """Briefing paragraph about earlier leads of the same company ("" for new accounts)."""
+    if not account or not account["repeat"]:
+        return ""
+    lines = [
+        f"**Cuenta conocida: {account['name']}** ({account['leads'] - 1} leads anteriores; "
+        f"mejor score {account['best_score']}, prioridad {account['best_priority']})",
+        "- Contactos: " + ", ".join(f"{c['name']} <{c['email']}>" for c in account["contacts"]),
+    ]
+    for lead in account["recent_leads"][:-1]:
+        day = time.strftime("%Y-%m-%d", time.localtime(lead["created_at"]))
+        lines.append(f"- {day}: {lead['contact_name']}, score {lead['lead_score']} ({lead['priority']}): {lead['intent_summary']}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def with_account(values: dict, state: StepState) -> RouterOutputSchema:
+    output: RouterOutputSchema = values["package"]
+    if values["account"] is None:
+        return output
+    return output.model_copy(update={"payload": {**output.payload, "account": values["account"]}})
+
+
+SALES_ROUTE = Pipeline("sales", [
+    owner_node(),
+    Node("prior_extract", find_prior_extraction, inputs=("views",)),
+    agent_node(
+        "sales", "sales_extract_agent", ("views",), input_view("sales"),
+        cache=True, retries=1, reuse=lambda v: v["prior_extract"], after=("prior_extract",),
+    ),
+    Node("account", merge_account, inputs=("sales",)),
+    draft_node(
+        "draft", "sales_internal", "draft_sales_forward_agent", ("sales", "owner", "account"),
+        lambda v: {
+            "agent_input": {"sales_extract": dump(v["sales"]), "owner_map": dump(v["owner"]), "account": v["account"]},
+            "fields": {
+                **v["sales"].model_dump(),
+                "owner_name": v["owner"].owner_name,
+                "account_history": account_history(v["account"]),
+            },
+            "to": v["owner"].owner_email,
+            "language": "es",
+        },
+    ),
+    agent_node(
+        "package", "sales_packager", ("sales", "draft", "owner"),
+        lambda v: serialize_for_llm({
+            "sales_extract": dump(v["sales"]),
+            "draft_email": dump(v["draft"]),
+            "owner_map": dump(v["owner"]),
+        }),
+    ),
+    Node("result", with_account, inputs=("package", "account")),
+], outputs=("result",), sources=("guard", "intent", "views"))
+
+
+EVENT_ROUTE = ack_route(
+    "event", "events", "events_packager",
+    "Context: Event/partnership/press inquiry. Generate acknowledgment requesting details.",
+)
+
+OTHER_ROUTE = ack_route(
+    "other", "generic", "other_packager",
+    "Context: Generic inquiry. Generate acknowledgment requesting key details.",
+)
+
+
+def route_pipeline(category: str, config: dict) -> Pipeline:
+    """Pipeline for a category under this CONFIG; unknown categories fall back to "other"."""
+    if category == "cv":
+        drafting = config.get("DRAFTING_POLICY", {})
+        return cv_route(
+            fused=config.get("ROUTING_POLICY", {}).get("cv_pipeline") == "fused",
+            # Especular solo compensa si el rechazo pasa por el LLM (la plantilla es instantánea);
+            # config_store rechaza speculative_reject sin "cv_reject" en llm_polish
+            speculative_reject=bool(drafting.get("speculative_reject")) and "cv_reject" in drafting.get("llm_polish", []),
+        )
+    return {"sales": SALES_ROUTE, "event": EVENT_ROUTE}.get(category, OTHER_ROUTE)
+
+
+# Tokens de safe_text frente a tokens enviados, por etapa (GET /api/preprocessing)
+preprocess_stats = PreprocessStats()
+
+
+async def build_views(values: dict, state: StepState) -> InputViews:
+    """Budgeted per-stage views of safe_text (INPUT_POLICY); guardrails itself always sees the full input."""
+    return InputViews(values["guard"].safe_text, state.context.config.get("INPUT_POLICY", {"enabled": False}), preprocess_stats)
+
+
+@lru_cache(maxsize=None)
+def classify_pipeline(combined: bool) -> Pipeline:
+    """Guardrails + intent (one combined call or two), or the block packager when guardrails fail."""
+    if combined:
+        classify = [
+            agent_node("guard_intent", "guardrails_intent_agent", ("input",), lambda v: v["input"]),
+            pick_node("guard", "guard_intent", "guardrails"),
+            # Si guardrails bloquea, la intención combinada simplemente se ignora
+            pick_node("intent", "guard_intent", "intent", after=("guard",), when=guard_passed),
+        ]
+    else:
+        classify = [
+            agent_node("guard", "guardrails_agent", ("input",), lambda v: v["input"]),
+            agent_node("intent", "intent_agent", ("views",), input_view("classifier")),
+        ]
+    return Pipeline("classify", [
+        Node("views", build_views, inputs=("guard",), when=guard_passed),
+        *classify,
+        agent_node(
+            "block", "guardrails_block_packager", ("guard",),
+            lambda v: serialize_for_llm({"safe_text": v["guard"].safe_text, "flags": dump(v["guard"].flags)}),
+            when=lambda v: not guard_passed(v),
+        ),
+    ], outputs=("block", "intent"), sources=("input",))
+
+
+@dataclass
+class SpeculationStats:
+    """Outcome of speculative nodes (the CV rejection draft started alongside cv_match)."""
+    started: int = 0
+    used: int = 0
+    wasted: int = 0
+    wasted_tokens: int = 0
+    
+    def snapshot(self) -> dict:
+        return {
+            "started": self.started,
+            "used": self.used,
+            "wasted": self.wasted,
+            "wasted_ratio": round(self.wasted / self.started, 3) if self.started else 0.0,
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+async def record_speculation(node: Node, used: bool, state: StepState) -> None:
+    """Executor callback: count a speculative node and flag the tokens an unused one spent."""
+    speculation_stats.started += 1
+    if used:
+        speculation_stats.used += 1
+        return
+    speculation_stats.wasted += 1
+    agent_name = AGENT_SPECS[node.agent].name
+    for entry in state.context.usage_log:
+        if entry["agent"] == agent_name and entry["status"] in ("ok", "aborted"):
+            entry["status"] = "speculative_wasted"
+            speculation_stats.wasted_tokens += entry["total_tokens"]
+
+
+# Ejecutor compartido: la caché de nodos vive entre ejecuciones del workflow
+route_executor = PipelineExecutor(
+    cache=NodeCache(NODE_CACHE_SIZE),
+    no_retry=(WorkflowCancelled, AgentTimeoutError, RateLimitExhausted),
+    on_speculation=record_speculation,
+)
+
+
+def use_combined_classifier(config: dict) -> bool:
+    """Whether this run uses the single-pass guardrails+intent classifier (A/B share wins if set)."""
+    policy = config.get("ROUTING_POLICY", {})
+    share = policy.get("combined_classifier_share")
+    if share is not None:
+        combined = random.random() < share
+        logger.info("[A/B] clasificador → %s", "combined" if combined else "split", extra={"event": "classifier_ab"})
+        return combined
+    return policy.get("classifier") == "combined"
+
+
+def select_branches(intent: IntentSchema, config: dict) -> List[str]:
+    """
+    Categories whose branch must run, primary first.
+    
+    "other" is dropped when a specific category is present; with multi-intent
+    disabled only the primary category runs (legacy behaviour).
+    """
+    policy = config.get("ROUTING_POLICY", {})
+    if not policy.get("multi_intent", True):
+        return [intent.category]
+    
+    categories = list(dict.fromkeys([intent.category, *intent.categories]))
+    specific = [c for c in categories if c != "other"]
+    return (specific or ["other"])[:policy.get("max_branches", 3)]
+
+
+async def run_branch(
+    category: str,
+    guard: GuardrailsSchema,
+    intent: IntentSchema,
+    views: InputViews,
+    *,
+    context: RouterContext,
+    run_config: RunConfig,
+    hooks: RunHooks[RouterContext],
+) -> dict:
+    """Run the category's route graph; returns the packaged RouterOutputSchema dict."""
+    if intent.category != category:
+        # El owner se mapea según la intención de esta rama
+        intent = intent.model_copy(update={"category": category, "categories": [category]})
+    
+    pipeline = route_pipeline(category, context.config)
+    values = await route_executor.execute(
+        pipeline,
+        StepState(context, run_config, hooks),
+        known={"guard": guard, "intent": intent, "views": views},
+    )
+    return dump(pipeline.result(values))
+
+
+async def run_branches_parallel(
+    categories: List[str],
+    guard: GuardrailsSchema,
+    intent: IntentSchema,
+    views: InputViews,
+    *,
+    context: RouterContext,
+    run_config: RunConfig,
+    hooks: RunHooks[RouterContext],
+) -> dict:
+    """
+    Run several branches concurrently and merge them into one multi_route output.
+    
+    If one branch fails the others are cancelled and the error propagates.
+    """
+    tasks = [
+        asyncio.create_task(run_branch(
+            category, guard, intent, views,
+            context=context, run_config=run_config, hooks=hooks,
+        ))
+        for category in categories
+    ]
+    try:
+        outputs = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    
+    return {
+        "final_route": "multi_route",
+        "payload": {
+            "categories": categories,
+            "language": intent.language,
+            "routes": outputs,
+        },
+    }
+
+
+async def draft_email(
+    template_key: str,
+    polish_agent: Agent[RouterContext],
+    agent_input: Union[dict, str],
+    fields: dict,
+    *,
+    to: str = "",
+    cc: str = "",
+    language: str,
+    context: RouterContext,
+    run_config: RunConfig,
+    hooks: RunHooks[RouterContext],
+) -> DraftEmailSchema:
+    """
+    Render the draft locally from the precompiled template for this route/language.
+    
+    Only routes listed in DRAFTING_POLICY["llm_polish"] also go through the LLM
+    drafter, which receives the template draft as a starting point.
+    """
+    rendered = get_template_engine(context.config).render(template_key, language, fields, to=to, cc=cc)
+    draft = DraftEmailSchema(**rendered)
+    
+    if template_key not in context.config.get("DRAFTING_POLICY", {}).get("llm_polish", []):
+        return draft
+    
+    polish_input = serialize_for_llm({
+        "template_draft": draft.model_dump(by_alias=True),
+        "language": language,
+        "data": agent_input,
+    })
+    polish_result = await run_agent_with_logs(
+        polish_agent,
+        polish_input,
+        context=context,
+        run_config=run_config,
+        hooks=hooks,
+    )
+    return polish_result.final_output
+
+
+def build_run_record(
+    workflow: WorkflowInput,
+    context: RouterContext,
+    *,
+    run_id: str,
+    created_at: float,
+    status: str,
+    result: Optional[dict] = None,
+    error: Optional[str] = None,
+) -> dict:
+    """Run record for the run store: route, intent, timings, tokens and per-agent I/O."""
+    usage = context.usage_summary()
+    intent = context.intent
+    return {
+        "run_id": run_id,
+        "created_at": created_at,
+        "tenant_id": context.tenant_id,
+        "input_hash": hash_payload(workflow.input_as_text or "", workflow.input_messages or []),
+        "status": status,
+        "final_route": result.get("final_route") if result else None,
+        "intent_category": intent.category if intent else None,
+        "categories": context.categories or None,
+        "language": intent.language if intent else None,
+        "confidence": intent.confidence if intent else None,
+        "priority": context.priority,
+        "config_fingerprint": config_fingerprint(context.config),
+        "elapsed_ms": round((time.monotonic() - context.started_at) * 1000, 1),
+        "total_tokens": usage["total_tokens"],
+        "requests": usage["requests"],
+        "error": error,
+        "result": result,
+        "agents": [{**entry, **io} for entry, io in zip(context.usage_log, context.agent_io)],
+    }
+
+
+async def route_workflow(initial_input: Union[str, List[dict]], state: StepState) -> dict:
+    """Classify the input and run the matching route graph(s); fills context.intent/categories."""
+    context = state.context
+    
+    # ============================================================
+    # STEP 1: Guardrails + intent (block packager if guardrails fail)
+    # ============================================================
+    classified = await route_executor.execute(
+        classify_pipeline(use_combined_classifier(context.config)),
+        state,
+        known={"input": initial_input},
+    )
+    if classified["block"] is not SKIPPED:
+        return dump(classified["block"])
+    guard: GuardrailsSchema = classified["guard"]
+    intent: IntentSchema = classified["intent"]
+    views: InputViews = classified["views"]
+    context.intent = intent
+    
+    # ============================================================
+    # STEP 2-3: Route graph(s) by category
+    # ============================================================
+    categories = select_branches(intent, context.config)
+    context.categories = categories
+    
+    if len(categories) == 1:
+        return await run_branch(
+            categories[0], guard, intent, views,
+            context=context, run_config=state.run_config, hooks=state.hooks,
+        )
+    
+    # Varias intenciones: grafos en paralelo que comparten el resultado de guardrails
+    return await run_branches_parallel(
+        categories, guard, intent, views,
+        context=context, run_config=state.run_config, hooks=state.hooks,
+    )
+
+
+async def run_workflow_async(
+    workflow: WorkflowInput,
+    hooks: Optional[Union[RouterHooks, RunHooks[RouterContext]]] = None,
+    priority: str = "interactive",
+    timeout: Optional[float] = DEFAULT_WORKFLOW_TIMEOUT,
+    deadline: Optional[float] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    run_store: Optional[RunStore] = None,
+    run_id: Optional[str] = None,
+    config: Optional[dict] = None,
+    replay: Optional[RecordedCalls] = None,
+    tenant_id: Optional[str] = None,
+) -> dict:
     """
     Main orchestration function. Follows the routing logic:
-    1. Guardrails check
-    2. Intent classification
-    3. Branch by category (cv/sales/event/other)
-    4. Generate drafts and package final output
+    1. Guardrails check and intent classification (classify_pipeline)
+    2. Branch by category (cv/sales/event/other) through its route graph;
+       mixed-intent messages run every matching graph concurrently and
+       return a "multi_route" output
+    3. Generate drafts and package final output
     
     Supports both text and multi-modal inputs (images, PDFs).
     
     Args:
         workflow: Input configuration
         hooks: Optional custom hooks for event handling (defaults to TerminalRunHooks)
+        priority: Scheduler lane for this run's LLM calls (interactive, batch, background)
+        timeout: Overall deadline in seconds; per-agent budgets are derived from it
+        deadline: Absolute deadline (time.monotonic()); takes precedence over timeout
+        cancel_token: Aborts the remaining agents when cancelled
+        run_store: If given, the run (also failed or cancelled ones) is recorded there
+        run_id: Identifier for the run record (random if omitted)
+        config: CONFIG to route with (defaults to the tenant's active version)
+        tenant_id: Tenant (subsidiary) of the run; None = default tenant
+        replay: Recorded agent outputs reused instead of LLM calls (see replay.py)
+    
+    Raises:
+        WorkflowCancelled: when cancelled or past the deadline; includes the partial usage
+        UnknownTenant: when tenant_id has no config
     """
     
-    # Initialize context with CONFIG
-    context = RouterContext(config=CONFIG)
+    if deadline is None and timeout:
+        deadline = time.monotonic() + timeout
+    
+    # Initialize context with CONFIG: the run keeps this snapshot even if the file is reloaded
+    tenant_id = tenant_id or tenant_registry.default_tenant
+    run_id = run_id or uuid.uuid4().hex
+    context = RouterContext(
+        config=config if config is not None else tenant_registry.current(tenant_id).data,
+        tenant_id=tenant_id,
+        run_id=run_id,
+        priority=priority,
+        deadline=deadline,
+        cancel_token=cancel_token,
+        replay=replay,
+    )
+    created_at = time.time()
     
     # Use provided hooks or default terminal hooks
     if hooks is None:
         hooks = TerminalRunHooks()
     
     # Configure tracing
+    from agents import RunConfig
     run_config = RunConfig(
         workflow_name="ticket_router_mvp",
         trace_metadata={
@@ -1382,255 +2340,29 @@ async def run_workflow_async(workflow: WorkflowInput, hooks: Optional[RunHooks[R
     else:
         initial_input = workflow.input_as_text
     
-    # ============================================================
-    # STEP 1: Guardrails
-    # ============================================================
-    gr_result = await run_agent_with_logs(
-        guardrails_agent,
-        initial_input,
-        context=context,
-        run_config=run_config,
-        hooks=hooks,
-    )
-    guard: GuardrailsSchema = gr_result.final_output
-    
-    # If guardrails block, stop here
-    if not guard.pass_:
-        pack_input = serialize_for_llm({
-            "safe_text": guard.safe_text,
-            "flags": guard.flags.model_dump(by_alias=True)
-        })
-        pack_result = await run_agent_with_logs(
-            guardrails_block_packager,
-            pack_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        return pack_result.final_output.model_dump(by_alias=True)
-    
-    # ============================================================
-    # STEP 2: Intent Classification
-    # ============================================================
-    intent_result = await run_agent_with_logs(
-        intent_agent,
-        guard.safe_text,
-        context=context,
-        run_config=run_config,
-        hooks=hooks,
-    )
-    intent: IntentSchema = intent_result.final_output
-    
-    # ============================================================
-    # STEP 3: Owner Mapping (parallel, always needed)
-    # ============================================================
-    owner_result = await run_agent_with_logs(
-        owner_map_agent,
-        serialize_for_llm(intent),
-        context=context,
-        run_config=run_config,
-        hooks=hooks,
-    )
-    owner: OwnerMapSchema = owner_result.final_output
-    
-    # ============================================================
-    # STEP 4: Branch by Category
-    # ============================================================
-    
-    category = intent.category
-    
-    # ----------------------------------------------------------
-    # BRANCH: CV
-    # ----------------------------------------------------------
-    if category == "cv":
-        # Extract CV data
-        cv_result = await run_agent_with_logs(
-            cv_extract_agent,
-            guard.safe_text,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        cv: CVExtractSchema = cv_result.final_output
-        
-        # Match against vacancies
-        match_input = f"Candidate data:\n{serialize_for_llm(cv)}"
-        match_result = await run_agent_with_logs(
-            cv_match_agent,
-            match_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        match: CVMatchSchema = match_result.final_output
-        
-        # Decision: Forward or Reject
-        should_reject = (
-            not match.vacancies_found or
-            len(match.matched_roles) == 0 or
-            match.best_match is None
-        )
-        
-        if should_reject:
-            # Generate rejection email
-            draft_input = serialize_for_llm(cv)
-            draft_result = await run_agent_with_logs(
-                draft_reject_agent,
-                draft_input,
-                context=context,
-                run_config=run_config,
-                hooks=hooks,
-            )
-            draft: DraftEmailSchema = draft_result.final_output
-            
-            # Package as rejection
-            pack_input = serialize_for_llm({
-                "reason": "no_vacancies",
-                "cv_extract": cv.model_dump(by_alias=True),
-                "draft_email": draft.model_dump(by_alias=True),
-                "owner_map": owner.model_dump(by_alias=True)
-            })
-            pack_result = await run_agent_with_logs(
-                hr_reject_packager,
-                pack_input,
-                context=context,
-                run_config=run_config,
-                hooks=hooks,
-            )
-            return pack_result.final_output.model_dump(by_alias=True)
-        
-        else:
-            # Generate forward email
-            draft_input = serialize_for_llm({
-                "cv_extract": cv.model_dump(by_alias=True),
-                "matched_roles": [r.model_dump(by_alias=True) for r in match.matched_roles],
-                "owner_map": owner.model_dump(by_alias=True)
-            })
-            draft_result = await run_agent_with_logs(
-                draft_hr_forward_agent,
-                draft_input,
-                context=context,
-                run_config=run_config,
-                hooks=hooks,
-            )
-            draft: DraftEmailSchema = draft_result.final_output
-            
-            # Package as forward
-            pack_input = serialize_for_llm({
-                "cv_extract": cv.model_dump(by_alias=True),
-                "matched_roles": [r.model_dump(by_alias=True) for r in match.matched_roles],
-                "draft_email": draft.model_dump(by_alias=True),
-                "owner_map": owner.model_dump(by_alias=True)
-            })
-            pack_result = await run_agent_with_logs(
-                hr_forward_packager,
-                pack_input,
-                context=context,
-                run_config=run_config,
-                hooks=hooks,
-            )
-            return pack_result.final_output.model_dump(by_alias=True)
-    
-    # ----------------------------------------------------------
-    # BRANCH: SALES
-    # ----------------------------------------------------------
-    elif category == "sales":
-        # Extract and score lead
-        sales_result = await run_agent_with_logs(
-            sales_extract_agent,
-            guard.safe_text,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        sales: SalesExtractSchema = sales_result.final_output
-        
-        # Generate internal sales briefing
-        draft_input = serialize_for_llm({
-            "sales_extract": sales.model_dump(by_alias=True),
-            "owner_map": owner.model_dump(by_alias=True)
-        })
-        draft_result = await run_agent_with_logs(
-            draft_sales_forward_agent,
-            draft_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        draft: DraftEmailSchema = draft_result.final_output
-        
-        # Package
-        pack_input = serialize_for_llm({
-            "sales_extract": sales.model_dump(by_alias=True),
-            "draft_email": draft.model_dump(by_alias=True),
-            "owner_map": owner.model_dump(by_alias=True)
-        })
-        pack_result = await run_agent_with_logs(
-            sales_packager,
-            pack_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        return pack_result.final_output.model_dump(by_alias=True)
-    
-    # ----------------------------------------------------------
-    # BRANCH: EVENT
-    # ----------------------------------------------------------
-    elif category == "event":
-        # Generate acknowledgment
-        draft_input = "Context: Event/partnership/press inquiry. Generate acknowledgment requesting details."
-        draft_result = await run_agent_with_logs(
-            draft_generic_ack_agent,
-            draft_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        draft: DraftEmailSchema = draft_result.final_output
-        
-        # Package
-        pack_input = serialize_for_llm({
-            "draft_email": draft.model_dump(by_alias=True),
-            "owner_map": owner.model_dump(by_alias=True)
-        })
-        pack_result = await run_agent_with_logs(
-            events_packager,
-            pack_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        return pack_result.final_output.model_dump(by_alias=True)
-    
-    # ----------------------------------------------------------
-    # BRANCH: OTHER
-    # ----------------------------------------------------------
-    else:
-        # Generate generic acknowledgment
-        draft_input = "Context: Generic inquiry. Generate acknowledgment requesting key details."
-        draft_result = await run_agent_with_logs(
-            draft_generic_ack_agent,
-            draft_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        draft: DraftEmailSchema = draft_result.final_output
-        
-        # Package
-        pack_input = serialize_for_llm({
-            "draft_email": draft.model_dump(by_alias=True),
-            "owner_map": owner.model_dump(by_alias=True)
-        })
-        pack_result = await run_agent_with_logs(
-            other_packager,
-            pack_input,
-            context=context,
-            run_config=run_config,
-            hooks=hooks,
-        )
-        return pack_result.final_output.model_dump(by_alias=True)
+    status, result, error = "ok", None, None
+    try:
+        result = await route_workflow(initial_input, StepState(context, run_config, hooks))
+        return result
+    except WorkflowCancelled as e:
+        status, error = "cancelled", e.reason
+        raise
+    except asyncio.CancelledError:
+        status, error = "cancelled", "task_cancelled"
+        raise
+    except Exception as e:
+        status, error = "error", str(e)
+        raise
+    finally:
+        if run_store is not None:
+            run_store.record(build_run_record(
+                workflow, context,
+                run_id=run_id,
+                created_at=created_at,
+                status=status,
+                result=result,
+                error=error,
+            ))
 
 
 # ================================================================================
@@ -1639,6 +2371,8 @@ async def run_workflow_async(workflow: WorkflowInput, hooks: Optional[RunHooks[R
 
 def main():
     """CLI entry point with interactive file selection - supports .txt, .pdf, and image files."""
+    # En CLI se muestran por defecto prompts, inputs y outputs completos (nivel DEBUG)
+    configure_logging(level=os.getenv("ROUTER_LOG_LEVEL", "DEBUG"))
     script_dir = Path(__file__).parent
     
     # Listar archivos soportados en el directorio actual
@@ -1703,7 +2437,7 @@ def main():
         sys.exit(1)
     
     # Ejecutar workflow
-    result = asyncio.run(run_workflow_async(workflow))
+    result = asyncio.run(run_workflow_async(workflow, priority="batch"))
     
     # Output result
     print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -1735,7 +2469,7 @@ def visualize_architecture(save_path: str = "router_architecture"):
     
     # Visualize the main entry point (guardrails agent)
     try:
-        graph = draw_graph(guardrails_agent, filename=save_path)
+        graph = draw_graph(agent_registry["guardrails_agent"], filename=save_path)
         print(f"✅ Visualization saved: {save_path}.png")
         print(f"💡 For complete architecture diagram, run: python visualize_agents.py")
         return graph
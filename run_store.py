@@ -0,0 +1,469 @@
+"""
+Registro persistente de ejecuciones del workflow (SQLite en modo WAL, solo inserciones).
+
+Cada intento de ejecución es una fila propia (attempt_id): los reintentos de
+un trabajo o de un WebSocket reutilizan el run_id, y get(run_id) devuelve el
+último intento. Cada ejecución guarda el hash de la entrada, la intención, la ruta final, el
+resultado y, por agente, su entrada/salida, tiempos y tokens. record() no
+bloquea: encola el registro y un hilo escritor lo inserta por lotes (una
+transacción por lote). Para análisis, export() vuelca las tablas por bloques a
+Parquet o Arrow (requiere pyarrow, opcional) sin cargar todo en memoria, y
+stats() devuelve agregados calculados en SQLite.
+
+Uso (exportación):
+    python run_store.py export runs.parquet [--table agents] [--since 2026-01-01] [--tenant id] [--format arrow]
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from log_pipeline import logger
+from shared_store import connect_wal
+
+
+# ================================================================================
+# SCHEMA
+# ================================================================================
+
+# (columna, tipo SQLite, tipo Arrow)
+RUN_COLUMNS: List[Tuple[str, str, str]] = [
+    ("attempt_id", "TEXT PRIMARY KEY", "string"),
+    ("run_id", "TEXT NOT NULL", "string"),  # job_id o el run_id del WebSocket; se repite en los reintentos
+    ("created_at", "REAL NOT NULL", "float64"),
+    ("tenant_id", "TEXT", "string"),
+    ("input_hash", "TEXT", "string"),
+    ("status", "TEXT NOT NULL", "string"),
+    ("final_route", "TEXT", "string"),
+    ("intent_category", "TEXT", "string"),
+    ("categories", "TEXT", "string"),
+    ("language", "TEXT", "string"),
+    ("confidence", "REAL", "float64"),
+    ("priority", "TEXT", "string"),
+    ("config_fingerprint", "TEXT", "string"),
+    ("elapsed_ms", "REAL", "float64"),
+    ("total_tokens", "INTEGER", "int64"),
+    ("requests", "INTEGER", "int64"),
+    ("error", "TEXT", "string"),
+    ("result", "TEXT", "string"),
+]
+
+AGENT_COLUMNS: List[Tuple[str, str, str]] = [
+    ("attempt_id", "TEXT NOT NULL", "string"),
+    ("run_id", "TEXT NOT NULL", "string"),
+    ("seq", "INTEGER NOT NULL", "int64"),
+    ("created_at", "REAL NOT NULL", "float64"),
+    ("tenant_id", "TEXT", "string"),
+    ("agent", "TEXT NOT NULL", "string"),
+    ("status", "TEXT NOT NULL", "string"),
+    ("started_ms", "REAL", "float64"),
+    ("elapsed_ms", "REAL", "float64"),
+    ("input_tokens", "INTEGER", "int64"),
+    ("output_tokens", "INTEGER", "int64"),
+    ("total_tokens", "INTEGER", "int64"),
+    ("input", "TEXT", "string"),
+    ("output", "TEXT", "string"),
+    ("prompt_hash", "TEXT", "string"),  # Instrucciones + esquema + modelo (router.prompt_fingerprint)
+]
+
+TABLES = {"runs": RUN_COLUMNS, "agents": AGENT_COLUMNS}
+
+# Columnas guardadas como JSON
+JSON_COLUMNS = {"categories", "result", "output"}
+
+
+def _encode(column: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if column in JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """ISO date/datetime (or epoch seconds) → epoch seconds; None passes through."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+# ================================================================================
+# RUN STORE
+# ================================================================================
+
+class RunStore:
+    """
+    Append-only log of workflow runs with batched background commits.
+
+    record() only enqueues; if the queue is full the run is dropped (and
+    counted) instead of blocking the request path. With capture_io=False the
+    per-agent inputs/outputs are not persisted, only timings and tokens.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        *,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+        capture_io: bool = True,
+    ):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.capture_io = capture_io
+        self.recorded = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            for table, columns in TABLES.items():
+                definition = ", ".join(f"{name} {sql_type}" for name, sql_type, _ in columns)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definition})")
+                # Columnas añadidas en versiones posteriores
+                existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for name, sql_type, _ in columns:
+                    if name not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_created ON runs (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_run ON runs (run_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_attempt ON agents (attempt_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_created ON agents (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_tenant ON runs (tenant_id, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_tenant ON agents (tenant_id, created_at)")
+
+    # ---------------------------- Writes ----------------------------
+
+    def record(self, run: dict) -> bool:
+        """Enqueue a run record (see router.build_run_record); never blocks."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(run)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="run-store-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # Acumular hasta batch_size registros o flush_interval segundos
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+                self.recorded += len(batch)
+            except Exception as e:
+                self.write_errors += len(batch)
+                logger.error("Error writing %d runs to %s: %s", len(batch), self.db_path, e, extra={"event": "run_store_error"})
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, runs: List[dict]) -> None:
+        run_rows = []
+        agent_rows = []
+        for run in runs:
+            run = {**run, "attempt_id": run.get("attempt_id") or uuid.uuid4().hex}
+            run_rows.append(tuple(_encode(name, run.get(name)) for name, _, _ in RUN_COLUMNS))
+            for seq, agent in enumerate(run.get("agents", [])):
+                agent = {
+                    **agent, "attempt_id": run["attempt_id"], "run_id": run["run_id"], "seq": seq,
+                    "created_at": run["created_at"], "tenant_id": run.get("tenant_id"),
+                }
+                if not self.capture_io:
+                    agent["input"] = agent["output"] = None
+                agent_rows.append(tuple(_encode(name, agent.get(name)) for name, _, _ in AGENT_COLUMNS))
+        with connect_wal(self.db_path) as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(_insert_sql("runs", RUN_COLUMNS), run_rows)
+                conn.executemany(_insert_sql("agents", AGENT_COLUMNS), agent_rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def flush(self) -> None:
+        """Block until every enqueued run has been written."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Flush pending runs and stop the writer thread."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._writer = None
+
+    # ---------------------------- Reads ----------------------------
+
+    def get(self, run_id: str) -> Optional[dict]:
+        """Latest attempt of a run with its agent steps (JSON columns decoded)."""
+        with connect_wal(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT * FROM runs WHERE run_id = ? ORDER BY created_at DESC, rowid DESC LIMIT 1", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            agents = conn.execute(
+                "SELECT * FROM agents WHERE attempt_id = ? ORDER BY seq", (row["attempt_id"],)
+            ).fetchall()
+        run = _decode(dict(row))
+        run["agents"] = [_decode(dict(agent)) for agent in agents]
+        return run
+
+    def iter_runs(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        batch_size: int = 500,
+        tenant_id: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """Stream run attempts (with their agent steps) in creation order, batch by batch."""
+        for rows in self.iter_batches("runs", since, until, batch_size, tenant_id=tenant_id):
+            ids = [row["attempt_id"] for row in rows]
+            with connect_wal(self.db_path) as conn:
+                agents = conn.execute(
+                    f"SELECT * FROM agents WHERE attempt_id IN ({','.join('?' * len(ids))}) ORDER BY attempt_id, seq",
+                    ids,
+                ).fetchall()
+            by_attempt: Dict[str, List[dict]] = {}
+            for agent in agents:
+                by_attempt.setdefault(agent["attempt_id"], []).append(_decode(dict(agent)))
+            for row in rows:
+                yield {**_decode(row), "agents": by_attempt.get(row["attempt_id"], [])}
+
+    def iter_batches(
+        self,
+        table: str,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        batch_size: int = 50000,
+        tenant_id: Optional[str] = None,
+    ) -> Iterator[List[dict]]:
+        """Raw rows of a table in created_at order, batch_size rows at a time."""
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}' (expected one of {sorted(TABLES)})")
+        where, params = _run_filter(since, until, tenant_id)
+        with connect_wal(self.db_path) as conn:
+            cursor = conn.execute(f"SELECT * FROM {table}{where} ORDER BY created_at", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield [dict(row) for row in rows]
+
+    def stats(self, since: Optional[float] = None, until: Optional[float] = None, tenant_id: Optional[str] = None) -> dict:
+        """Aggregated routing stats for a time window (and tenant), computed in SQLite."""
+        where, params = _run_filter(since, until, tenant_id)
+        with connect_wal(self.db_path) as conn:
+            totals = dict(conn.execute(
+                f"""SELECT COUNT(*) AS runs, AVG(elapsed_ms) AS avg_ms, MAX(elapsed_ms) AS max_ms,
+                           COALESCE(SUM(total_tokens), 0) AS total_tokens, AVG(total_tokens) AS avg_tokens,
+                           MIN(created_at) AS first_run, MAX(created_at) AS last_run
+                    FROM runs{where}""",
+                params,
+            ).fetchone())
+            totals["p95_ms"] = _percentile(conn, "runs", "elapsed_ms", 0.95, where, params)
+            by_tenant = [
+                dict(row) for row in conn.execute(
+                    f"""SELECT tenant_id, COUNT(*) AS runs, AVG(elapsed_ms) AS avg_ms,
+                               COALESCE(SUM(total_tokens), 0) AS total_tokens
+                        FROM runs{where} GROUP BY tenant_id ORDER BY runs DESC""",
+                    params,
+                )
+            ]
+            by_status = {
+                row["status"]: row["n"]
+                for row in conn.execute(f"SELECT status, COUNT(*) AS n FROM runs{where} GROUP BY status", params)
+            }
+            by_route = [
+                dict(row) for row in conn.execute(
+                    f"""SELECT final_route, COUNT(*) AS runs, AVG(elapsed_ms) AS avg_ms, AVG(total_tokens) AS avg_tokens
+                        FROM runs{where} GROUP BY final_route ORDER BY runs DESC""",
+                    params,
+                )
+            ]
+            by_intent = [
+                dict(row) for row in conn.execute(
+                    f"""SELECT intent_category, language, COUNT(*) AS runs, AVG(confidence) AS avg_confidence
+                        FROM runs{where} GROUP BY intent_category, language ORDER BY runs DESC""",
+                    params,
+                )
+            ]
+            by_agent = [
+                dict(row) for row in conn.execute(
+                    f"""SELECT agent, COUNT(*) AS calls, AVG(elapsed_ms) AS avg_ms, MAX(elapsed_ms) AS max_ms,
+                               SUM(total_tokens) AS total_tokens,
+                               SUM(CASE WHEN status IN ('error', 'timeout') THEN 1 ELSE 0 END) AS failed,
+                               SUM(CASE WHEN status IN ('cached', 'replayed', 'reused') THEN 1 ELSE 0 END) AS reused
+                        FROM agents{where} GROUP BY agent ORDER BY total_tokens DESC""",
+                    params,
+                )
+            ]
+        return {
+            "window": {"since": since, "until": until, "tenant_id": tenant_id},
+            "totals": totals,
+            "by_tenant": by_tenant,
+            "by_status": by_status,
+            "by_route": by_route,
+            "by_intent": by_intent,
+            "by_agent": by_agent,
+            "writer": {"recorded": self.recorded, "dropped": self.dropped, "write_errors": self.write_errors},
+        }
+
+    # ---------------------------- Export ----------------------------
+
+    def export(
+        self,
+        path: Path,
+        *,
+        table: str = "runs",
+        fmt: str = "parquet",
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        batch_size: int = 50000,
+        tenant_id: Optional[str] = None,
+    ) -> int:
+        """
+        Write a table to Parquet or Arrow IPC, one record batch per block of rows.
+
+        Returns the number of rows written. Requires pyarrow.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("Export requires pyarrow: pip install pyarrow")
+
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}' (expected one of {sorted(TABLES)})")
+        schema = pa.schema([(name, getattr(pa, arrow_type)()) for name, _, arrow_type in TABLES[table]])
+
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(str(path), schema, compression="zstd")
+        elif fmt == "arrow":
+            writer = pa.ipc.new_file(str(path), schema)
+        else:
+            raise ValueError(f"Unknown export format '{fmt}' (parquet or arrow)")
+
+        rows_written = 0
+        try:
+            for rows in self.iter_batches(table, since, until, batch_size, tenant_id=tenant_id):
+                writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+                rows_written += len(rows)
+        finally:
+            writer.close()
+        return rows_written
+
+
+def _insert_sql(table: str, columns: List[Tuple[str, str, str]]) -> str:
+    names = ", ".join(name for name, _, _ in columns)
+    return f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _decode(row: dict) -> dict:
+    for column in JSON_COLUMNS:
+        value = row.get(column)
+        if isinstance(value, str) and value[:1] in ("{", "["):
+            try:
+                row[column] = json.loads(value)
+            except ValueError:
+                pass
+    return row
+
+
+def _run_filter(since: Optional[float], until: Optional[float], tenant_id: Optional[str] = None) -> Tuple[str, tuple]:
+    clauses, params = [], []
+    if tenant_id is not None:
+        clauses.append("tenant_id = ?")
+        params.append(tenant_id)
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+
+def _percentile(conn, table: str, column: str, q: float, where: str, params: tuple) -> Optional[float]:
+    condition = f"{where} AND {column} IS NOT NULL" if where else f" WHERE {column} IS NOT NULL"
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}{condition}", params).fetchone()[0]
+    if not count:
+        return None
+    row = conn.execute(
+        f"SELECT {column} FROM {table}{condition} ORDER BY {column} LIMIT 1 OFFSET ?",
+        (*params, int(q * (count - 1))),
+    ).fetchone()
+    return row[0]
+
+
+# ================================================================================
+# CLI
+# ================================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el registro de ejecuciones a Parquet/Arrow.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Exportar una tabla (runs o agents)")
+    export.add_argument("output")
+    export.add_argument("--table", choices=sorted(TABLES), default="runs")
+    export.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    export.add_argument("--since", help="Fecha ISO (o epoch) inicial, inclusiva")
+    export.add_argument("--until", help="Fecha ISO (o epoch) final, exclusiva")
+    export.add_argument("--tenant", help="Solo las ejecuciones de este tenant")
+    export.add_argument("--db", default=os.getenv("ROUTER_RUN_DB", str(Path(__file__).parent / "var" / "runs.sqlite3")))
+    args = parser.parse_args()
+
+    store = RunStore(Path(args.db))
+    rows = store.export(
+        Path(args.output), table=args.table, fmt=args.format,
+        since=parse_time(args.since), until=parse_time(args.until), tenant_id=args.tenant,
+    )
+    print(f"{rows} filas exportadas de '{args.table}' a {args.output}")
+
+
+if __name__ == "__main__":
+    main()
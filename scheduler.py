@@ -0,0 +1,410 @@
+"""
+Planificador global de llamadas salientes al LLM.
+
+Todas las llamadas a Runner.run pasan por aquí (ver run_agent_with_logs):
+- Token buckets por modelo para requests/minuto y tokens/minuto
+- Ventana de concurrencia adaptativa AIMD (solo se reduce ante 429/sobrecarga)
+- Reintentos de 429 en una sola capa (aquí); agotados, RateLimitExhausted no se reintenta fuera
+- Carriles de prioridad: interactive (WebSocket) > batch (cola) > background
+- Cuotas y métricas por tenant (filial): CONFIG["RATE_LIMITS"] de cada tenant
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from shared_store import process_count
+
+
+# ================================================================================
+# CONFIGURATION
+# ================================================================================
+
+PRIORITY_LANES = {
+    "interactive": 0,
+    "batch": 1,
+    "background": 2,
+}
+
+
+@dataclass
+class ModelLimits:
+    """Provider quota for one model."""
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# La cuota del proveedor se reparte entre los procesos que sirven en el host
+DEFAULT_MODEL_LIMITS: Dict[str, ModelLimits] = {
+    "gpt-5-mini": ModelLimits(
+        requests_per_minute=float(os.getenv("ROUTER_RPM", "500")) / process_count(),
+        tokens_per_minute=float(os.getenv("ROUTER_TPM", "500000")) / process_count(),
+    ),
+}
+
+# Tokens reservados por defecto para la respuesta cuando se estima una llamada
+DEFAULT_OUTPUT_TOKENS = 1500
+
+
+def estimate_tokens(inp) -> int:
+    """
+    Rough token estimate for a Runner.run input (≈4 chars per token).
+    Base64 file parts are counted by their data size, which over-estimates
+    rather than under-estimates the real cost.
+    """
+    if isinstance(inp, str):
+        return len(inp) // 4 + DEFAULT_OUTPUT_TOKENS
+    chars = 0
+    for msg in inp or []:
+        content = msg.get("content", "") if isinstance(msg, dict) else ""
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict):
+                    chars += len(item.get("text", "") or item.get("file_data", "") or item.get("image_url", ""))
+    return chars // 4 + DEFAULT_OUTPUT_TOKENS
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for provider 429s, without importing openai eagerly."""
+    if type(exc).__name__ == "RateLimitError":
+        return True
+    return getattr(exc, "status_code", None) == 429
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """429s plus provider overload responses (503/529): the signals that shrink the AIMD window."""
+    return is_rate_limit_error(exc) or getattr(exc, "status_code", None) in (503, 529)
+
+
+class RateLimitExhausted(Exception):
+    """
+    A call kept getting 429s through all of the scheduler's retries.
+
+    429s are retried only by the scheduler: node retries (pipeline) and job
+    retries (job_queue) treat this error as final instead of stacking their
+    own attempts on top.
+    """
+
+    def __init__(self, attempts: int):
+        super().__init__(f"Rate limited after {attempts} attempts")
+        self.attempts = attempts
+
+
+# ================================================================================
+# TOKEN BUCKET
+# ================================================================================
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` units per second."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Correct a previous estimate once the real usage is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+# ================================================================================
+# AIMD CONCURRENCY WINDOW
+# ================================================================================
+
+class AIMDWindow:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+
+    Each successful call grows the window by `increase / limit` (≈ +increase
+    per full window); a 429 or overload response shrinks it by
+    `decrease_factor`. Latency is not a signal: it depends on the agent (CV
+    calls routinely take 30-120 s), not on provider load.
+    """
+
+    def __init__(
+        self,
+        initial: float = 8,
+        minimum: float = 1,
+        maximum: float = 64,
+        increase: float = 1.0,
+        decrease_factor: float = 0.7,
+    ):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._last_decrease = 0.0
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+    def on_overload(self) -> None:
+        self._decrease()
+
+    def _decrease(self) -> None:
+        # Un único recorte por ráfaga de errores simultáneos
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+    @property
+    def capacity(self) -> int:
+        return max(1, int(self.limit))
+
+
+# ================================================================================
+# SCHEDULER
+# ================================================================================
+
+@dataclass
+class SchedulerStats:
+    started: int = 0
+    completed: int = 0
+    rate_limited: int = 0
+    retries: int = 0
+    queue_wait_s: Dict[str, float] = field(default_factory=lambda: {lane: 0.0 for lane in PRIORITY_LANES})
+    dispatched: Dict[str, int] = field(default_factory=lambda: {lane: 0 for lane in PRIORITY_LANES})
+
+
+@dataclass
+class TenantStats:
+    started: int = 0
+    completed: int = 0
+    failed: int = 0
+    rate_limited: int = 0
+    throttled_s: float = 0.0  # Espera por la cuota propia del tenant
+    tokens: int = 0
+
+
+class Permit:
+    """Handle returned by OutboundScheduler.slot(), used to report the real usage."""
+
+    def __init__(self, scheduler: "OutboundScheduler", model: str, estimated_tokens: int):
+        self.scheduler = scheduler
+        self.model = model
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+
+    def record_usage(self, total_tokens: int) -> None:
+        self.actual_tokens = total_tokens
+
+
+class OutboundScheduler:
+    """
+    Global gate for outbound LLM calls.
+
+    Waiters are served strictly by priority lane and FIFO within a lane. A
+    waiter is admitted when the AIMD window has room; it then waits for the
+    model's request and token buckets before the call is made.
+    """
+
+    def __init__(
+        self,
+        model_limits: Optional[Dict[str, ModelLimits]] = None,
+        window: Optional[AIMDWindow] = None,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+    ):
+        self.model_limits = dict(model_limits or DEFAULT_MODEL_LIMITS)
+        self.window = window or AIMDWindow(
+            initial=float(os.getenv("ROUTER_LLM_CONCURRENCY", "8")),
+            maximum=float(os.getenv("ROUTER_LLM_MAX_CONCURRENCY", "64")),
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.stats = SchedulerStats()
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        # tenant → (límites, bucket de requests, bucket de tokens); se rehacen si cambian los límites
+        self._tenant_buckets: Dict[str, Tuple[tuple, Optional[TokenBucket], Optional[TokenBucket]]] = {}
+        self.tenant_stats: Dict[str, TenantStats] = {}
+        self._in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _buckets_for(self, model: str) -> Optional[Tuple[TokenBucket, TokenBucket]]:
+        limits = self.model_limits.get(model)
+        if limits is None:
+            return None
+        if model not in self._buckets:
+            self._buckets[model] = (
+                TokenBucket(limits.requests_per_minute, limits.requests_per_minute / 60.0),
+                TokenBucket(limits.tokens_per_minute, limits.tokens_per_minute / 60.0),
+            )
+        return self._buckets[model]
+
+    def _tenant_buckets_for(self, tenant: str, limits: Optional[dict]) -> Tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        key = ((limits or {}).get("requests_per_minute"), (limits or {}).get("tokens_per_minute"))
+        entry = self._tenant_buckets.get(tenant)
+        if entry is None or entry[0] != key:
+            # Como la del proveedor, la cuota del tenant se reparte entre los procesos
+            buckets = tuple(
+                TokenBucket(per_minute / process_count(), per_minute / process_count() / 60.0) if per_minute else None
+                for per_minute in key
+            )
+            entry = self._tenant_buckets[tenant] = (key, *buckets)
+        return entry[1], entry[2]
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._in_flight < self.window.capacity:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._in_flight += 1
+            fut.set_result(None)
+
+    async def _acquire_slot(self, priority: str) -> None:
+        lane = PRIORITY_LANES.get(priority, PRIORITY_LANES["batch"])
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), fut))
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot concedido justo al cancelar: devolverlo
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    @staticmethod
+    async def _wait_for(requests_bucket: Optional[TokenBucket], tokens_bucket: Optional[TokenBucket], tokens: int) -> None:
+        while True:
+            wait = max(
+                requests_bucket.wait_time(1) if requests_bucket else 0.0,
+                tokens_bucket.wait_time(tokens) if tokens_bucket else 0.0,
+            )
+            if wait <= 0:
+                if requests_bucket:
+                    requests_bucket.consume(1)
+                if tokens_bucket:
+                    tokens_bucket.consume(tokens)
+                return
+            await asyncio.sleep(wait)
+
+    async def _await_buckets(self, model: str, tokens: int) -> None:
+        buckets = self._buckets_for(model)
+        if buckets is None:
+            return
+        await self._wait_for(*buckets, tokens)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        priority: str = "interactive",
+        estimated_tokens: int = DEFAULT_OUTPUT_TOKENS,
+        tenant: Optional[str] = None,
+        tenant_limits: Optional[dict] = None,
+    ) -> AsyncIterator[Permit]:
+        """
+        Reserve capacity for one outbound call.
+
+        With a tenant, its own quota (tenant_limits: requests_per_minute,
+        tokens_per_minute) is awaited first, before taking a slot of the
+        shared window, so a throttled tenant does not hold capacity.
+
+        Usage:
+            async with scheduler.slot(model, "batch", tokens) as permit:
+                result = await Runner.run(...)
+                permit.record_usage(result.context_wrapper.usage.total_tokens)
+        """
+        queued_at = time.monotonic()
+        tenant_stats = tenant_buckets = None
+        if tenant is not None:
+            tenant_stats = self.tenant_stats.setdefault(tenant, TenantStats())
+            tenant_buckets = self._tenant_buckets_for(tenant, tenant_limits)
+            await self._wait_for(*tenant_buckets, estimated_tokens)
+            tenant_stats.throttled_s += time.monotonic() - queued_at
+            tenant_stats.started += 1
+        await self._acquire_slot(priority)
+        try:
+            await self._await_buckets(model, estimated_tokens)
+            lane = priority if priority in PRIORITY_LANES else "batch"
+            self.stats.queue_wait_s[lane] += time.monotonic() - queued_at
+            self.stats.dispatched[lane] += 1
+            self.stats.started += 1
+
+            permit = Permit(self, model, estimated_tokens)
+            try:
+                yield permit
+            except BaseException as exc:
+                if is_rate_limit_error(exc):
+                    self.stats.rate_limited += 1
+                if is_overload_error(exc):
+                    self.window.on_overload()
+                if tenant_stats is not None:
+                    tenant_stats.failed += 1
+                    tenant_stats.rate_limited += is_rate_limit_error(exc)
+                raise
+            else:
+                self.stats.completed += 1
+                self.window.on_success()
+                buckets = self._buckets_for(model)
+                if buckets is not None and permit.actual_tokens is not None:
+                    buckets[1].adjust(permit.actual_tokens - estimated_tokens)
+                if tenant_stats is not None:
+                    tenant_stats.completed += 1
+                    if permit.actual_tokens is not None:
+                        tenant_stats.tokens += permit.actual_tokens
+                        if tenant_buckets[1] is not None:
+                            tenant_buckets[1].adjust(permit.actual_tokens - estimated_tokens)
+        finally:
+            self._release_slot()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for 429 retries."""
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency_limit": round(self.window.limit, 2),
+            "in_flight": self._in_flight,
+            "waiting": sum(1 for _, _, fut in self._waiters if not fut.done()),
+            "started": self.stats.started,
+            "completed": self.stats.completed,
+            "rate_limited": self.stats.rate_limited,
+            "retries": self.stats.retries,
+            "dispatched": dict(self.stats.dispatched),
+            "queue_wait_s": {lane: round(v, 3) for lane, v in self.stats.queue_wait_s.items()},
+            "tenants": {
+                tenant: {**vars(stats), "throttled_s": round(stats.throttled_s, 3)}
+                for tenant, stats in self.tenant_stats.items()
+            },
+        }
+
+
+# Instancia global compartida por todos los clientes (WebSocket, REST, cola)
+outbound_scheduler = OutboundScheduler()
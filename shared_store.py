@@ -0,0 +1,193 @@
+"""
+Almacén compartido entre procesos (SQLite en modo WAL).
+
+Permite servir la aplicación con varios workers (gunicorn + UvicornWorker)
+manteniendo coherentes:
+- La caché de resultados de workflows (clave = hash de la entrada + config)
+- Los eventos WebSocket, que se publican en una tabla y cada worker reenvía
+  a sus conexiones locales (fan-out entre procesos)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from log_pipeline import logger
+
+
+def connect_wal(db_path: Path) -> sqlite3.Connection:
+    """Open a SQLite connection configured for concurrent multi-process access."""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def hash_payload(*parts: Any) -> str:
+    """Stable SHA-256 over JSON-serializable parts (dict keys sorted)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+# ================================================================================
+# SHARED STORE
+# ================================================================================
+
+class SharedStore:
+    """Result cache and event log shared by every worker process on the host."""
+
+    def __init__(self, db_path: Path, cache_ttl: float = 24 * 3600, event_retention: float = 600):
+        self.db_path = Path(db_path)
+        self.cache_ttl = cache_ttl
+        self.event_retention = event_retention
+        self.origin = uuid.uuid4().hex  # Identifica a este proceso en el event log
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    # ---------------------------- Result cache ----------------------------
+
+    def cache_get(self, key: str) -> Optional[dict]:
+        with connect_wal(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT value FROM result_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def cache_set(self, key: str, value: dict, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (ttl if ttl is not None else self.cache_ttl)
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at),
+            )
+
+    def cache_purge_expired(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute("DELETE FROM result_cache WHERE expires_at <= ?", (time.time(),))
+
+    # ---------------------------- Event log ----------------------------
+
+    def publish(self, channel: str, message: dict) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO events (origin, channel, message, created_at) VALUES (?, ?, ?, ?)",
+                (self.origin, channel, json.dumps(message, ensure_ascii=False), time.time()),
+            )
+
+    def last_event_id(self) -> int:
+        with connect_wal(self.db_path) as conn:
+            row = conn.execute("SELECT COALESCE(MAX(id), 0) AS last FROM events").fetchone()
+        return row["last"]
+
+    def events_since(self, last_id: int, limit: int = 500) -> List[sqlite3.Row]:
+        with connect_wal(self.db_path) as conn:
+            return conn.execute(
+                "SELECT id, origin, channel, message FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit),
+            ).fetchall()
+
+    def prune_events(self) -> None:
+        with connect_wal(self.db_path) as conn:
+            conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - self.event_retention,))
+
+
+# ================================================================================
+# CROSS-PROCESS EVENT FAN-OUT
+# ================================================================================
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class EventFanout:
+    """
+    Publishes events to every worker process.
+
+    Local handlers are called immediately; the event is also written to the
+    shared log, and a polling task in each other process replays it to its own
+    handlers. Events written by this process are skipped when polling.
+    """
+
+    def __init__(self, store: SharedStore, poll_interval: float = 0.1):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, List[EventHandler]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = 0
+
+    def subscribe(self, channel: str, handler: EventHandler) -> None:
+        self.handlers.setdefault(channel, []).append(handler)
+
+    async def _dispatch(self, channel: str, message: dict) -> None:
+        for handler in self.handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.warning("Error dispatching %s event: %s", channel, e, extra={"event": "fanout_error"})
+
+    async def publish(self, channel: str, message: dict) -> None:
+        await self._dispatch(channel, message)
+        await asyncio.to_thread(self.store.publish, channel, message)
+
+    async def start(self) -> None:
+        self._last_id = await asyncio.to_thread(self.store.last_event_id)
+        self._task = asyncio.create_task(self._poll(), name="event-fanout")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self) -> None:
+        polls = 0
+        while True:
+            rows = await asyncio.to_thread(self.store.events_since, self._last_id)
+            for row in rows:
+                self._last_id = row["id"]
+                if row["origin"] != self.store.origin:
+                    await self._dispatch(row["channel"], json.loads(row["message"]))
+            polls += 1
+            if polls % 600 == 0:
+                await asyncio.to_thread(self.store.prune_events)
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+
+def process_count() -> int:
+    """Number of serving processes sharing this host's provider quota."""
+    return max(1, int(os.getenv("ROUTER_PROCESS_COUNT", os.getenv("WEB_CONCURRENCY", "1"))))
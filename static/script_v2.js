@@ -412,6 +412,11 @@ function connectWebSocket(workflowData) {
     ws = new WebSocket(wsUrl);
     
     ws.onopen = () => {
+        // Only request the agent events this UI renders (agent_thinking is not shown)
+        ws.send(JSON.stringify({
+            action: 'subscribe',
+            events: ['agent_start', 'agent_input', 'agent_end', 'handoff']
+        }));
         ws.send(JSON.stringify(workflowData));
     };
     
@@ -615,17 +620,19 @@ function displayResults(result) {
         </div>
     `;
     
-    // Route-specific formatting
-    if (route.includes('hr_cv')) {
-        html += formatHRCVOutput(payload, route);
-    } else if (route.includes('sales')) {
-        html += formatSalesOutput(payload, route);
-    } else if (route.includes('events')) {
-        html += formatEventsOutput(payload, route);
-    } else if (route.includes('guardrails')) {
-        html += formatGuardrailsOutput(payload);
+    if (route === 'multi_route') {
+        // Mixed-intent message: one section per branch
+        (payload.routes || []).forEach(branch => {
+            const branchRoute = branch.final_route || 'unknown';
+            html += `
+                <div class="result-section result-header">
+                    <div class="route-badge">${formatRouteName(branchRoute)}</div>
+                </div>
+            `;
+            html += formatRouteOutput(branchRoute, branch.payload || branch);
+        });
     } else {
-        html += formatGenericOutput(payload);
+        html += formatRouteOutput(route, payload);
     }
     
     resultsContent.innerHTML = html;
@@ -643,6 +650,20 @@ function displayResults(result) {
     }, 50);
 }
 
+// Route-specific formatting
+function formatRouteOutput(route, payload) {
+    if (route.includes('hr_cv')) {
+        return formatHRCVOutput(payload, route);
+    } else if (route.includes('sales')) {
+        return formatSalesOutput(payload, route);
+    } else if (route.includes('events')) {
+        return formatEventsOutput(payload, route);
+    } else if (route.includes('guardrails')) {
+        return formatGuardrailsOutput(payload);
+    }
+    return formatGenericOutput(payload);
+}
+
 function formatRouteName(route) {
     return route.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase());
 }
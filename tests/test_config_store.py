@@ -0,0 +1,120 @@
+import copy
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from config_store import ConfigStore, TenantRegistry, UnknownTenant, validate_config, version_of
+
+BASE_CONFIG = Path(__file__).resolve().parent.parent / "config" / "router_config.json"
+
+
+def _write(path: Path, data: dict) -> None:
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "router_config.json"
+    shutil.copy(BASE_CONFIG, path)
+    return path
+
+
+def test_valid_change_becomes_a_new_version_and_old_snapshot_is_kept(config_path):
+    store = ConfigStore(config_path, poll_interval=60)
+    before = store.current()
+    builds = []
+    assert before.derived("artifact", lambda: builds.append(1) or "v1") == "v1"
+    assert before.derived("artifact", lambda: builds.append(1) or "v1") == "v1"
+    assert builds == [1]  # Derived once per version
+
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    data["COMPANY"]["name"] = "Otra Empresa S.L."
+    _write(config_path, data)
+    assert store.reload(force=True)
+
+    after = store.current()
+    assert after.version == before.version + 1
+    assert after.data["COMPANY"]["name"] == "Otra Empresa S.L."
+    assert before.data["COMPANY"]["name"] != "Otra Empresa S.L."
+    assert version_of(after.data) is after
+
+
+def test_invalid_change_keeps_the_previous_version(config_path):
+    store = ConfigStore(config_path, poll_interval=60)
+    before = store.current()
+    config_path.write_text("{not json", encoding="utf-8")
+
+    assert not store.reload(force=True)
+    assert store.current() is before
+    assert store.errors == 1 and store.last_error
+
+
+def test_tenants_are_merged_over_the_base_file(config_path, tmp_path):
+    tenants = tmp_path / "tenants"
+    tenants.mkdir()
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    _write(tenants / "filial.json", {"COMPANY": {**data["COMPANY"], "name": "Filial S.A."}})
+
+    registry = TenantRegistry(config_path, tenants, poll_interval=60)
+
+    assert registry.current("filial").data["COMPANY"]["name"] == "Filial S.A."
+    assert registry.current("filial").data["VACANTES"] == data["VACANTES"]
+    assert registry.current().data["COMPANY"]["name"] == data["COMPANY"]["name"]
+    with pytest.raises(UnknownTenant):
+        registry.get("desconocida")
+
+
+def test_speculative_reject_requires_llm_polished_rejections(config_path):
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    data["DRAFTING_POLICY"] = {"llm_polish": [], "speculative_reject": True}
+
+    with pytest.raises(ValueError, match="speculative_reject"):
+        validate_config(data)
+    data["DRAFTING_POLICY"]["llm_polish"] = ["cv_reject"]
+    assert validate_config(data)["DRAFTING_POLICY"]["speculative_reject"]
+
+
+def test_version_lookup_survives_many_other_configs(config_path):
+    store = ConfigStore(config_path, poll_interval=60)
+    snapshot = store.current()
+    for i in range(40):
+        version_of({"ad_hoc": i})
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    for i in range(20):
+        data["COMPANY"]["name"] = f"Empresa {i}"
+        _write(config_path, data)
+        assert store.reload(force=True)
+
+    assert version_of(snapshot.data) is snapshot
+    assert snapshot.vacancies["FLOTA-CAP-01"]["title"] == "Capitán de Barco Pesquero"
+    # A modified copy is a different configuration, not the same version
+    variant = copy.deepcopy(snapshot.data)
+    assert type(variant) is dict
+    assert version_of(variant) is not snapshot
+
+
+def test_tenant_directory_scan_adds_removes_and_skips_invalid_files(config_path, tmp_path):
+    tenants = tmp_path / "tenants"
+    tenants.mkdir()
+    registry = TenantRegistry(config_path, tenants, poll_interval=60)
+    assert registry.tenants() == ["default"]
+
+    _write(tenants / "filial-norte.json", {"RATE_LIMITS": {"requests_per_minute": 30}})
+    _write(tenants / "rota.json", {"THRESHOLDS": {"FIT_OK": 500}})  # Does not validate
+    _write(tenants / "Mayusculas.json", {})  # Not a valid tenant id
+    (tenants / "notas.txt").write_text("no es un CONFIG", encoding="utf-8")
+    registry.scan()
+
+    assert sorted(registry.tenants()) == ["default", "filial-norte"]
+    assert registry.current("filial-norte").data["RATE_LIMITS"]["requests_per_minute"] == 30
+    for tenant_id in ("rota", "Mayusculas", "notas"):
+        with pytest.raises(UnknownTenant):
+            registry.current(tenant_id)
+
+    (tenants / "filial-norte.json").unlink()
+    registry.scan()
+    assert registry.tenants() == ["default"]
+    with pytest.raises(UnknownTenant):
+        registry.get("filial-norte")
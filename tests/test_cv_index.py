@@ -0,0 +1,48 @@
+import time
+
+from cv_index import CVIndex, HashingEmbedder
+
+CV = {
+    "full_name": "Lucía Pereira Souto",
+    "email": "lucia.pereira@example.com",
+    "phone": "+34 600 123 456",
+    "location": "Vigo",
+    "years_experience": 6,
+    "skills": ["soldadura TIG", "inspección de cascos", "AutoCAD"],
+    "certifications": ["EWF"],
+    "target_department": "Ingeniería",
+    "role_guess": "Inspectora naval",
+}
+
+OTHER_CV = {
+    "full_name": "Marcos Iglesias",
+    "email": "marcos@example.org",
+    "phone": "+34 611 000 111",
+    "location": "Madrid",
+    "years_experience": 2,
+    "skills": ["ventas B2B", "CRM"],
+    "certifications": [],
+    "target_department": "Comercial",
+    "role_guess": "Comercial junior",
+}
+
+
+def test_resubmitted_cv_is_the_nearest_neighbour(tmp_path):
+    index = CVIndex(tmp_path / "cv.sqlite3", embedder=HashingEmbedder())
+    index.add("default", OTHER_CV)
+    stored = index.add("default", CV, result={"final_route": "hr_cv_forward", "payload": {}}, run_id="run-1")
+
+    similarity, record = index.nearest("default", {**CV, "phone": "600123456"})[0]
+
+    assert record.record_id == stored.record_id and record.run_id == "run-1"
+    assert similarity > 0.9
+    assert index.nearest("otra-filial", CV) == []  # Tenants do not share CVs
+
+
+def test_other_processes_see_records_after_refresh(tmp_path):
+    writer = CVIndex(tmp_path / "cv.sqlite3", embedder=HashingEmbedder())
+    reader = CVIndex(tmp_path / "cv.sqlite3", embedder=HashingEmbedder(), refresh_interval=0)
+    writer.add("default", CV)
+
+    assert reader.nearest("default", CV)[0][1].cv["email"] == CV["email"]
+    assert reader.nearest("default", CV, since=time.time() + 60) == []
@@ -0,0 +1,37 @@
+from email_templates import BODY_TEMPLATES, CompiledTemplate, EmailTemplateEngine, first_name
+
+CONFIG = {
+    "COMPANY": {"name": "OCEANIX Galicia S.A.", "careers_url": "https://example.com/empleo", "site_url": "https://example.com"},
+    "LANG_POLICY": {"default_reply": "es"},
+    "EMAIL_TEMPLATES": {
+        key: {"subject_pattern": f"{key} – {{{{company}}}}", "tone": "cordial"} for key in BODY_TEMPLATES
+    },
+}
+
+
+def test_template_is_compiled_into_literals_and_field_paths():
+    template = CompiledTemplate("Hola {{ first_name }}, fit {{match.score}}%")
+
+    assert template.segments == [("Hola ", ("first_name",)), (", fit ", ("match", "score")), ("%", None)]
+    assert template.render({"first_name": "Ana", "match": {"score": 87}}) == "Hola Ana, fit 87%"
+
+
+def test_missing_fields_render_as_empty_and_lists_are_joined():
+    template = CompiledTemplate("[{{name}}] [{{owner.name}}] [{{skills}}]")
+
+    assert template.render({"owner": None, "skills": ["TIG", None, "", "AutoCAD"]}) == "[] [] [TIG, AutoCAD]"
+
+
+def test_subject_falls_back_to_the_default_language():
+    engine = EmailTemplateEngine(CONFIG)
+    fields = {"first_name": first_name("Ana Pereira")}
+
+    assert engine.render("cv_reject", "pt", fields)["subject"] == "Obrigado pela sua candidatura – OCEANIX Galicia S.A."
+    assert engine.render("cv_reject", "en", fields)["subject"] == "Thank you for your application – OCEANIX Galicia S.A."
+    # No French template: default_reply (Spanish), whose subject comes from CONFIG
+    draft = engine.render("cv_reject", "fr", fields, to="ana@example.com")
+    assert draft["subject"] == "cv_reject – OCEANIX Galicia S.A."
+    assert draft["body_markdown"].startswith("Hola Ana,")
+    assert draft["to"] == "ana@example.com"
+    # Internal briefings only exist in Spanish
+    assert engine.render("cv_forward", "en", {})["subject"] == "cv_forward – OCEANIX Galicia S.A."
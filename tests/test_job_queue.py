@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from job_queue import JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING, JobQueue, JobWorkerPool
+
+
+def _expire_lease(queue: JobQueue, job_id: str) -> None:
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE job_id = ?", (time.time() - 1, job_id))
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=3)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+
+    first = queue.claim("w1")
+    assert first.job_id == job_id and first.attempts == 1
+    assert queue.claim("w2") is None  # lease still valid
+
+    _expire_lease(queue, job_id)
+    second = queue.claim("w2")
+    assert second.job_id == job_id and second.attempts == 2
+
+
+def test_crashing_job_fails_after_max_attempts(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=2)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+
+    for worker in ("w1", "w2"):
+        assert queue.claim(worker).job_id == job_id
+        _expire_lease(queue, job_id)  # the worker dies without calling fail()
+
+    assert queue.claim("w3") is None
+    job = queue.get(job_id)
+    assert job.status == JOB_FAILED
+    assert job.attempts == 2
+
+
+def test_stale_worker_cannot_overwrite_reclaimed_job(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=3)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+
+    queue.claim("w1")
+    _expire_lease(queue, job_id)
+    queue.claim("w2")
+
+    assert queue.complete(job_id, "w1", {"by": "w1"}) is False
+    assert queue.fail(job_id, "w1", "boom") == JOB_RUNNING
+    assert queue.complete(job_id, "w2", {"by": "w2"}) is True
+
+    job = queue.get(job_id)
+    assert job.status == JOB_DONE
+    assert job.result == {"by": "w2"}
+
+
+def test_stale_worker_cannot_cancel_reclaimed_job(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=3)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+    queue.claim("w1")
+    _expire_lease(queue, job_id)
+    queue.claim("w2")
+
+    assert not queue.mark_cancelled(job_id, "w1")
+    assert queue.get(job_id).status == JOB_RUNNING
+    assert queue.mark_cancelled(job_id, "w2", {"usage": {"total_tokens": 10}})
+    assert queue.get(job_id).status == JOB_CANCELLED
+
+
+def test_failed_attempt_is_retried_until_limit(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=2)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") == JOB_PENDING
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") == JOB_FAILED
+    assert queue.claim("w1") is None
+
+
+def test_no_retry_errors_fail_the_job_on_first_attempt(tmp_path):
+    class Exhausted(Exception):
+        pass
+
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=3)
+    job_id = queue.enqueue({"input_as_text": "hola"})
+    attempts = []
+
+    async def handler(job):
+        attempts.append(job.attempts)
+        raise Exhausted("rate limited")
+
+    async def main():
+        pool = JobWorkerPool(queue, handler, concurrency=1, poll_interval=0.01, no_retry=(Exhausted,))
+        await pool.start()
+        await asyncio.sleep(0.2)
+        await pool.stop()
+
+    asyncio.run(main())
+    assert attempts == [1]
+    assert queue.get(job_id).status == JOB_FAILED
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from latency import AgentCallPolicy, AgentTimeoutError, LatencyTracker, call_with_policy
+
+
+def test_budget_share_triggers_hedge_instead_of_failing():
+    policy = AgentCallPolicy(timeout_s=None, budget_share=0.2, hedge=True)
+    tracker = LatencyTracker()
+    resolved, losers = [], []
+    calls = []
+
+    async def call():
+        calls.append("primary")
+        await asyncio.sleep(0.3)
+        return "primary"
+
+    async def hedge_call():
+        calls.append("hedge")
+        await asyncio.sleep(0.01)
+        return "hedge"
+
+    async def on_resolved(hedge_won):
+        resolved.append(hedge_won)
+
+    async def main():
+        result = await call_with_policy(
+            "Slow", call, policy=policy, deadline=time.monotonic() + 0.5, tracker=tracker,
+            hedge_call=hedge_call, on_resolved=on_resolved, on_loser_result=losers.append,
+        )
+        await asyncio.sleep(0.35)  # the losing primary finishes in the background
+        return result
+
+    assert asyncio.run(main()) == "hedge"
+    assert calls == ["primary", "hedge"]
+    assert resolved == [True]
+    assert losers == ["primary"]
+    stats = tracker.stats_for("Slow")
+    assert stats.hedges_fired == 1 and stats.hedges_won == 1
+    assert stats.timeouts == 0
+
+
+def test_deadline_timeout_is_recorded_as_sample():
+    policy = AgentCallPolicy(timeout_s=None, budget_share=1.0)
+    tracker = LatencyTracker()
+
+    async def call():
+        await asyncio.sleep(1)
+
+    async def main():
+        await call_with_policy("Stuck", call, policy=policy, deadline=time.monotonic() + 0.05, tracker=tracker)
+
+    try:
+        asyncio.run(main())
+    except AgentTimeoutError as e:
+        assert e.deadline_bound
+    else:
+        raise AssertionError("expected AgentTimeoutError")
+    stats = tracker.stats_for("Stuck")
+    assert stats.timeouts == 1
+    assert len(stats.samples) == 1 and stats.samples[0] >= 0.04
+
+
+def test_default_policy_does_not_hedge():
+    tracker = LatencyTracker()
+    calls = []
+
+    async def call():
+        calls.append("primary")
+        await asyncio.sleep(0.05)
+        return "primary"
+
+    async def main():
+        return await call_with_policy("Plain", call, deadline=time.monotonic() + 0.1, tracker=tracker)
+
+    assert asyncio.run(main()) == "primary"
+    assert calls == ["primary"]
+    assert tracker.stats_for("Plain").hedges_fired == 0
@@ -0,0 +1,52 @@
+from lead_index import LeadIndex, company_key, email_domain
+
+
+def _lead(company, email, name="Ana Castro", score=60):
+    return {
+        "company": company,
+        "contact_name": name,
+        "contact_email": email,
+        "title": "Compras",
+        "lead_score": score,
+        "priority": "high" if score >= 70 else "medium",
+        "product_interest": ["reparación naval"],
+        "intent_summary": "Solicita presupuesto",
+    }
+
+
+def test_company_key_ignores_legal_form_and_accents():
+    assert company_key("Astilleros Gallegos, S.A.") == company_key("ASTILLEROS GALLEGOS SL") == "astilleros gallegos"
+
+
+def test_repeat_leads_merge_into_one_account(tmp_path):
+    index = LeadIndex(tmp_path / "leads.sqlite3")
+
+    first = index.record("default", _lead("Naviera Atlántica S.L.", "ana@navatlantica.es"))
+    by_domain = index.record("default", _lead("NavAtlántica", "luis@navatlantica.es", name="Luis Mora", score=80))
+    by_name = index.record("default", _lead("Naviera Atlantica", "compras@gmail.com", name="Eva Rey"))
+    other = index.record("default", _lead("Pesquera del Norte S.A.", "info@pesqueranorte.com"))
+
+    assert (first["repeat"], first["matched_by"]) == (False, "new")
+    assert (by_domain["repeat"], by_domain["matched_by"]) == (True, "domain")
+    assert (by_name["repeat"], by_name["matched_by"]) == (True, "name")
+    assert by_name["account_id"] == first["account_id"] != other["account_id"]
+    assert by_name["leads"] == 3
+    assert by_name["best_score"] == 80
+    assert {c["name"] for c in by_name["contacts"]} == {"Ana Castro", "Luis Mora", "Eva Rey"}
+
+
+def test_accounts_are_visible_to_other_processes_and_tenants_are_isolated(tmp_path):
+    writer = LeadIndex(tmp_path / "leads.sqlite3")
+    reader = LeadIndex(tmp_path / "leads.sqlite3")
+    writer.record("default", _lead("Naviera Atlántica S.L.", "ana@navatlantica.es"))
+
+    assert [a["name"] for a in reader.search("default", "navatlantica.es")] == ["Naviera Atlántica S.L."]
+    assert reader.search("filial", "Naviera Atlántica") == []
+    assert writer.record("filial", _lead("Naviera Atlántica S.L.", "ana@navatlantica.es"))["repeat"] is False
+
+
+def test_email_domain_needs_a_full_address():
+    assert email_domain("Compras@Www.Conservas-Rias.es ") == "conservas-rias.es"
+    assert email_domain("conservas-rias.es") is None
+    assert email_domain("@conservas-rias.es") is None
+    assert email_domain("ana@gmail.com") is None
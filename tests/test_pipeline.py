@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from pipeline import SKIPPED, Node, NodeCache, Pipeline, PipelineError, PipelineExecutor
+
+
+def _node(name, value=None, inputs=(), delay=0.0, log=None, **kwargs):
+    async def run(values, state):
+        if log is not None:
+            log.append(("start", name))
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(("end", name))
+        return value if value is not None else name
+    return Node(name, run, inputs=inputs, **kwargs)
+
+
+def test_independent_nodes_run_concurrently_and_skips_propagate():
+    log = []
+    pipeline = Pipeline("demo", [
+        _node("a", delay=0.02, log=log),
+        _node("b", delay=0.02, log=log),
+        _node("join", inputs=("a", "b")),
+        _node("never", inputs=("a",), when=lambda v: False),
+        _node("after_never", inputs=("never",)),
+    ], outputs=("after_never", "join"))
+
+    values = asyncio.run(PipelineExecutor().execute(pipeline, state=None))
+
+    assert log[:2] == [("start", "a"), ("start", "b")]
+    assert values["never"] is SKIPPED and values["after_never"] is SKIPPED
+    assert pipeline.result(values) == "join"
+
+
+def test_speculative_node_is_cancelled_when_condition_is_false():
+    log = []
+    pipeline = Pipeline("spec", [
+        _node("decide", value=False, delay=0.01),
+        _node("draft", delay=0.5, log=log, after=("decide",), when=lambda v: v["decide"], speculative=True),
+        _node("done", inputs=("decide",)),
+    ], outputs=("draft", "done"))
+    outcomes = []
+
+    async def on_speculation(node, used, state):
+        outcomes.append((node.name, used))
+
+    values = asyncio.run(PipelineExecutor(on_speculation=on_speculation).execute(pipeline, state=None))
+
+    assert log == [("start", "draft")]  # Started early, never finished
+    assert values["draft"] is SKIPPED
+    assert outcomes == [("draft", False)]
+
+
+def test_cached_node_and_retries():
+    calls = []
+
+    async def flaky(values, state):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return "ok"
+
+    pipeline = Pipeline("retry", [
+        Node("flaky", flaky, retries=1, cache_key=lambda v, s: "flaky-key"),
+    ], outputs=("flaky",))
+    executor = PipelineExecutor(cache=NodeCache(), retry_backoff=0)
+
+    assert asyncio.run(executor.execute(pipeline, None))["flaky"] == "ok"
+    assert asyncio.run(executor.execute(pipeline, None))["flaky"] == "ok"
+    assert len(calls) == 2  # One retry, then served from the cache
+    assert executor.cache.snapshot()["hits"] == 1
+
+
+def test_invalid_definitions_are_rejected():
+    with pytest.raises(PipelineError, match="cycle"):
+        Pipeline("loop", [_node("a", inputs=("b",)), _node("b", inputs=("a",))], outputs=("a",))
+    with pytest.raises(PipelineError, match="unknown node"):
+        Pipeline("dangling", [_node("a", inputs=("missing",))], outputs=("a",))
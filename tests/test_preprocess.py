@@ -0,0 +1,54 @@
+from preprocess import GAP_MARKER, InputViews, PreprocessStats, clean_text, count_tokens
+
+POLICY = {"enabled": True, "classifier_tokens": 60, "extractor_tokens": 200, "chunk_tokens": 50}
+
+MESSAGE = """Asunto: Pedido mensual de merluza
+
+Buenos días,
+
+Queremos un presupuesto para 20 toneladas mensuales de merluza con certificación MSC.
+
+Enviado desde mi iPhone
+
+--
+Carmen Vidal
+Directora de Compras
++34 981 000 111
+
+El 3 de marzo de 2026, Ventas escribió:
+> Gracias por su interés
+> Un saludo
+"""
+
+
+def test_clean_text_strips_history_footers_and_splits_signature():
+    clean = clean_text(MESSAGE)
+
+    assert clean.subject == "Pedido mensual de merluza"
+    assert "20 toneladas" in clean.body
+    assert "iPhone" not in clean.body and "Gracias por su interés" not in clean.body
+    assert clean.signature.startswith("Carmen Vidal")
+    assert "escribió" not in clean.signature
+
+
+def test_long_message_views_fit_their_budget_and_keep_relevant_chunks():
+    filler = "\n\n".join(f"Párrafo {i} sobre la historia de la empresa y sus valores." for i in range(60))
+    text = MESSAGE.replace("Enviado desde mi iPhone", filler + "\n\nNecesitamos el precio por kg y el plazo de entrega.")
+    stats = PreprocessStats()
+    views = InputViews(text, POLICY, stats)
+
+    classifier = views.view("classifier")
+    sales = views.view("sales")
+
+    assert classifier.startswith("Asunto: Pedido mensual de merluza")
+    assert count_tokens(classifier) <= POLICY["classifier_tokens"] + 20
+    assert count_tokens(sales) <= POLICY["extractor_tokens"] + 10
+    assert "20 toneladas" in sales and "precio por kg" in sales and GAP_MARKER in sales
+    assert sales.rstrip().endswith("+34 981 000 111")  # Signature kept
+    assert stats.snapshot()["sales"]["truncated"] == 1
+    assert views.view("sales") is sales  # Built once per stage
+
+
+def test_disabled_policy_sends_the_full_text():
+    views = InputViews(MESSAGE, {**POLICY, "enabled": False})
+    assert views.view("classifier") == views.view("cv") == MESSAGE
@@ -0,0 +1,34 @@
+import pytest
+
+from replay import NotReplayable, RecordedCalls, is_multimodal
+from shared_store import hash_payload
+
+
+def _run(classifier_input: str, input_hash: str) -> dict:
+    return {
+        "input_hash": input_hash,
+        "agents": [{
+            "agent": "Guardrails", "status": "ok", "input": classifier_input,
+            "output": {"safe_text": "..."}, "prompt_hash": "old",
+        }],
+    }
+
+
+def test_text_run_is_recomputed_when_classifier_prompt_changes():
+    run = _run("Hola, adjunto mi CV", hash_payload("Hola, adjunto mi CV", []))
+    assert not is_multimodal(run, run["agents"][0])
+    calls = RecordedCalls(run, multimodal=False)
+    assert calls.lookup("Guardrails", "new", "Hola, adjunto mi CV") is None
+    assert calls.stages == [{"agent": "Guardrails", "action": "recomputed", "reason": "prompt_changed"}]
+
+
+def test_multimodal_run_is_not_replayable_when_classifier_prompt_changes():
+    summary = "[user] [file: cv.pdf]"
+    run = _run(summary, hash_payload("", [{"role": "user", "content": []}]))
+    assert is_multimodal(run, run["agents"][0])
+    calls = RecordedCalls(run, multimodal=True)
+    # Same prompt: the recorded classifier output is still valid
+    run["agents"][0]["prompt_hash"] = "same"
+    assert calls.lookup("Guardrails", "same", summary) == {"safe_text": "..."}
+    with pytest.raises(NotReplayable):
+        calls.lookup("Guardrails", "new", summary)
@@ -0,0 +1,122 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from config_store import TenantRegistry
+from cv_index import CVIndex, CVRecord, HashingEmbedder
+from reverse_match import (
+    CandidatePool, ShortlistStore, VacancyWatcher, latest_per_candidate, score_candidates, shortlist,
+)
+
+BASE_CONFIG = Path(__file__).resolve().parent.parent / "config" / "router_config.json"
+
+CONFIG = {
+    "CV_POLICY": {
+        "matching_weights": {"skills_overlap": 40, "experience_match": 30, "certifications_bonus": 20, "language_bonus": 10},
+        "experience_bonus_rules": {"meets_minimum": 10, "exceeds_by_1_year": 5, "exceeds_by_2_years": 10, "exceeds_by_5_years": 15},
+        "certifications_boost": {"sector_required": 20},
+    },
+    "THRESHOLDS": {"FIT_OK": 70},
+    "LANG_POLICY": {"default_reply": "es"},
+}
+
+VACANCY = {
+    "role_id": "FLOTA-CAP-01",
+    "skills_req": ["navegacion", "gestion_tripulacion"],
+    "min_exp": 5,
+    "certifications_req": ["Certificado STCW"],
+}
+
+
+def _record(record_id: int, email: str, years: int, skills, certifications=(), route="hr_cv_reject") -> CVRecord:
+    cv = {
+        "full_name": email.split("@")[0],
+        "email": email,
+        "years_experience": years,
+        "skills": list(skills),
+        "certifications": list(certifications),
+    }
+    return CVRecord(record_id, "default", float(record_id), cv, final_route=route)
+
+
+FULL = _record(1, "ana@example.com", 12, ["Navegación", "Gestión de tripulación"], ["Certificado STCW"])
+PARTIAL = _record(2, "bruno@example.com", 6, ["navegación"])
+JUNIOR = _record(3, "carla@example.com", 4, ["navegacion", "gestión tripulación"])
+
+
+def test_scores_follow_the_cv_policy():
+    scores = score_candidates(CandidatePool.from_records([FULL, PARTIAL, JUNIOR]), [VACANCY], CONFIG)
+
+    # skills: share of required skills x 40 (accents and stopwords do not matter)
+    assert scores["skills"][:, 0].tolist() == [40, 20, 40]
+    # experience: meets_minimum + largest exceeds_by_N bonus reached; nothing below min_exp
+    assert scores["experience"][:, 0].tolist() == [25, 15, 0]
+    assert scores["certifications"][:, 0].tolist() == [20, 0, 0]
+    assert scores["language"][:, 0].tolist() == [10, 10, 10]
+    assert scores["total"][:, 0].tolist() == [95, 45, 50]
+
+
+def test_experience_and_certification_points_are_capped_by_their_weights():
+    config = json.loads(json.dumps(CONFIG))
+    config["CV_POLICY"]["experience_bonus_rules"]["meets_minimum"] = 25
+    config["CV_POLICY"]["certifications_boost"]["sector_required"] = 35
+
+    scores = score_candidates(CandidatePool.from_records([FULL]), [VACANCY], config, language="en")
+
+    assert scores["experience"][0, 0] == 30  # 25 + 15, capped at experience_match
+    assert scores["certifications"][0, 0] == 20  # 35, capped at certifications_bonus
+    assert scores["language"][0, 0] == pytest.approx(7)
+    assert scores["total"][0, 0] == 97
+
+
+def test_latest_record_per_email_wins():
+    resubmitted = _record(4, "Bruno@Example.com ", 9, ["navegacion"], route="hr_cv_forward")
+    anonymous = [_record(5, "", 3, []), _record(6, "", 3, [])]
+
+    latest = latest_per_candidate([FULL, PARTIAL, resubmitted, *anonymous])
+
+    assert [record.record_id for record in latest] == [1, 4, 5, 6]
+
+
+def test_shortlist_filters_by_previous_route_and_min_score():
+    forwarded = _record(7, "dario@example.com", 10, ["navegacion", "gestion tripulacion"], ["Certificado STCW"], route="hr_cv_forward")
+    records = [FULL, PARTIAL, JUNIOR, forwarded]
+
+    rejected_only = shortlist(records, [VACANCY], CONFIG)["FLOTA-CAP-01"]
+    assert [c["record_id"] for c in rejected_only] == [1]  # 45 and 50 are below FIT_OK
+    assert rejected_only[0]["matched_skills"] == ["gestion_tripulacion", "navegacion"]
+
+    every_route = shortlist(records, [VACANCY], CONFIG, routes=None, min_score=40)["FLOTA-CAP-01"]
+    # Same score: more experience first
+    assert [(c["record_id"], c["match_score"]) for c in every_route] == [(1, 95), (7, 95), (3, 50), (2, 45)]
+
+
+def test_new_vacancy_on_reload_triggers_a_shortlist_job(tmp_path):
+    config_path = tmp_path / "router_config.json"
+    shutil.copy(BASE_CONFIG, config_path)
+    tenants = tmp_path / "tenants"
+    tenants.mkdir()
+    registry = TenantRegistry(config_path, tenants, poll_interval=60)
+    store = ShortlistStore(tmp_path / "cv.sqlite3")
+    index = CVIndex(tmp_path / "cv.sqlite3", embedder=HashingEmbedder())
+    index.add("default", FULL.cv, final_route="hr_cv_reject")
+    index.add("default", PARTIAL.cv, final_route="hr_cv_reject")
+    watcher = VacancyWatcher(registry, store)
+
+    data = json.loads(config_path.read_text(encoding="utf-8"))
+    data["VACANTES"].append({**VACANCY, "role_id": "FLOTA-NAV-09", "dept": "Flota Pesquera", "title": "Patrón"})
+    config_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    assert registry.get().reload(force=True)
+
+    deadline = time.monotonic() + 5
+    while watcher.jobs == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert watcher.last_job["role_ids"] == ["FLOTA-NAV-09"]  # Existing vacancies are not re-matched
+    saved = store.get("default", "FLOTA-NAV-09")
+    assert saved["scanned"] == 2
+    assert [c["email"] for c in saved["candidates"]] == ["ana@example.com"]
+    assert saved["candidates"][0]["match_score"] == 95
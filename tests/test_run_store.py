@@ -0,0 +1,44 @@
+import time
+
+from run_store import RunStore
+
+
+def _record(run_id: str, status: str, created_at: float, agents, final_route=None) -> dict:
+    return {
+        "run_id": run_id,
+        "created_at": created_at,
+        "status": status,
+        "final_route": final_route,
+        "agents": [{"agent": name, "status": "ok", "total_tokens": 10} for name in agents],
+    }
+
+
+def test_retry_keeps_both_attempts_and_get_returns_the_latest(tmp_path):
+    store = RunStore(tmp_path / "runs.db", flush_interval=0.01)
+    now = time.time()
+    store.record(_record("job-1", "error", now, ["Guardrails + Intent"]))
+    store.record(_record("job-1", "ok", now + 1, ["Guardrails + Intent", "CV matcher"], final_route="cv_process"))
+    store.close()
+
+    run = store.get("job-1")
+    assert run["status"] == "ok" and run["final_route"] == "cv_process"
+    assert [(agent["seq"], agent["agent"]) for agent in run["agents"]] == [
+        (0, "Guardrails + Intent"), (1, "CV matcher"),
+    ]
+
+    attempts = list(store.iter_runs())
+    assert [attempt["status"] for attempt in attempts] == ["error", "ok"]
+    assert [len(attempt["agents"]) for attempt in attempts] == [1, 2]
+    assert store.stats()["totals"]["runs"] == 2
+
+
+def test_cached_hit_is_recorded_without_hiding_the_original_steps(tmp_path):
+    store = RunStore(tmp_path / "runs.db", flush_interval=0.01)
+    now = time.time()
+    store.record(_record("job-2", "ok", now, ["Guardrails + Intent"], final_route="lead_capture"))
+    store.record(_record("job-2", "cached", now + 1, [], final_route="lead_capture"))
+    store.close()
+
+    assert store.get("job-2")["status"] == "cached"
+    original = next(run for run in store.iter_runs() if run["status"] == "ok")
+    assert [agent["agent"] for agent in original["agents"]] == ["Guardrails + Intent"]
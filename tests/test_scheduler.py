@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from scheduler import AIMDWindow, OutboundScheduler, TokenBucket
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_waiters_are_served_by_priority_lane_then_fifo():
+    scheduler = OutboundScheduler(model_limits={}, window=AIMDWindow(initial=1, maximum=1))
+    order = []
+
+    async def call(name, priority, started):
+        async with scheduler.slot("gpt-5-mini", priority):
+            started.set()
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        first = asyncio.Event()
+        blocker = asyncio.create_task(call("blocker", "interactive", first))
+        await first.wait()
+        # Queued while the only slot is taken, in reverse priority order
+        tasks = [
+            asyncio.create_task(call(name, priority, asyncio.Event()))
+            for name, priority in [("bg", "background"), ("batch-1", "batch"), ("ui", "interactive"), ("batch-2", "batch")]
+        ]
+        await asyncio.gather(blocker, *tasks)
+
+    asyncio.run(main())
+    assert order == ["blocker", "ui", "batch-1", "batch-2", "bg"]
+
+
+def test_rate_limit_shrinks_the_window_and_success_grows_it():
+    scheduler = OutboundScheduler(model_limits={}, window=AIMDWindow(initial=10, decrease_factor=0.5))
+
+    async def main():
+        with pytest.raises(RateLimitError):
+            async with scheduler.slot("gpt-5-mini"):
+                raise RateLimitError()
+        assert scheduler.window.limit == 5
+        async with scheduler.slot("gpt-5-mini"):
+            pass
+
+    asyncio.run(main())
+    assert scheduler.window.limit == pytest.approx(5.2)
+    assert scheduler.stats.rate_limited == 1
+    assert scheduler.stats.completed == 1
+
+
+def test_token_bucket_is_corrected_with_real_usage():
+    bucket = TokenBucket(capacity=1000, rate=0.0001)
+    bucket.consume(600)  # Estimate
+    assert bucket.wait_time(600) > 0
+    bucket.adjust(200 - 600)  # The call used 200 tokens
+    assert bucket.wait_time(600) == 0
+
+
+def test_slow_calls_do_not_shrink_the_window():
+    scheduler = OutboundScheduler(model_limits={}, window=AIMDWindow(initial=4))
+
+    async def main():
+        async with scheduler.slot("gpt-5-mini"):
+            await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert scheduler.window.limit == pytest.approx(4.25)
+
+
+def test_overload_shrinks_the_window_without_counting_as_rate_limit():
+    class OverloadedError(Exception):
+        status_code = 529
+
+    scheduler = OutboundScheduler(model_limits={}, window=AIMDWindow(initial=10, decrease_factor=0.5))
+
+    async def main():
+        with pytest.raises(OverloadedError):
+            async with scheduler.slot("gpt-5-mini"):
+                raise OverloadedError()
+
+    asyncio.run(main())
+    assert scheduler.window.limit == 5
+    assert scheduler.stats.rate_limited == 0
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from shared_store import EventFanout, SharedStore
+
+
+def test_cache_written_by_one_process_is_read_by_another(tmp_path):
+    writer = SharedStore(tmp_path / "shared.db")
+    reader = SharedStore(tmp_path / "shared.db")
+
+    writer.cache_set("job-1", {"final_route": "lead_capture"})
+    writer.cache_set("job-2", {"final_route": "other"}, ttl=-1)
+
+    assert reader.cache_get("job-1") == {"final_route": "lead_capture"}
+    assert reader.cache_get("job-2") is None  # Expired
+    assert reader.cache_get("job-3") is None
+
+
+def test_events_fan_out_to_other_processes_once(tmp_path):
+    first = EventFanout(SharedStore(tmp_path / "shared.db"), poll_interval=0.01)
+    second = EventFanout(SharedStore(tmp_path / "shared.db"), poll_interval=0.01)
+    received = {"first": [], "second": []}
+
+    async def main():
+        for name, fanout in (("first", first), ("second", second)):
+            async def handler(message, name=name):
+                received[name].append(message)
+            fanout.subscribe("job", handler)
+        SharedStore(tmp_path / "shared.db").publish("job", {"job_id": "old"})  # Before start: not replayed
+        await first.start()
+        await second.start()
+        try:
+            await first.publish("job", {"job_id": "a"})
+            await second.publish("job", {"job_id": "b"})
+            deadline = time.monotonic() + 2
+            while (len(received["first"]) < 2 or len(received["second"]) < 2) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+        finally:
+            await first.stop()
+            await second.stop()
+
+    asyncio.run(main())
+    # Local handlers run at once, the other process replays from the shared log; nobody sees an event twice
+    assert received["first"] == [{"job_id": "a"}, {"job_id": "b"}]
+    assert received["second"] == [{"job_id": "b"}, {"job_id": "a"}]